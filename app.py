@@ -1,7 +1,14 @@
+import importlib
+
 import streamlit as st
-import os
-import database_config as db_con
-import chatbot as cb
+
+# Page -> module with its run(). Pages are imported when first opened, so
+# opening DB Config does not load LangChain, LangGraph and the Gemini client.
+PAGES = {
+    'DB Config': 'database_config',
+    'Query Builder Assistant': 'chatbot',
+    'Query Performance': 'query_dashboard',
+}
 
 st.set_page_config(
     page_title='Database Builder Assistant',
@@ -9,10 +16,10 @@ st.set_page_config(
     initial_sidebar_state='expanded'
 )
 
-page = st.sidebar.selectbox('Choses Page:', ('DB Config', 'Query Builder Assistant'))
-
-if page == 'DB Config':
-    db_con.run()
-else:
-    cb.run()
+# ?page=... opens a page directly
+requested = st.query_params.get('page')
+page = st.sidebar.selectbox(
+    'Choses Page:', list(PAGES), index=list(PAGES).index(requested) if requested in PAGES else 0
+)
 
+importlib.import_module(PAGES[page]).run()
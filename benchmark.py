@@ -0,0 +1,935 @@
+"""
+Offline benchmark suite for the database tools.
+
+Generates synthetic CSVs and databases at several scales and measures the
+hot paths of the app, by case:
+
+* ingest: CSV import (create_table)
+* query: agent-style queries (execute_sql_query)
+* schema, listing: schema introspection and database listing
+* browse: table browsing
+* columnar: columnar fetch into a DataFrame
+* export: file export
+* fulltext: full-text search
+* summaries: summary tables
+* stress: many sessions sharing one database
+* startup: the cold start of every page of the app
+
+Every case runs in its own process so its peak RSS can be reported.
+Results are written as JSON; compare two runs to catch regressions:
+
+    python benchmark.py run --scale small --out results.json
+    python benchmark.py compare baseline.json results.json
+
+Nothing is downloaded and no API key is needed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WORKDIR = os.path.join(tempfile.gettempdir(), "dbassist-bench")
+
+# Pages of app.py timed by the startup case
+STARTUP_PAGES = ["DB Config", "Query Builder Assistant", "Query Performance"]
+# Page -> module it lives in
+PAGE_MODULES = {"DB Config": "database_config", "Query Builder Assistant": "chatbot", "Query Performance": "query_dashboard"}
+
+# Sizes covered by each scale; "rows" drives ingest/query/browse, "tables"
+# the schema cases, "files" the listing cases, "sessions" the stress case
+# and "page" the startup case
+SCALES = {
+    "smoke": {"rows": [10_000], "tables": [1, 10], "files": [1, 10], "sessions": [4], "page": STARTUP_PAGES},
+    "small": {
+        "rows": [10_000, 100_000], "tables": [1, 50], "files": [1, 100], "sessions": [4, 16], "page": STARTUP_PAGES,
+    },
+    "medium": {
+        "rows": [10_000, 1_000_000], "tables": [1, 100, 500], "files": [1, 100, 1000], "sessions": [4, 16, 64],
+        "page": STARTUP_PAGES,
+    },
+    "large": {
+        "rows": [10_000, 1_000_000, 10_000_000], "tables": [1, 100, 500], "files": [1, 100, 1000],
+        "sessions": [4, 16, 64], "page": STARTUP_PAGES,
+    },
+}
+
+# Seconds the stress case runs its sessions, and the rows of the table they share
+STRESS_SECONDS = 5.0
+STRESS_ROWS = 10_000
+# Share of each operation in a stress session; the rest are reads
+STRESS_MIX = {"browse": 0.2, "write": 0.1, "import": 0.02}
+
+# Typical shapes of agent-generated SQL against the synthetic sales table
+QUERY_SHAPES = {
+    "point_lookup": "SELECT * FROM sales WHERE id = {id}",
+    "filter_aggregate": (
+        "SELECT region, COUNT(*) AS orders, SUM(quantity * price) AS revenue "
+        "FROM sales WHERE order_date >= '{date}' GROUP BY region"
+    ),
+    "top_n": "SELECT product, SUM(quantity) AS qty FROM sales GROUP BY product ORDER BY qty DESC LIMIT 10",
+    "join_aggregate": (
+        "SELECT c.segment, COUNT(*) AS orders FROM sales AS s "
+        "JOIN customers AS c ON s.customer_id = c.customer_id "
+        "WHERE s.region = '{region}' GROUP BY c.segment"
+    ),
+    "distinct_count": "SELECT COUNT(DISTINCT customer_id) FROM sales WHERE region = '{region}'",
+    "raw_rows": "SELECT * FROM sales WHERE price > {price}",
+}
+
+# Regression threshold used by "compare" (fraction of the baseline value)
+REGRESSION_THRESHOLD = 0.10
+# Smaller absolute changes are treated as timer/allocator noise
+NOISE_FLOOR = {"_ms": 0.5, "_s": 0.05, "_mb": 5.0}
+
+REGIONS = ["North", "South", "East", "West", "Central"]
+SEGMENTS = ["Consumer", "Corporate", "Home Office", "Small Business"]
+_WORDS = "fast slow red blue large small premium basic gift bulk repeat online store promo late early".split()
+
+CSV_CHUNK_ROWS = 500_000
+
+
+# --- synthetic data -------------------------------------------------------
+
+def _customer_count(rows: int) -> int:
+    return max(1_000, rows // 20)
+
+
+def generate_sales_csv(path: str, rows: int, seed: int = 0) -> str:
+    """
+    Write a deterministic sales CSV with ``rows`` rows, unless it exists
+    """
+    if os.path.exists(path):
+        return path
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    customers = _customer_count(rows)
+    notes = np.array([" ".join(rng.choice(_WORDS, size=3)) for _ in range(256)])
+    base_date = np.datetime64("2022-01-01")
+    tmp = path + ".part"
+    with open(tmp, "w", newline="") as f:
+        for start in range(0, rows, CSV_CHUNK_ROWS):
+            n = min(CSV_CHUNK_ROWS, rows - start)
+            dates = base_date + rng.integers(0, 3 * 365, size=n).astype("timedelta64[D]")
+            chunk = pd.DataFrame({
+                "id": np.arange(start, start + n),
+                "customer_id": rng.integers(0, customers, size=n),
+                "region": rng.choice(REGIONS, size=n),
+                "product": np.char.add("P", rng.integers(0, 500, size=n).astype(str)),
+                "quantity": rng.integers(1, 20, size=n),
+                "price": np.round(rng.uniform(1, 500, size=n), 2),
+                "order_date": np.datetime_as_string(dates, unit="D"),
+                "note": rng.choice(notes, size=n),
+            })
+            chunk.to_csv(f, header=start == 0, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def generate_customers_csv(path: str, rows: int, seed: int = 0) -> str:
+    if os.path.exists(path):
+        return path
+    rnd = random.Random(seed)
+    tmp = path + ".part"
+    with open(tmp, "w") as f:
+        f.write("customer_id,name,segment,region\n")
+        for i in range(_customer_count(rows)):
+            f.write(f"{i},Customer {i},{rnd.choice(SEGMENTS)},{rnd.choice(REGIONS)}\n")
+    os.replace(tmp, path)
+    return path
+
+
+def generate_schema_db(path: str, tables: int, seed: int = 0) -> str:
+    """
+    Database with ``tables`` small tables of eight mixed-type columns
+    """
+    if os.path.exists(path):
+        return path
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path + ".part")
+    for t in range(tables):
+        conn.execute(
+            f"CREATE TABLE table_{t} (id INTEGER, name TEXT, category TEXT, amount REAL, "
+            f"quantity INTEGER, created TEXT, flag INTEGER, comment TEXT)"
+        )
+        conn.executemany(
+            f"INSERT INTO table_{t} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (i, f"name {i}", rnd.choice(SEGMENTS), rnd.random() * 100, rnd.randrange(100),
+                 f"2024-01-{1 + i % 28:02d}", i % 2, rnd.choice(_WORDS))
+                for i in range(50)
+            ],
+        )
+    conn.commit()
+    conn.close()
+    os.replace(path + ".part", path)
+    return path
+
+
+def generate_db_folder(folder: str, files: int, seed: int = 0) -> str:
+    """
+    Folder with ``files`` small .db files of one table each
+    """
+    marker = os.path.join(folder, ".complete")
+    if os.path.exists(marker):
+        return folder
+    os.makedirs(folder, exist_ok=True)
+    for i in range(files):
+        conn = sqlite3.connect(os.path.join(folder, f"db_{i:04d}.db"))
+        conn.execute("CREATE TABLE IF NOT EXISTS items (id INTEGER, name TEXT)")
+        conn.executemany("INSERT INTO items VALUES (?, ?)", [(j, f"item {j}") for j in range(20)])
+        conn.commit()
+        conn.close()
+    open(marker, "w").close()
+    return folder
+
+
+# --- measurement helpers --------------------------------------------------
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of this process in MB, if the platform reports it
+    """
+    # ru_maxrss survives exec on Linux, so a child would report the runner's
+    # peak; VmHWM belongs to the current address space only
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    """
+    Percentiles of a list of durations in seconds, reported in ms
+    """
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))] * 1000
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(pct(0.50), 3),
+        "p95_ms": round(pct(0.95), 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+# --- cases (run inside a child process, with cwd = workdir) ----------------
+
+def bench_ingest(params: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    from db_tools import create_table
+
+    rows = params["rows"]
+    csv_path = os.path.join("data", f"sales_{rows}.csv")
+    db_name = f"ingest_{rows}.db"
+    if os.path.exists(os.path.join("db", db_name)):
+        os.remove(os.path.join("db", db_name))
+    start = time.perf_counter()
+    stats = create_table(db_name, csv_path, "sales")
+    elapsed = time.perf_counter() - start
+    create_table(db_name, os.path.join("data", f"customers_{rows}.csv"), "customers")
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed),
+        "mb_per_sec": round(stats["total_bytes"] / elapsed / 1024 / 1024, 2),
+        # Recent commits may still be in the WAL
+        "db_mb": round(sum(
+            os.path.getsize(p) for p in (os.path.join("db", db_name), os.path.join("db", db_name + "-wal"))
+            if os.path.exists(p)
+        ) / 1024 / 1024, 2),
+    }
+
+
+def bench_query(params: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    from db_tools import QUERY_PAGE_ROWS, execute_sql_query
+
+    rows = params["rows"]
+    db_name = f"ingest_{rows}.db"
+    rnd = random.Random(0)
+    metrics: Dict[str, Any] = {}
+    for shape, template in QUERY_SHAPES.items():
+        def run_once():
+            query = template.format(
+                id=rnd.randrange(rows),
+                date=f"2024-{rnd.randrange(1, 13):02d}-01",
+                region=rnd.choice(REGIONS),
+                price=rnd.randrange(400, 500),
+            )
+            result = execute_sql_query(query, db_name, max_rows=QUERY_PAGE_ROWS)
+            if result and "error" in result[0]:
+                raise RuntimeError(result[0]["error"])
+
+        run_once()  # warm the page cache
+        metrics[shape] = latency_stats(timed(run_once, repeat))
+    return metrics
+
+
+def bench_schema(params: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    from db_tools import get_database_info, get_schema_context, get_table_schema
+    from schema_context import estimate_tokens
+
+    db_name = f"schema_{params['tables']}.db"
+    cold_schema = timed(lambda: get_table_schema(db_name), 1)
+    warm_schema = timed(lambda: get_table_schema(db_name), repeat)
+    cold_info = timed(lambda: get_database_info(db_name), 1)
+    warm_info = timed(lambda: get_database_info(db_name), repeat)
+
+    # What the agent receives: everything, versus the budgeted context
+    question = f"total amount per category in table_{params['tables'] // 2}"
+    cold_context = timed(lambda: get_schema_context(db_name, question), 1)
+    warm_context = timed(lambda: get_schema_context(db_name, question), repeat)
+    return {
+        "get_table_schema_cold_ms": round(cold_schema[0] * 1000, 3),
+        "get_table_schema": latency_stats(warm_schema),
+        "get_database_info_cold_ms": round(cold_info[0] * 1000, 3),
+        "get_database_info": latency_stats(warm_info),
+        "get_schema_context_cold_ms": round(cold_context[0] * 1000, 3),
+        "get_schema_context": latency_stats(warm_context),
+        "full_schema_tokens": estimate_tokens(str(get_database_info(db_name))),
+        "schema_context_tokens": estimate_tokens(get_schema_context(db_name, question)),
+    }
+
+
+def bench_listing(params: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    from db_tools import getAllDB, list_db_files
+
+    folder = os.path.join("listings", f"files_{params['files']}")
+
+    def list_all():
+        getAllDB(folder, list_db_files(folder))
+
+    cold = timed(list_all, 1)
+    return {
+        "getAllDB_cold_ms": round(cold[0] * 1000, 3),
+        "getAllDB": latency_stats(timed(list_all, repeat)),
+    }
+
+
+def bench_browse(params: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    from db_tools import count_table_rows, get_table_page, getDataFromTable, result_cache
+
+    path = os.path.join("db", f"ingest_{params['rows']}.db")
+
+    # Token of a page near the end of the table (tokens do not depend on the page size)
+    step = max(params["rows"] // 20, 1)
+    token = get_table_page(path, "sales", page_size=step * 19, prefetch=False)["next_page_token"]
+
+    def page(page_token):
+        # Uncached, as when the user moves to a page for the first time
+        result_cache.clear()
+        get_table_page(path, "sales", page_token=page_token, prefetch=False)
+
+    def count():
+        result_cache.clear()
+        count_table_rows(path, "sales")
+
+    return {
+        "getDataFromTable": latency_stats(timed(lambda: getDataFromTable(path, "sales"), repeat)),
+        "browse_first_page": latency_stats(timed(lambda: page(None), repeat)),
+        "browse_last_page": latency_stats(timed(lambda: page(token), repeat)),
+        "browse_count": latency_stats(timed(count, repeat)),
+    }
+
+
+def bench_columnar(params: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    """
+    A whole table as a DataFrame through the dict path (execute_sql_query
+    then pd.DataFrame) and through query_frame, with the peak memory
+    allocated by each (tracemalloc)
+    """
+    import tracemalloc
+
+    import pandas as pd
+    from db_tools import execute_sql_query, query_frame
+
+    db_name = f"ingest_{params['rows']}.db"
+    query = "SELECT * FROM sales"
+
+    def dict_path():
+        pd.DataFrame(execute_sql_query(query, db_name))
+
+    def columnar_path():
+        # Unbudgeted, like execute_sql_query
+        query_frame(query, db_name, timeout=None, max_steps=None)
+
+    metrics: Dict[str, Any] = {}
+    for name, fn in (("dict_frame", dict_path), ("columnar_frame", columnar_path)):
+        fn()  # warm the page cache
+        metrics[name] = latency_stats(timed(fn, max(repeat // 5, 1)))
+        tracemalloc.start()
+        fn()
+        metrics[f"{name}_alloc_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+        tracemalloc.stop()
+    return metrics
+
+
+def bench_export(params: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    """
+    Full-table export in every available format; rss_growth_mb is how much
+    the exports raised the peak RSS of the process
+    """
+    from db_tools import export_query_result
+    from export import EXPORT_FORMATS, available_formats
+
+    db_name = f"ingest_{params['rows']}.db"
+    metrics: Dict[str, Any] = {}
+    before = peak_rss_mb()
+    for fmt in available_formats():
+        out = os.path.join("data", f"export_{params['rows']}{EXPORT_FORMATS[fmt][0]}")
+        results = []
+
+        def run_once():
+            result = export_query_result("SELECT * FROM sales", db_name, out, fmt)
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            results.append(result)
+
+        metrics[f"export_{fmt}"] = latency_stats(timed(run_once, max(repeat // 5, 1)))
+        metrics[f"export_{fmt}_rows_per_sec"] = max(r["rows_per_sec"] or 0 for r in results)
+        metrics[f"export_{fmt}_file_mb"] = round(results[-1]["bytes"] / 1e6, 2)
+        os.remove(out)
+    after = peak_rss_mb()
+    if before is not None and after is not None:
+        metrics["rss_growth_mb"] = round(after - before, 1)
+    return metrics
+
+
+def bench_fulltext(params: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    """
+    Building the FTS5 index of the notes column, then finding the rows that
+    mention a word with LIKE '%word%' and through the index: counting every
+    match, and the top rows search_text returns. The index is dropped again
+    so the other cases see the plain table.
+    """
+    from connections import write_connection
+    from db_tools import create_fulltext, execute_sql_query, search_table_text
+    from fulltext import drop_fulltext_index
+
+    rows = params["rows"]
+    db_name = f"ingest_{rows}.db"
+    rnd = random.Random(0)
+    metrics: Dict[str, Any] = {}
+    start = time.perf_counter()
+    result = create_fulltext(db_name, "sales", ["note"])
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    metrics["index_build_s"] = round(time.perf_counter() - start, 3)
+    try:
+        def like_count():
+            execute_sql_query(f"SELECT count(*) FROM sales WHERE note LIKE '%{rnd.choice(_WORDS)}%'", db_name)
+
+        def fts_count():
+            execute_sql_query(f"SELECT count(*) FROM sales__fts WHERE sales__fts MATCH '{rnd.choice(_WORDS)}'", db_name)
+
+        def like_rows():
+            execute_sql_query(f"SELECT * FROM sales WHERE note LIKE '%{rnd.choice(_WORDS)}%' LIMIT 20", db_name)
+
+        def search_rows():
+            search_table_text(db_name, "sales", f"{rnd.choice(_WORDS)} {rnd.choice(_WORDS)}")
+
+        for name, fn in (
+            ("like_count", like_count), ("fts_count", fts_count), ("like_rows", like_rows), ("search_rows", search_rows),
+        ):
+            metrics[name] = latency_stats(timed(fn, repeat))
+    finally:
+        with write_connection("db/" + db_name) as conn:
+            drop_fulltext_index(conn, "sales")
+            conn.commit()
+    return metrics
+
+
+def bench_summaries(params: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    """
+    Revenue by month and region from the table and from a summary, the
+    full build, and the incremental refresh after appending 1% more rows.
+    The appended rows and the summary are removed again so the other cases
+    see the plain table.
+    """
+    from connections import read_connection, write_connection
+    from db_tools import create_table, execute_sql_query
+    from summaries import create_summary, drop_summary, rewrite_query
+
+    rows = params["rows"]
+    db_name = f"ingest_{rows}.db"
+    rnd = random.Random(0)
+    query = (
+        "SELECT strftime('%Y-%m', order_date) AS month, region, SUM(quantity * price) AS revenue, COUNT(*) AS orders "
+        "FROM sales WHERE region = '{region}' GROUP BY month, region ORDER BY month"
+    )
+    metrics: Dict[str, Any] = {}
+
+    def base():
+        execute_sql_query(query.format(region=rnd.choice(REGIONS)), db_name)
+
+    base()  # warm the page cache
+    metrics["base_query"] = latency_stats(timed(base, max(repeat // 5, 1)))
+
+    start = time.perf_counter()
+    built = create_summary(
+        db_name, "sales", {"month": "strftime('%Y-%m', order_date)", "region": "region"}, ["sum(quantity * price)"],
+        name="bench",
+    )
+    if "error" in built:
+        raise RuntimeError(built["error"])
+    metrics["build_s"] = round(time.perf_counter() - start, 3)
+    metrics["groups"] = built["groups"]
+    try:
+        with read_connection("db/" + db_name) as conn:
+            if rewrite_query(conn, query.format(region="East")) is None:
+                raise RuntimeError("The query was not rewritten")
+
+        def summary():
+            with read_connection("db/" + db_name) as conn:
+                sql = rewrite_query(conn, query.format(region=rnd.choice(REGIONS)))["sql"]
+            execute_sql_query(sql, db_name)
+
+        metrics["summary_query"] = latency_stats(timed(summary, repeat))
+
+        delta = os.path.join("data", f"sales_delta_{rows}.csv")
+        generate_sales_csv(delta, max(rows // 100, 1), seed=1)
+        start = time.perf_counter()
+        stats = create_table(db_name, delta, "sales", mode="append")
+        metrics["append_s"] = round(time.perf_counter() - start, 3)
+        refreshed = stats["summaries"][0]
+        if refreshed.get("kind") != "incremental":
+            raise RuntimeError(f"Expected an incremental refresh: {refreshed}")
+        metrics["incremental_refresh_s"] = refreshed["seconds"]
+    finally:
+        drop_summary(db_name, "bench")
+        with write_connection("db/" + db_name) as conn:
+            conn.execute("DELETE FROM sales WHERE rowid > ?", (rows,))
+            conn.commit()
+    return metrics
+
+
+def bench_stress(params: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    """
+    Sessions (threads, as Streamlit runs them) hammering one database with
+    agent reads, Browse pages, agent writes and CSV imports at once
+    """
+    import threading
+
+    from connections import write_queue_stats
+    from db_tools import create_table, execute_sql_query_page, get_table_page, resolve_db_path
+
+    db_name = "stress.db"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(os.path.join("db", db_name + suffix)):
+            os.remove(os.path.join("db", db_name + suffix))
+    csv_path = os.path.join("data", f"sales_{STRESS_ROWS}.csv")
+    create_table(db_name, csv_path, "sales")
+    create_table(db_name, os.path.join("data", f"customers_{STRESS_ROWS}.csv"), "customers")
+    execute_sql_query_page("CREATE TABLE notes (session INTEGER, ts REAL, body TEXT)", db_name)
+
+    samples: Dict[str, List[float]] = {"read": [], "browse": [], "write": [], "import": []}
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + STRESS_SECONDS
+
+    def session(number: int) -> None:
+        rnd = random.Random(number)
+        while time.perf_counter() < deadline:
+            pick = rnd.random()
+            start = time.perf_counter()
+            if pick < STRESS_MIX["import"]:
+                kind = "import"
+                try:
+                    create_table(db_name, csv_path, f"upload_{number}")
+                    error = None
+                except Exception as e:
+                    error = str(e)
+            elif pick < STRESS_MIX["import"] + STRESS_MIX["write"]:
+                kind = "write"
+                result = execute_sql_query_page(
+                    f"INSERT INTO notes VALUES ({number}, {time.time()}, 'note {rnd.randrange(1000)}')", db_name
+                )
+                error = result.get("error")
+            elif pick < STRESS_MIX["import"] + STRESS_MIX["write"] + STRESS_MIX["browse"]:
+                kind = "browse"
+                result = get_table_page(
+                    os.path.join("db", db_name), "sales", sort=rnd.choice([None, "price", "order_date"]),
+                    filters=[{"column": "region", "op": "=", "value": rnd.choice(REGIONS)}], prefetch=False,
+                )
+                error = result.get("error")
+            else:
+                kind = "read"
+                template = rnd.choice(list(QUERY_SHAPES.values()))
+                query = template.format(
+                    id=rnd.randrange(STRESS_ROWS), date=f"2024-{rnd.randrange(1, 13):02d}-01",
+                    region=rnd.choice(REGIONS), price=rnd.randrange(400, 500),
+                )
+                result = execute_sql_query_page(query, db_name)
+                error = result.get("error")
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples[kind].append(elapsed)
+                if error:
+                    errors[error[:80]] = errors.get(error[:80], 0) + 1
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(params["sessions"])]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    metrics: Dict[str, Any] = {
+        kind: latency_stats(values) for kind, values in samples.items() if values
+    }
+    metrics["ops_per_sec"] = round(sum(len(v) for v in samples.values()) / wall, 1)
+    metrics["errors"] = sum(errors.values())
+    metrics["error_messages"] = errors
+    queue = write_queue_stats().get(resolve_db_path(os.path.join("db", db_name)), {})
+    metrics["writes_queued"] = queue.get("waited", 0)
+    metrics["write_queue_wait_s"] = queue.get("wait_seconds", 0.0)
+    return metrics
+
+
+def bench_startup(params: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    """
+    Cold start of one page: each sample is a fresh interpreter, so module
+    imports are paid again every time as they are after a server restart.
+    Imports (Streamlit, then the page module) and the first render of
+    app.py opened on the page are timed in separate processes, and each
+    reports its own peak RSS; peak_rss_mb is the larger of the two.
+    """
+    page = params["page"]
+    samples: Dict[str, List[float]] = {"streamlit_import": [], "page_import": [], "first_render": []}
+    peaks: Dict[str, List[float]] = {"import": [], "render": []}
+    metrics: Dict[str, Any] = {}
+    for _ in range(max(repeat // 5, 1)):
+        for mode in ("import", "render"):
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "_startup", mode, page],
+                capture_output=True,
+                text=True,
+            )
+            if proc.returncode != 0:
+                raise RuntimeError((proc.stderr or proc.stdout).strip().splitlines()[-1])
+            sample = json.loads(proc.stdout.strip().splitlines()[-1])
+            if sample.get("peak_rss_mb") is not None:
+                peaks[mode].append(sample.pop("peak_rss_mb"))
+            for name in samples:
+                if name in sample:
+                    samples[name].append(sample.pop(name))
+            metrics.update(sample)
+    for name, values in samples.items():
+        metrics[name] = latency_stats(values)
+    for mode, values in peaks.items():
+        if values:
+            metrics[f"{mode}_peak_rss_mb"] = max(values)
+    if any(peaks.values()):
+        metrics["peak_rss_mb"] = max(max(values) for values in peaks.values() if values)
+    return metrics
+
+
+def _startup_main(mode: str, page: str) -> None:
+    # Runs in a fresh interpreter started by bench_startup
+    sys.path.insert(0, REPO_DIR)
+    sample: Dict[str, Any] = {}
+    start = time.perf_counter()
+    import streamlit  # noqa: F401
+    if mode == "import":
+        sample["streamlit_import"] = time.perf_counter() - start
+        start = time.perf_counter()
+        module = __import__(PAGE_MODULES[page])
+        sample["page_import"] = time.perf_counter() - start
+        if page == "Query Builder Assistant":
+            # Compiling the agent is paid once per process and key; later
+            # sessions get it from the resource cache
+            start = time.perf_counter()
+            module.get_agent("benchmark-key")
+            sample["agent_build_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            start = time.perf_counter()
+            module.get_agent("benchmark-key")
+            sample["agent_cached_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    else:
+        from streamlit.testing.v1 import AppTest
+
+        app = AppTest.from_file(os.path.join(REPO_DIR, "app.py"), default_timeout=120)
+        app.query_params["page"] = page
+        start = time.perf_counter()
+        app.run()
+        sample["first_render"] = time.perf_counter() - start
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+        sample["modules_loaded"] = len(sys.modules)
+        sample["llm_stack_loaded"] = "langchain_core" in sys.modules
+    sample["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(sample))
+
+
+# name -> (function, size parameter it runs over)
+CASES: Dict[str, Any] = {
+    "ingest": (bench_ingest, "rows"),
+    "query": (bench_query, "rows"),
+    "schema": (bench_schema, "tables"),
+    "listing": (bench_listing, "files"),
+    "browse": (bench_browse, "rows"),
+    "columnar": (bench_columnar, "rows"),
+    "export": (bench_export, "rows"),
+    "fulltext": (bench_fulltext, "rows"),
+    "summaries": (bench_summaries, "rows"),
+    "stress": (bench_stress, "sessions"),
+    "startup": (bench_startup, "page"),
+}
+
+
+def prepare(case: str, params: Dict[str, Any], workdir: str, seed: int) -> None:
+    """
+    Generate the inputs of a case (not timed)
+    """
+    if "rows" in params:
+        rows = params["rows"]
+        generate_sales_csv(os.path.join(workdir, "data", f"sales_{rows}.csv"), rows, seed)
+        generate_customers_csv(os.path.join(workdir, "data", f"customers_{rows}.csv"), rows, seed)
+        if case != "ingest" and not os.path.exists(os.path.join(workdir, "db", f"ingest_{rows}.db")):
+            run_case_process("ingest", params, workdir, 1)
+    if "tables" in params:
+        generate_schema_db(os.path.join(workdir, "db", f"schema_{params['tables']}.db"), params["tables"], seed)
+    if "files" in params:
+        generate_db_folder(os.path.join(workdir, "listings", f"files_{params['files']}"), params["files"], seed)
+    if "sessions" in params:
+        generate_sales_csv(os.path.join(workdir, "data", f"sales_{STRESS_ROWS}.csv"), STRESS_ROWS, seed)
+        generate_customers_csv(os.path.join(workdir, "data", f"customers_{STRESS_ROWS}.csv"), STRESS_ROWS, seed)
+
+
+def run_case_process(case: str, params: Dict[str, Any], workdir: str, repeat: int) -> Dict[str, Any]:
+    """
+    Run one case in a fresh interpreter and return its metrics
+    """
+    spec = json.dumps({"case": case, "params": params, "repeat": repeat})
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "_case", spec],
+        cwd=workdir,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": (proc.stderr or proc.stdout).strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _child_main(spec_json: str) -> None:
+    spec = json.loads(spec_json)
+    sys.path.insert(0, REPO_DIR)
+    # Keep the benchmark's queries out of the app's own query log
+    import query_log
+    query_log._query_log = query_log.QueryLog(os.path.join(os.getcwd(), "query_log.sqlite"))
+
+    fn, _ = CASES[spec["case"]]
+    start = time.perf_counter()
+    metrics = fn(spec["params"], spec["repeat"])
+    query_log.get_query_log().flush()
+    metrics["case_wall_s"] = round(time.perf_counter() - start, 3)
+    # The startup case reports the peak of the processes it started
+    metrics.setdefault("peak_rss_mb", peak_rss_mb())
+    print(json.dumps(metrics))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    scale: str,
+    cases: List[str],
+    workdir: str = DEFAULT_WORKDIR,
+    repeat: int = 20,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Run the selected cases over every size of a scale
+
+    Returns:
+        Dictionary with meta (environment) and results (one entry per case
+        and size with its params and metrics)
+    """
+    for sub in ("db", "data", "listings"):
+        os.makedirs(os.path.join(workdir, sub), exist_ok=True)
+    results = []
+    for case in cases:
+        _, size_key = CASES[case]
+        for size in SCALES[scale][size_key]:
+            params = {size_key: size}
+            prepare(case, params, workdir, seed)
+            label = f"{size:,}" if isinstance(size, int) else size
+            print(f"{case:<10} {size_key}={label:<10}", end="", flush=True)
+            metrics = run_case_process(case, params, workdir, repeat)
+            print(" error" if "error" in metrics else f" {metrics['case_wall_s']:.2f}s", flush=True)
+            results.append({"case": case, "params": params, "metrics": metrics})
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "scale": scale,
+            "repeat": repeat,
+            "seed": seed,
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def _flatten(metrics: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in metrics.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key != "n":
+            flat[name] = float(value)
+    return flat
+
+
+def _higher_is_better(metric: str) -> bool:
+    return metric.endswith("per_sec")
+
+
+def _noise_floor(metric: str) -> float:
+    return next((floor for suffix, floor in NOISE_FLOOR.items() if metric.endswith(suffix)), 0.0)
+
+
+def compare_results(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = REGRESSION_THRESHOLD,
+) -> List[Dict[str, Any]]:
+    """
+    Compare every metric present in both runs
+
+    Returns:
+        One row per metric with case, params, metric, baseline, current,
+        change (fraction, positive = worse) and regression
+    """
+    def index(run):
+        return {(r["case"], json.dumps(r["params"], sort_keys=True)): r["metrics"] for r in run["results"]}
+
+    before, after = index(baseline), index(current)
+    rows = []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = _flatten(before[key]), _flatten(after[key])
+        for metric in sorted(old.keys() & new.keys()):
+            if metric == "case_wall_s" or old[metric] == 0:
+                continue
+            change = (new[metric] - old[metric]) / old[metric]
+            if _higher_is_better(metric):
+                change = -change
+            rows.append({
+                "case": key[0],
+                "params": key[1],
+                "metric": metric,
+                "baseline": old[metric],
+                "current": new[metric],
+                "change": change,
+                "regression": change > threshold and abs(new[metric] - old[metric]) > _noise_floor(metric),
+            })
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]]) -> int:
+    """
+    Print a comparison table and return the number of regressions
+    """
+    for r in rows:
+        flag = "REGRESSION" if r["regression"] else ""
+        print(
+            f"{r['case']:<10} {r['params']:<18} {r['metric']:<36} "
+            f"{r['baseline']:>12.3f} {r['current']:>12.3f} {r['change']:>+8.1%} {flag}"
+        )
+    regressions = sum(r["regression"] for r in rows)
+    print(f"\n{len(rows)} metrics compared, {regressions} regressions")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "_case":
+        _child_main(argv[1])
+        return 0
+    if argv and argv[0] == "_startup":
+        _startup_main(argv[1], argv[2])
+        return 0
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command")
+
+    run_p = sub.add_parser("run", help="Run benchmarks and write a JSON result file")
+    run_p.add_argument("--scale", choices=list(SCALES), default="small")
+    run_p.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    run_p.add_argument("--repeat", type=int, default=20, help="Timed repetitions per measurement")
+    run_p.add_argument("--seed", type=int, default=0)
+    run_p.add_argument("--workdir", default=DEFAULT_WORKDIR, help="Where generated data is kept between runs")
+    run_p.add_argument("--out", default="benchmark_results.json")
+    run_p.add_argument("--compare", metavar="BASELINE", help="Compare against an earlier result file")
+    run_p.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    cmp_p = sub.add_parser("compare", help="Compare two JSON result files")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+    cmp_p.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        return 1 if print_comparison(compare_results(baseline, current, args.threshold)) else 0
+
+    if args.command != "run":
+        parser.print_help()
+        return 2
+
+    results = run_benchmarks(args.scale, args.cases, os.path.abspath(args.workdir), args.repeat, args.seed)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if print_comparison(compare_results(baseline, results, args.threshold)) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Matplotlib charts of query results for the assistant page.
+
+Charts are drawn on a standalone Figure rather than through pyplot, whose
+global current figure is shared by every session of the Streamlit server.
+"""
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import pandas as pd
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+# Rows of a result read for a chart
+CHART_MAX_ROWS = 10_000
+CHART_KINDS = ("line", "bar", "scatter")
+# Bars drawn at most; a bar chart of more rows shows the first ones
+CHART_MAX_BARS = 50
+# Series drawn by default; more can be picked, but their scales often differ
+_DEFAULT_SERIES = 1
+
+
+def numeric_columns(frame: pd.DataFrame) -> List[str]:
+    """
+    Columns that can be plotted as values
+    """
+    return [
+        c for c in frame.columns
+        if pd.api.types.is_numeric_dtype(frame[c]) and not pd.api.types.is_bool_dtype(frame[c])
+    ]
+
+
+def _as_dates(values: pd.Series) -> pd.Series:
+    # ISO date text (the default storage of imported dates) plots on a time axis
+    if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+        try:
+            return pd.to_datetime(values, format="ISO8601")
+        except (ValueError, TypeError):
+            pass
+    return values
+
+
+def default_chart(frame: pd.DataFrame) -> Optional[Dict[str, Any]]:
+    """
+    A first chart for a result: dates as a line, categories as bars, or
+    the first numeric column against the others as points
+
+    Returns:
+        Dictionary with kind, x and y (list of columns), or None when the
+        result has nothing to plot
+    """
+    numbers = numeric_columns(frame)
+    others = [c for c in frame.columns if c not in numbers]
+    dates = [c for c in others if pd.api.types.is_datetime64_any_dtype(_as_dates(frame[c]))]
+    if dates:
+        kind, x = "line", dates[0]
+    elif others:
+        kind, x = "bar", others[0]
+    elif len(numbers) > 1:
+        kind, x = "scatter", numbers[0]
+    else:
+        return None
+    y = [c for c in numbers if c != x][:_DEFAULT_SERIES]
+    return {"kind": kind, "x": x, "y": y} if y else None
+
+
+def plot_frame(frame: pd.DataFrame, kind: str, x: str, y: List[str]) -> "Figure":
+    """
+    Chart of the y columns of a result against its x column
+
+    Args:
+        frame: Query result
+        kind: "line", "bar" or "scatter"
+        x: Column on the horizontal axis
+        y: Numeric columns to draw
+
+    Returns:
+        Matplotlib figure (e.g. for st.pyplot)
+    """
+    if kind not in CHART_KINDS:
+        raise ValueError(f"Unknown chart kind {kind!r}; expected one of {', '.join(CHART_KINDS)}")
+    # Matplotlib is imported with the first chart, not with the assistant page
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 4), layout="constrained")
+    ax = fig.subplots()
+    data = frame[[x] + [c for c in y if c != x]].copy()
+    data[x] = _as_dates(data[x])
+
+    if kind == "bar":
+        data = data.head(CHART_MAX_BARS)
+        labels = data[x].astype(str)
+        width = 0.8 / max(len(y), 1)
+        for i, column in enumerate(y):
+            positions = [p + (i - (len(y) - 1) / 2) * width for p in range(len(data))]
+            ax.bar(positions, data[column].astype(float), width=width, label=column)
+        rotate = len(data) > 8
+        ax.set_xticks(range(len(data)), labels, rotation=45 if rotate else 0, ha="right" if rotate else "center")
+        if len(frame) > CHART_MAX_BARS:
+            ax.set_title(f"First {CHART_MAX_BARS} of {len(frame):,} rows", fontsize="small")
+    else:
+        if kind == "line":
+            data = data.sort_values(x)
+        for column in y:
+            values = data[column].astype(float)
+            if kind == "line":
+                ax.plot(data[x], values, label=column)
+            else:
+                ax.scatter(data[x], values, label=column, s=12)
+        if pd.api.types.is_datetime64_any_dtype(data[x]):
+            fig.autofmt_xdate()
+
+    ax.set_xlabel(x)
+    if len(y) == 1:
+        ax.set_ylabel(y[0])
+    else:
+        ax.legend()
+    ax.grid(alpha=0.3)
+    return fig
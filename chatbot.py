@@ -1,38 +1,450 @@
 # Import the necessary libraries
 import streamlit as st  # For creating the web app interface
+from streamlit.runtime.scriptrunner import RerunException, StopException  # Raised when the user cancels
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI  # For interacting with Google Gemini via LangChain
-from langgraph.prebuilt import create_react_agent  # For creating a ReAct agent
-from langchain_core.messages import HumanMessage, AIMessage  # For message formatting
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, ToolMessage  # For message formatting
 from langchain_core.tools import tool  # For creating tools
+from langchain_core.runnables import RunnableConfig  # Carries per-run settings into tools
 
 # Import our database tools
-from db_tools import text_to_sql, get_database_info, getAllDB
+from db_tools import (
+    text_to_sql, get_schema_context, getAllDB, list_db_files, get_schema_fingerprint, is_read_only_query,
+    export_query_result, query_frame, search_table_text,
+)
+from charts import CHART_KINDS, CHART_MAX_ROWS, default_chart, numeric_columns, plot_frame
+from export import EXPORT_FORMATS, available_formats, spool
+from schema_context import SCHEMA_TOKEN_BUDGET
+from summaries import format_age
+from result_format import RESULT_CHAR_BUDGET, RESULT_ROW_BUDGET, encode_result
+from question_cache import QuestionCache
+from index_advisor import INDEX_AUTO_BUDGET_BYTES, schedule_auto_index
+
+# Model behind the assistant
+CHAT_MODEL = "gemini-2.5-flash"
 
-db_path = ""
 # Define the tools using the LangChain tool decorator
-@tool
-def execute_sql(sql_query: str):
+@tool(response_format="content_and_artifact")
+def execute_sql(sql_query: str, page_token: Optional[str] = None, config: RunnableConfig = None):
     """
     Execute a SQL query against the database.
     
     Args:
         sql_query: The SQL query to execute. Must be a valid SQL query string.
             For example: "SELECT * FROM customers", "SELECT p.name, SUM(si.quantity) as total_sold FROM sale_items si JOIN products p ON si.product_id = p.product_id GROUP BY p.product_id ORDER BY total_sold DESC", etc.
+        page_token: Optional. Results are returned one bounded page at a time. When a result
+            has "has_more": true, call again with the same sql_query and its "next_page_token"
+            to get the next page.
+
+    Queries run under a time and step budget. If a result contains "budget_exceeded",
+    rewrite the query to do less work (filter, aggregate, LIMIT) and try again.
+
+    Results come back as CSV with a header line, cut to a row and size budget, followed
+    by a summary of every column (min/max/mean or distinct values) over all returned rows.
+    The user sees the full result in the app.
+    """
+    configurable = (config or {}).get("configurable") or {}
+    # The chat UI passes a cancel event so the user can stop a running query
+    cancel_event = configurable.get("cancel_event")
+    result = text_to_sql(sql_query, configurable["db_path"], page_token=page_token, cancel_event=cancel_event)
+    encoded = encode_result(
+        result,
+        max_rows=configurable.get("result_row_budget") or RESULT_ROW_BUDGET,
+        max_chars=configurable.get("result_char_budget") or RESULT_CHAR_BUDGET,
+    )
+    # Format the result to clearly show the executed SQL query; the full
+    # result is kept as the artifact for the UI and is not sent to the model
+    formatted_result = f"```sql\n{sql_query}\n```\n\nQuery Results:\n{encoded}"
+    if result.get("summary"):
+        formatted_result += f"\n(Answered from the summary table of {result['summary']['table_name']}; same result.)"
+    return formatted_result, result
+
+@tool(response_format="content_and_artifact")
+def search_text(table: str, query: str, column: Optional[str] = None, config: RunnableConfig = None):
+    """
+    Find the rows of a table whose text mentions some words, using the table's full-text index.
+    Use it instead of LIKE '%word%' on columns that get_schema_info marks as "full-text indexed".
+
+    Args:
+        table: Table to search.
+        query: Words to look for. All words must appear unless joined with OR; also supports
+            "exact phrases", prefixes like refund*, NOT and NEAR(a b). For example: "refund",
+            "late delivery", "refund OR chargeback".
+        column: Optional. Only search this full-text indexed column.
+
+    Returns the best matching rows first (up to 20) as CSV, with a "_snippet" of the matched
+    text and a "_score" (lower is a better match). To count all matches, use execute_sql with:
+    SELECT count(*) FROM <table>__fts WHERE <table>__fts MATCH '<query>'.
     """
-    result = text_to_sql(sql_query, db_path)
-    # Format the result to clearly show the executed SQL query
-    formatted_result = f"```sql\n{sql_query}\n```\n\nQuery Results:\n{result}"
-    return formatted_result
+    configurable = (config or {}).get("configurable") or {}
+    result = search_table_text(configurable["db_path"], table, query, column)
+    encoded = encode_result(
+        result,
+        max_rows=configurable.get("result_row_budget") or RESULT_ROW_BUDGET,
+        max_chars=configurable.get("result_char_budget") or RESULT_CHAR_BUDGET,
+    )
+    return f"Full-text search in {table} for {result['query']!r}:\n{encoded}", result
 
 @tool
-def get_schema_info():
+def get_schema_info(question: str = "", config: RunnableConfig = None):
     """
     Get information about the database schema and sample data to help with query construction.
-    This tool returns the schema of all tables and sample data (first 3 rows) from each table.
     Use this tool before writing SQL queries to understand the database structure.
+
+    Args:
+        question: The user's question, or the names of the tables you need. The tables most
+            relevant to it (and the tables they join to) are returned first with their columns
+            and up to 3 sample rows; other tables are only listed by name.
+    """
+    configurable = (config or {}).get("configurable") or {}
+    budget = configurable.get("schema_token_budget") or SCHEMA_TOKEN_BUDGET
+    return get_schema_context(configurable["db_path"], question, token_budget=budget)
+
+SYSTEM_PROMPT = """You are a helpful assistant that can answer questions about Database, Table, Data or any object in Database using SQL.
+                
+                IMPORTANT: When a user asks a question about database and data, follow these steps:
+                1. FIRST, use the get_schema_info tool with the user's question to understand the database structure and see the data
+                2. THEN, write a SQL query based on the user's question and the database schema
+                3. Execute the SQL query using the execute_sql tool
+                   (to find rows whose text mentions some words, use search_text on columns marked
+                   "full-text indexed" instead of LIKE '%word%')
+                4. Explain the results in a clear and concise way
+                
+                When writing SQL queries:
+                - Use proper SQL syntax for SQLite
+                - Use appropriate JOINs when querying across multiple tables
+                - Use aliases for table names in complex queries (e.g., 'customers AS c')
+                - Use aggregation functions (COUNT, SUM, AVG, etc.) when appropriate
+                - Format the SQL query to be readable
+                
+                If you encounter any errors:
+                - Explain what went wrong
+                - Fix the SQL query and try again
+                
+                Remember: You must generate the SQL query yourself based on the user's question and the database schema.
+                Do not ask the user to provide SQL queries.
+                """
+
+_question_cache: Optional[QuestionCache] = None
+
+
+def get_question_cache() -> QuestionCache:
+    global _question_cache
+    if _question_cache is None:
+        _question_cache = QuestionCache()
+    return _question_cache
+
+
+def build_agent(llm):
+    """
+    Create the ReAct agent around any LangChain chat model.
+
+    Taking the model as an argument lets a fake chat model stand in for
+    ChatGoogleGenerativeAI when running offline.
+    """
+    # LangGraph is imported on first use so it does not slow down app start
+    from langgraph.prebuilt import create_react_agent
+
+    return create_react_agent(
+        model=llm,
+        tools=[get_schema_info, execute_sql, search_text],
+        prompt=SYSTEM_PROMPT
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_agent(google_api_key: str, model: str = CHAT_MODEL):
+    """
+    The agent for an API key and model, compiled once per process and shared
+    by every session that uses the same pair.
+
+    The agent holds no session state: the messages and the selected database
+    of each session are passed in on every call (see answer_question).
+    """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    llm = ChatGoogleGenerativeAI(
+        model=model,
+        google_api_key=google_api_key,
+        temperature=0.2  # Lower temperature for more deterministic responses
+    )
+    return build_agent(llm)
+
+
+def extract_sql(messages: List[Any]) -> Optional[str]:
+    """
+    Return the last SQL query the agent sent to the execute_sql tool
+    """
+    sql_query = None
+    for msg in messages:
+        # Check if this is a ToolMessage with execute_sql
+        if hasattr(msg, "tool_call_id") and hasattr(msg, "name") and msg.name == "execute_sql":
+            # Extract SQL query from the tool message content
+            if hasattr(msg, "content") and "```sql\n" in msg.content:
+                sql_parts = msg.content.split("```sql\n")
+                if len(sql_parts) > 1:
+                    sql_query = sql_parts[1].split("\n```")[0].strip()
+        # Also check for tool calls in AIMessage
+        elif hasattr(msg, "tool_calls") and msg.tool_calls:
+            for tool_call in msg.tool_calls:
+                if tool_call.get("name") == "execute_sql" and "sql_query" in tool_call.get("args", {}):
+                    sql_query = tool_call["args"]["sql_query"]
+    return sql_query
+
+
+def extract_result(messages: List[Any], tools=("execute_sql", "search_text")) -> Optional[Dict[str, Any]]:
+    """
+    Return the full result of the last call to one of the tools (its
+    artifact)
+    """
+    result = None
+    for msg in messages:
+        if isinstance(msg, ToolMessage) and msg.name in tools and msg.artifact is not None:
+            result = msg.artifact
+    return result
+
+
+def _rows_to_markdown(rows: List[Dict[str, Any]], limit: int = 20) -> str:
+    if not rows:
+        return "_The query returned no rows._"
+    columns = list(rows[0].keys())
+    lines = [
+        "| " + " | ".join(str(c) for c in columns) + " |",
+        "| " + " | ".join("---" for _ in columns) + " |",
+    ]
+    for row in rows[:limit]:
+        lines.append("| " + " | ".join(str(row.get(c, "")).replace("|", "\\|") for c in columns) + " |")
+    if len(rows) > limit:
+        lines.append(f"\n_{len(rows) - limit} more rows not shown._")
+    return "\n".join(lines)
+
+
+def message_text(content: Any) -> str:
+    """
+    Plain text of a message's content (Gemini may return a list of parts)
+    """
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content
+            if isinstance(part, (str, dict))
+        )
+    return str(content)
+
+
+def stream_agent_events(agent, messages: List[Any], config: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Run the agent with LangGraph streaming and yield UI events as they happen.
+
+    Events are dictionaries with a "type" key:
+        token        text generated so far by the model ("text")
+        tool_call    a tool the model decided to call ("name", "args")
+        sql          SQL sent to execute_sql ("sql")
+        tool_result  output of a tool ("name", "content" sent to the model,
+                     "artifact": the full result of execute_sql or
+                     search_text, or None)
+        final        the final answer ("text")
+    """
+    stream = agent.stream({"messages": messages}, config, stream_mode=["messages", "updates"])
+    for mode, payload in stream:
+        if mode == "messages":
+            chunk, metadata = payload
+            if isinstance(chunk, AIMessageChunk) and metadata.get("langgraph_node") == "agent":
+                text = message_text(chunk.content)
+                if text:
+                    yield {"type": "token", "text": text}
+            continue
+
+        # "updates": one complete state delta per finished graph node
+        for update in payload.values():
+            for msg in (update or {}).get("messages", []):
+                if isinstance(msg, ToolMessage):
+                    yield {
+                        "type": "tool_result", "name": msg.name, "content": message_text(msg.content),
+                        "artifact": msg.artifact,
+                    }
+                elif isinstance(msg, AIMessage) and msg.tool_calls:
+                    for tool_call in msg.tool_calls:
+                        yield {"type": "tool_call", "name": tool_call["name"], "args": tool_call.get("args", {})}
+                        if tool_call["name"] == "execute_sql" and "sql_query" in tool_call.get("args", {}):
+                            yield {"type": "sql", "sql": tool_call["args"]["sql_query"]}
+                elif isinstance(msg, AIMessage):
+                    yield {"type": "final", "text": message_text(msg.content)}
+
+
+def answer_question(
+    agent,
+    messages: List[Any],
+    question: str,
+    db_name: str,
+    cache: Optional[QuestionCache] = None,
+    fuzzy: bool = False,
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    schema_token_budget: int = SCHEMA_TOKEN_BUDGET,
+    result_row_budget: int = RESULT_ROW_BUDGET,
+    result_char_budget: int = RESULT_CHAR_BUDGET,
+) -> Dict[str, Any]:
     """
-    return get_database_info(db_path)
+    Answer a question, replaying cached SQL when the same question was
+    already answered for a database with the same schema.
+
+    Only standalone questions (the first message of a conversation) use the
+    cache, since follow-ups depend on earlier turns. When on_event is given
+    the agent is streamed and every event from stream_agent_events is passed
+    to it as it happens. Setting cancel_event interrupts a running SQL query
+    and stops the agent at its next step, with or without on_event. schema_token_budget bounds the
+    schema context the get_schema_info tool returns; result_row_budget and
+    result_char_budget bound the query results sent to the model.
+
+    Returns:
+        Dictionary with answer, sql, result (the full result of the last
+        query, for display), cached (bool), cancelled (bool) and seconds_saved
+    """
+    standalone = len(messages) == 1
+    fingerprint = get_schema_fingerprint(db_name) if cache is not None and standalone else None
+
+    if fingerprint:
+        hit = cache.lookup(fingerprint, question, fuzzy=fuzzy)
+        if hit:
+            start = time.perf_counter()
+            result = text_to_sql(hit["sql"], db_name)
+            elapsed = time.perf_counter() - start
+            rows = result["results"]
+            if not (rows and "error" in rows[0]):
+                saved = hit["agent_seconds"] - elapsed
+                cache.record_hit(fingerprint, hit["question"], saved)
+                answer = (
+                    f"_Answered from the question cache ({hit['match']} match, saved ~{saved:.1f}s)._\n\n"
+                    + _rows_to_markdown(rows)
+                )
+                return {
+                    "answer": answer, "sql": hit["sql"], "result": result, "cached": True, "cancelled": False,
+                    "seconds_saved": saved,
+                }
+
+    start = time.perf_counter()
+    answer, sql_query, sql_result = None, None, None
+    # Result of the last execute_sql call, which tells whether its SQL ran
+    sql_artifact = None
+    # The agent is shared by sessions, so the database travels with the run
+    config = {"configurable": {
+        "db_path": db_name, "cancel_event": cancel_event, "schema_token_budget": schema_token_budget,
+        "result_row_budget": result_row_budget, "result_char_budget": result_char_budget,
+    }}
+    cancelled = {
+        "answer": "_Cancelled._", "sql": None, "result": None, "cached": False, "cancelled": True,
+        "seconds_saved": 0.0,
+    }
+    if on_event is not None:
+        # The SQL comes straight from the tool call events
+        for event in stream_agent_events(agent, messages, config):
+            if cancel_event is not None and cancel_event.is_set():
+                return dict(cancelled, sql=sql_query, result=sql_result)
+            on_event(event)
+            if event["type"] == "sql":
+                sql_query = event["sql"]
+            elif event["type"] == "tool_result" and event["name"] in ("execute_sql", "search_text"):
+                sql_result = event["artifact"]
+                if event["name"] == "execute_sql":
+                    sql_artifact = event["artifact"]
+            elif event["type"] == "final":
+                answer = event["text"]
+    else:
+        # Run step by step, as invoke would, so that a cancel stops the
+        # agent before its next model or tool call
+        response: Dict[str, Any] = {}
+        for response in agent.stream({"messages": messages}, config, stream_mode="values"):
+            if cancel_event is not None and cancel_event.is_set():
+                return dict(
+                    cancelled, sql=extract_sql(response["messages"]), result=extract_result(response["messages"])
+                )
+        # Extract the answer from the response
+        if "messages" in response and len(response["messages"]) > 0:
+            answer = message_text(response["messages"][-1].content)
+            sql_query = extract_sql(response["messages"])
+            sql_result = extract_result(response["messages"])
+            sql_artifact = extract_result(response["messages"], tools=("execute_sql",))
+    agent_seconds = time.perf_counter() - start
+
+    if answer is None:
+        answer = "I'm sorry, I couldn't generate a response."
+
+    # Remember read-only SQL that ran without errors, judged on the result
+    # the agent already got rather than by running the query again
+    if (
+        fingerprint and sql_query and sql_artifact is not None and sql_artifact.get("query") == sql_query
+        and is_read_only_query(sql_query, db_name)
+    ):
+        rows = sql_artifact.get("results") or []
+        if not (rows and "error" in rows[0]):
+            cache.store(fingerprint, question, sql_query, agent_seconds)
+
+    return {
+        "answer": answer, "sql": sql_query, "result": sql_result, "cached": False, "cancelled": False,
+        "seconds_saved": 0.0,
+    }
+
+
+def _run_cancellable(work, render_event, cancel_event: threading.Event):
+    """
+    Run work(on_event) in a worker thread while the script thread renders its
+    events, with a Cancel button next to them.
+
+    Clicking Cancel makes Streamlit rerun the script, which it does by raising
+    RerunException inside this thread at the next UI update (StopException
+    when the session ends). Only those count as a cancellation: cancel_event
+    is set so the worker's running SQL query is interrupted, and the answer
+    is recorded as cancelled. Any other exception, from the worker or from
+    rendering an event, also stops the worker but is raised as it is.
+    """
+    events: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+    outcome: Dict[str, Any] = {}
+
+    def target():
+        try:
+            outcome["value"] = work(events.put)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            events.put(None)
+
+    threading.Thread(target=target, daemon=True).start()
+    cancel_box = st.empty()
+    cancel_box.button("⏹ Cancel", key="cancel_answer", help="Stop answering this question")
+    timer = st.empty()
+    started = time.perf_counter()
+    try:
+        while True:
+            try:
+                event = events.get(timeout=0.2)
+            except queue.Empty:
+                # Regular UI updates give Streamlit a chance to handle the Cancel click
+                timer.caption(f"⏱ {time.perf_counter() - started:.1f}s")
+                continue
+            if event is None:
+                break
+            render_event(event)
+    except (RerunException, StopException):
+        cancel_event.set()
+        st.session_state.messages.append({"role": "assistant", "content": "_Cancelled._"})
+        raise
+    except BaseException:
+        # Not a cancellation: stop the worker and report the error as such
+        cancel_event.set()
+        raise
+    cancel_box.empty()
+    timer.empty()
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
+
 
 def run():
     
@@ -47,12 +459,10 @@ def run():
     with st.sidebar:
         st.markdown("---")
         db_folder = os.path.join(os.path.dirname(__file__) or ".", "db")
-        db_files = [f for f in os.listdir(db_folder) if f.endswith('.db')]
+        db_files = list_db_files(db_folder)
         dbs = getAllDB(db_folder, db_files)
         # Let user select a database to inspect
         sel = st.selectbox("Select a database for context", [r['filename'] for r in dbs])
-        global db_path
-        db_path = sel
         # Add a subheader to organize the settings
         st.subheader("Google API Settings")
         
@@ -64,6 +474,48 @@ def run():
         # 'help' provides a tooltip that appears when hovering over the button.
         reset_button = st.button("Reset Conversation", help="Clear all messages and start fresh")
 
+        # Show tokens and tool calls while the agent works instead of a spinner.
+        stream_responses = st.checkbox("Stream responses", value=True)
+
+        # Repeated questions can skip the agent and replay the SQL used last time.
+        st.subheader("Question Cache")
+        use_question_cache = st.checkbox("Reuse SQL for repeated questions", value=True)
+        fuzzy_match = st.checkbox(
+            "Match reworded questions", value=False, disabled=not use_question_cache,
+            help="Also reuse SQL for a question with the same words apart from filler words like 'show' or 'the'",
+        )
+        if use_question_cache:
+            qstats = get_question_cache().stats()
+            st.caption(
+                f"{qstats['entries']} cached questions | {qstats['hits']} hits | "
+                f"~{qstats['seconds_saved']:.0f}s saved"
+            )
+
+        # Let the index advisor index the tables the agent keeps scanning.
+        st.subheader("Indexes")
+        auto_index = st.checkbox("Create indexes automatically", value=False)
+        index_budget_mb = st.number_input(
+            "Index size budget (MB)", min_value=1, value=INDEX_AUTO_BUDGET_BYTES // (1024 * 1024),
+            disabled=not auto_index,
+        )
+
+        # Large databases only send the tables relevant to the question.
+        st.subheader("Schema Context")
+        schema_token_budget = st.number_input(
+            "Schema context budget (tokens)", min_value=500, value=SCHEMA_TOKEN_BUDGET, step=500,
+            help="Upper bound on the schema and sample rows sent to the model per lookup",
+        )
+
+        # Query results are shown in full here but cut down for the model.
+        st.subheader("Query Results")
+        result_row_budget = st.number_input(
+            "Rows sent to the model", min_value=1, value=RESULT_ROW_BUDGET,
+            help="The model also gets a per-column summary of all returned rows",
+        )
+        result_char_budget = st.number_input(
+            "Result size sent to the model (characters)", min_value=500, value=RESULT_CHAR_BUDGET, step=500,
+        )
+
     # --- 3. API Key and Agent Initialization ---
 
     # Check if the user has provided an API key.
@@ -72,54 +524,18 @@ def run():
         st.info("Please add your Google AI API key in the sidebar to start chatting.", icon="🗝️")
         st.stop()
 
-    # This block of code handles the creation of the LangGraph agent.
-    # It's designed to be efficient: it only creates a new agent if one doesn't exist
-    # or if the user has changed the API key in the sidebar.
-    if ("agent" not in st.session_state) or (getattr(st.session_state, "_last_key", None) != google_api_key):
-        try:
-            # Initialize the LLM with the API key
-            llm = ChatGoogleGenerativeAI(
-                model="gemini-2.5-flash",
-                google_api_key=google_api_key,
-                temperature=0.2  # Lower temperature for more deterministic responses
-            )
-            
-            # Create a ReAct agent with the LLM and our SQL tools
-            st.session_state.agent = create_react_agent(
-                model=llm,
-                tools=[get_schema_info, execute_sql],
-                prompt="""You are a helpful assistant that can answer questions about Database, Table, Data or any object in Database using SQL.
-                
-                IMPORTANT: When a user asks a question about database and data, follow these steps:
-                1. FIRST, use the get_schema_info tool to understand the database structure and see the data
-                2. THEN, write a SQL query based on the user's question and the database schema
-                3. Execute the SQL query using the execute_sql tool
-                4. Explain the results in a clear and concise way
-                
-                When writing SQL queries:
-                - Use proper SQL syntax for SQLite
-                - Use appropriate JOINs when querying across multiple tables
-                - Use aliases for table names in complex queries (e.g., 'customers AS c')
-                - Use aggregation functions (COUNT, SUM, AVG, etc.) when appropriate
-                - Format the SQL query to be readable
-                
-                If you encounter any errors:
-                - Explain what went wrong
-                - Fix the SQL query and try again
-                
-                Remember: You must generate the SQL query yourself based on the user's question and the database schema.
-                Do not ask the user to provide SQL queries.
-                """
-            )
-            
-            # Store the new key in session state to compare against later.
-            st.session_state._last_key = google_api_key
-            # Since the key changed, we must clear the old message history.
-            st.session_state.pop("messages", None)
-        except Exception as e:
-            # If the key is invalid, show an error and stop.
-            st.error(f"Invalid API Key or configuration error: {e}")
-            st.stop()
+    # The compiled agent is shared by all sessions using the same key and model;
+    # only the message history belongs to this session.
+    try:
+        agent = get_agent(google_api_key, CHAT_MODEL)
+    except Exception as e:
+        # If the key is invalid, show an error and stop.
+        st.error(f"Invalid API Key or configuration error: {e}")
+        st.stop()
+    if st.session_state.get("_last_key") != google_api_key:
+        # Since the key changed, we must clear the old message history.
+        st.session_state._last_key = google_api_key
+        st.session_state.pop("messages", None)
 
     # --- 4. Chat History Management ---
 
@@ -129,9 +545,9 @@ def run():
 
     # Handle the reset button click.
     if reset_button:
-        # If the reset button is clicked, clear the agent and message history from memory.
-        st.session_state.pop("agent", None)
+        # If the reset button is clicked, clear the message history from memory.
         st.session_state.pop("messages", None)
+        st.session_state.pop("last_query", None)
         # st.rerun() tells Streamlit to refresh the page from the top.
         st.rerun()
 
@@ -152,72 +568,158 @@ def run():
 
     # Check if the user has entered a message.
     if prompt:
+        # A new question replaces the result that can be charted
+        st.session_state.pop("last_query", None)
         # 1. Add the user's message to our message history list.
         st.session_state.messages.append({"role": "user", "content": prompt})
         # 2. Display the user's message on the screen immediately for a responsive feel.
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # 3. Get the assistant's response.
-        # Use a 'try...except' block to gracefully handle potential errors (e.g., network issues, API errors).
-        try:
-            # Convert the message history to the format expected by the agent
-            messages = []
-            for msg in st.session_state.messages:
-                if msg["role"] == "user":
-                    messages.append(HumanMessage(content=msg["content"]))
-                elif msg["role"] == "assistant":
-                    messages.append(AIMessage(content=msg["content"]))
-            
-            # Show a spinner while waiting for the response
-            with st.spinner("Thinking..."):
-                # Send the user's prompt to the agent
-                response = st.session_state.agent.invoke({"messages": messages})
-                
-                # Extract the answer from the response
-                if "messages" in response and len(response["messages"]) > 0:
-                    answer = response["messages"][-1].content
-                    
-                    # Extract SQL query from tool messages if present
-                    sql_query = None
-                    for i, msg in enumerate(response["messages"]):
-                        # Check if this is a ToolMessage with execute_sql
-                        if hasattr(msg, "tool_call_id") and hasattr(msg, "name") and msg.name == "execute_sql":
-                            # Extract SQL query from the tool message content
-                            if hasattr(msg, "content") and "```sql\n" in msg.content:
-                                sql_parts = msg.content.split("```sql\n")
-                                if len(sql_parts) > 1:
-                                    sql_query = sql_parts[1].split("\n```")[0].strip()
-                                    # Store the SQL query in session state for display
-                                    st.session_state.last_sql_query = sql_query
-                        # Also check for tool calls in AIMessage
-                        elif hasattr(msg, "tool_calls") and msg.tool_calls:
-                            for tool_call in msg.tool_calls:
-                                if tool_call.get("name") == "execute_sql" and "sql_query" in tool_call.get("args", {}):
-                                    sql_query = tool_call["args"]["sql_query"]
-                                    st.session_state.last_sql_query = sql_query
+        # 3. Get the assistant's response and display it as it is produced.
+        with st.chat_message("assistant"):
+            status = st.status("Thinking...", expanded=False) if stream_responses else None
+            sql_box = st.empty()
+            answer_box = st.empty()
+            result_box = st.empty()
+            streamed = {"text": ""}
+
+            def on_event(event):
+                # Render tokens, tool calls and the generated SQL as they arrive
+                if event["type"] == "token":
+                    streamed["text"] += event["text"]
+                    answer_box.markdown(streamed["text"] + "▌")
+                elif event["type"] == "tool_call":
+                    # Text before a tool call was the model thinking aloud
+                    streamed["text"] = ""
+                    answer_box.empty()
+                    status.update(label=f"Running `{event['name']}`...")
+                    if event["name"] != "execute_sql":
+                        status.write(f"🔧 `{event['name']}`")
+                elif event["type"] == "sql":
+                    status.write("🔧 `execute_sql`")
+                    status.code(event["sql"], language="sql")
+                    sql_box.code(event["sql"], language="sql")
+                elif event["type"] == "tool_result":
+                    preview = event["content"]
+                    status.caption(preview[:500] + ("..." if len(preview) > 500 else ""))
+
+            # Use a 'try...except' block to gracefully handle potential errors (e.g., network issues, API errors).
+            sql_query, sql_result = None, None
+            try:
+                # Convert the message history to the format expected by the agent
+                messages = []
+                for msg in st.session_state.messages:
+                    if msg["role"] == "user":
+                        messages.append(HumanMessage(content=msg["content"]))
+                    elif msg["role"] == "assistant":
+                        messages.append(AIMessage(content=msg["content"]))
+
+                cache = get_question_cache() if use_question_cache else None
+                cancel_event = threading.Event()
+
+                def work(put_event):
+                    return answer_question(
+                        agent, messages, prompt, sel, cache=cache, fuzzy=fuzzy_match,
+                        on_event=put_event if stream_responses else None, cancel_event=cancel_event,
+                        schema_token_budget=schema_token_budget,
+                        result_row_budget=result_row_budget, result_char_budget=result_char_budget,
+                    )
+
+                if stream_responses:
+                    outcome = _run_cancellable(work, on_event, cancel_event)
+                    status.update(label="Done", state="complete")
                 else:
-                    answer = "I'm sorry, I couldn't generate a response."
+                    # Show a spinner while waiting for the response
+                    with st.spinner("Thinking..."):
+                        outcome = _run_cancellable(work, on_event, cancel_event)
+                answer = outcome["answer"]
+                sql_query = outcome["sql"]
+                sql_result = outcome["result"]
 
-        except Exception as e:
-            # If any error occurs, create an error message to display to the user.
-            answer = f"An error occurred: {e}"
+            except Exception as e:
+                # If any error occurs, create an error message to display to the user.
+                answer = f"An error occurred: {e}"
+                if status is not None:
+                    status.update(label="Error", state="error")
 
-        # 4. Display the assistant's response.
-        with st.chat_message("assistant"):
-            # Check if we have a SQL query from the tool message
-            sql_query = None
-            if hasattr(st.session_state, "last_sql_query"):
-                sql_query = st.session_state.last_sql_query
-                # Clear it after use
-                del st.session_state.last_sql_query
-
-            # Display the extracted SQL query in a code block if found
+            # 4. Display the extracted SQL query in a code block if found, then the full answer
             if sql_query:
-                st.code(sql_query, language="sql")
-            
-            # Display the full answer
-            st.markdown(answer)
-        
+                sql_box.code(sql_query, language="sql")
+            answer_box.markdown(answer)
+            # The full result of the last query, which the model only saw in part
+            rows = (sql_result or {}).get("results") or []
+            if rows and "error" not in rows[0]:
+                result_box.dataframe(rows)
+                if sql_result.get("summary"):
+                    st.caption(summary_caption(sql_result["summary"]))
+                # Only when the rows shown came from that SQL (not from search_text)
+                if sql_query and sql_result.get("query") == sql_query and is_read_only_query(sql_query, sel):
+                    # Kept for the chart below, which survives reruns
+                    st.session_state.last_query = {"sql": sql_query, "db": sel}
+                    # Every row of the query, not only the page above; no rerun, so the answer stays
+                    for fmt, column in zip(available_formats(), st.columns(len(EXPORT_FORMATS))):
+                        extension, mime = EXPORT_FORMATS[fmt]
+                        column.download_button(
+                            f"Download {fmt.upper()}",
+                            data=lambda fmt=fmt: spool(lambda out: export_query_result(sql_query, sel, out, fmt)),
+                            file_name=f"result{extension}",
+                            mime=mime,
+                            on_click="ignore",
+                        )
+
         # 5. Add the assistant's response to the message history list.
-        st.session_state.messages.append({"role": "assistant", "content": answer})
\ No newline at end of file
+        st.session_state.messages.append({"role": "assistant", "content": answer})
+
+        # Index the tables this query scanned, in the background
+        if auto_index and sql_query:
+            schedule_auto_index(sel, index_budget_mb * 1024 * 1024)
+
+    chart_last_result(sel)
+
+
+def summary_caption(summary: Dict[str, Any]) -> str:
+    """
+    Where a result answered from a summary table came from, and how old it is
+    """
+    return (
+        f"Answered from summary `{summary['name']}`: {summary['groups']:,} groups over "
+        f"{summary['base_rows']:,} rows of {summary['table_name']}, "
+        f"refreshed {format_age(time.time() - summary['refreshed_at'])}"
+    )
+
+
+def chart_last_result(sel):
+    """
+    Chart the result of the assistant's last read-only query. The rows are
+    read again into typed columns (see columnar.py), up to CHART_MAX_ROWS,
+    only once the user asks for the chart, and under the agent's budgets.
+    """
+    last = st.session_state.get("last_query")
+    if not last or last["db"] != sel:
+        return
+    with st.expander("📈 Chart this result"):
+        key = (last["db"], last["sql"])
+        if st.session_state.get("chart_data", (None,))[0] != key:
+            # An expander's body always runs, so the query waits for a click
+            if not st.button("Load chart data", key="load_chart"):
+                return
+            st.session_state.chart_data = (key, query_frame(last["sql"], last["db"], max_rows=CHART_MAX_ROWS))
+        result = st.session_state.chart_data[1]
+        if "error" in result:
+            st.error(result["error"])
+            return
+        frame = result["frame"]
+        default = default_chart(frame)
+        if default is None:
+            st.caption("The result has no numeric column to chart.")
+            return
+        c1, c2, c3 = st.columns([1, 1, 2])
+        kind = c1.selectbox("Chart", CHART_KINDS, index=CHART_KINDS.index(default["kind"]))
+        x = c2.selectbox("X axis", list(frame.columns), index=list(frame.columns).index(default["x"]))
+        values = [c for c in numeric_columns(frame) if c != x]
+        y = c3.multiselect("Values", values, default=[c for c in default["y"] if c != x])
+        if y:
+            st.pyplot(plot_frame(frame, kind, x, y))
+        if result["has_more"]:
+            st.caption(f"Charting the first {CHART_MAX_ROWS:,} rows.")
@@ -0,0 +1,230 @@
+"""
+Columnar fetch of query results into NumPy arrays and DataFrames.
+
+The dict path (execute_sql_query, then pd.DataFrame(rows)) keeps a dict per
+row and an object per cell until the DataFrame is built, and pandas then
+has to infer every column's type again. Here rows are fetched in batches,
+each batch is transposed into one tuple per column and converted at once to
+an int64, float64, bool or datetime64 array, so the only objects kept are
+the strings and blobs of text columns.
+
+Column kinds come from the import plan or the declared column types (a
+query's types are read through a temporary view). The values of a batch
+still decide: a column declared INTEGER that holds a real becomes float64,
+one holding text stays an object column, as SQLite's typing allows.
+Integer columns with NULLs are returned as masked arrays (nullable Int64 in
+a DataFrame), real columns use NaN and dates NaT.
+"""
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from importer import plan_from_table, quote_ident
+
+# Rows fetched and converted per batch
+FETCH_BATCH_ROWS = 10_000
+
+# Kinds of columns: "int", "float", "bool", "datetime" (epoch seconds),
+# "text", "blob" or "" when unknown
+_TEMP_VIEW = "_dbassist_columnar"
+
+Chunk = Tuple[np.ndarray, Optional[np.ndarray]]
+
+
+def declared_kind(declared: Optional[str]) -> str:
+    """
+    Kind of a declared column type, by SQLite's affinity rules
+    """
+    affinity = (declared or "").upper()
+    if not affinity:
+        return ""
+    if "INT" in affinity:
+        return "int"
+    if any(t in affinity for t in ("CHAR", "CLOB", "TEXT")):
+        return "text"
+    if "BLOB" in affinity:
+        return "blob"
+    if any(t in affinity for t in ("REAL", "FLOA", "DOUB")):
+        return "float"
+    return ""
+
+
+def _plan_kind(column: Dict[str, Any]) -> str:
+    if column["encoding"] == "epoch":
+        return "datetime"
+    if column["kind"] in ("int", "float", "bool"):
+        return column["kind"]
+    return "text"
+
+
+def table_kinds(conn: sqlite3.Connection, table: str) -> Dict[str, str]:
+    """
+    Column name -> kind of a table or view, from its import plan or its
+    declared column types
+    """
+    plan = plan_from_table(conn, table)
+    if plan is not None:
+        return {c["name"]: _plan_kind(c) for c in plan["columns"]}
+    rows = conn.execute(f"PRAGMA table_info({quote_ident(table)})").fetchall()
+    return {r[1]: declared_kind(r[2]) for r in rows}
+
+
+def query_kinds(conn: sqlite3.Connection, query: str) -> List[str]:
+    """
+    Kinds of a query's result columns from their declared types, read
+    through a temporary view. Computed columns have no declared type ("");
+    an empty list if the query cannot be wrapped in a view.
+    """
+    try:
+        conn.execute(f"CREATE TEMP VIEW {_TEMP_VIEW} AS {query.strip().rstrip(';')}")
+    except sqlite3.Error:
+        return []
+    try:
+        rows = conn.execute(f"PRAGMA temp.table_info({_TEMP_VIEW})").fetchall()
+    finally:
+        conn.execute(f"DROP VIEW temp.{_TEMP_VIEW}")
+    return [declared_kind(r[2]) for r in rows]
+
+
+def _convert(values: Sequence[Any], kind: str) -> Chunk:
+    """
+    (array, NULL mask or None) of one batch of a column
+    """
+    if kind in ("text", "blob"):
+        return np.array(values, dtype=object), None
+    types = set(map(type, values))
+    nulls = type(None) in types
+    types.discard(type(None))
+    if types <= {int} and kind != "float":
+        # Also batches of only NULLs, which then fit any other batch
+        if not nulls:
+            return np.fromiter(values, dtype=np.int64, count=len(values)), None
+        array = np.array(values, dtype=object)
+        mask = array == None  # noqa: E711 (elementwise)
+        array[mask] = 0
+        try:
+            return array.astype(np.int64), mask
+        except OverflowError:
+            pass
+    if types <= {int, float}:
+        return np.array(values, dtype=np.float64), None
+    return np.array(values, dtype=object), None
+
+
+def _concat(chunks: List[Chunk]) -> np.ndarray:
+    """
+    One column from its batches, widened to the type every batch fits:
+    int64 (masked if it has NULLs), float64 or object
+    """
+    dtypes = {array.dtype for array, _ in chunks}
+    if dtypes == {np.dtype(np.int64)}:
+        values = np.concatenate([array for array, _ in chunks])
+        if all(mask is None for _, mask in chunks):
+            return values
+        mask = np.concatenate([np.zeros(len(a), bool) if m is None else m for a, m in chunks])
+        return np.ma.MaskedArray(values, mask=mask)
+    if np.dtype(object) in dtypes:
+        parts = []
+        for array, mask in chunks:
+            if array.dtype == np.float64:
+                mask = np.isnan(array)  # SQLite has no NaN, only NULL
+            array = array.astype(object)
+            if mask is not None:
+                array[mask] = None
+            parts.append(array)
+        return np.concatenate(parts)
+    parts = []
+    for array, mask in chunks:
+        array = array.astype(np.float64)
+        if mask is not None:
+            array[mask] = np.nan
+        parts.append(array)
+    return np.concatenate(parts)
+
+
+def fetch_arrays(
+    cursor: sqlite3.Cursor,
+    kinds: Optional[Sequence[str]] = None,
+    max_rows: Optional[int] = None,
+    batch_rows: int = FETCH_BATCH_ROWS,
+) -> Dict[str, np.ndarray]:
+    """
+    Read the remaining rows of an executed cursor into one array per column.
+
+    Args:
+        cursor: Cursor of an executed SELECT
+        kinds: Kind of every result column (see table_kinds, query_kinds);
+            unknown kinds are taken from the values
+        max_rows: Stop after this many rows
+        batch_rows: Rows fetched and converted at a time
+
+    Returns:
+        Column name -> int64, float64 or object array; int64 columns with
+        NULLs are masked arrays
+    """
+    columns = [d[0] for d in cursor.description]
+    kinds = list(kinds or []) + [""] * (len(columns) - len(kinds or []))
+    chunks: List[List[Chunk]] = [[] for _ in columns]
+    total = 0
+    while max_rows is None or total < max_rows:
+        size = batch_rows if max_rows is None else min(batch_rows, max_rows - total)
+        batch = cursor.fetchmany(size)
+        if not batch:
+            break
+        total += len(batch)
+        for column, values, kind in zip(chunks, zip(*batch), kinds):
+            column.append(_convert(values, kind))
+    arrays = {}
+    for name, column, kind in zip(columns, chunks, kinds):
+        arrays[name] = _concat(column) if column else _convert((), kind)[0]
+    return arrays
+
+
+def to_frame(arrays: Dict[str, np.ndarray], kinds: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    DataFrame of fetched columns: masked int64 columns become nullable
+    Int64, epoch "datetime" columns datetime64 and "bool" columns boolean
+    """
+    kinds = list(kinds or []) + [""] * (len(arrays) - len(kinds or []))
+    data = {}
+    for (name, array), kind in zip(arrays.items(), kinds):
+        mask = np.ma.getmaskarray(array) if isinstance(array, np.ma.MaskedArray) else None
+        values = np.ma.getdata(array)
+        if values.dtype == np.int64 and kind == "datetime":
+            values = values.astype("datetime64[s]")
+            if mask is not None:
+                values[mask] = np.datetime64("NaT")
+            data[name] = values
+        elif values.dtype == np.int64 and kind == "bool":
+            data[name] = pd.arrays.BooleanArray(values != 0, np.zeros(len(values), bool) if mask is None else mask)
+        elif mask is not None:
+            data[name] = pd.arrays.IntegerArray(values, mask)
+        else:
+            data[name] = values
+    return pd.DataFrame(data, columns=list(arrays))
+
+
+def fetch_frame(
+    cursor: sqlite3.Cursor,
+    kinds: Optional[Sequence[str]] = None,
+    max_rows: Optional[int] = None,
+    batch_rows: int = FETCH_BATCH_ROWS,
+) -> pd.DataFrame:
+    """
+    DataFrame of the remaining rows of an executed cursor, see fetch_arrays
+    """
+    return to_frame(fetch_arrays(cursor, kinds, max_rows, batch_rows), kinds)
+
+
+def rows_to_frame(
+    rows: Sequence[Sequence[Any]], columns: List[str], kinds: Optional[Sequence[str]] = None
+) -> pd.DataFrame:
+    """
+    DataFrame of rows already fetched as tuples (e.g. a Browse page),
+    converted column by column like fetch_frame
+    """
+    kinds = list(kinds or []) + [""] * (len(columns) - len(kinds or []))
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    return to_frame({c: _concat([_convert(v, k)]) for c, v, k in zip(columns, values, kinds)}, kinds)
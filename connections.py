@@ -0,0 +1,388 @@
+"""
+SQLite connection helpers shared by db_tools and the Streamlit pages.
+
+Opening a fresh connection for every call throws away SQLite's page cache and
+forces the schema to be parsed again. The pool below keeps a few warm
+connections per database file. Each connection is handed to one thread at a
+time, so a connection opened during one Streamlit rerun is reused by the next.
+
+Several sessions may use the same file at once. Databases run in WAL mode,
+where readers never wait for a writer. Read paths borrow read_connection
+(opened with mode=ro, so they cannot take the write lock), and every write
+goes through write_connection, which queues the writers of a database in
+this process one after the other. SQLite's busy timeout and retry_on_busy
+cover writers in other processes.
+"""
+import atexit
+import os
+import pathlib
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+# Local stores owned by the app itself (question cache, query log, ...)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+# Pool sizing. Idle connections older than POOL_IDLE_TIMEOUT seconds are closed.
+POOL_MAX_IDLE_PER_DB = 4
+POOL_MAX_IDLE_TOTAL = 32
+POOL_IDLE_TIMEOUT = 300.0
+
+# Seconds SQLite waits for a lock held by another connection (busy timeout)
+BUSY_TIMEOUT = 5.0
+# Seconds a writer waits for its turn in the write queue of a database
+WRITE_QUEUE_TIMEOUT = 120.0
+# Attempts of retry_on_busy, with exponential backoff from WRITE_RETRY_DELAY seconds
+WRITE_RETRIES = 4
+WRITE_RETRY_DELAY = 0.05
+
+# Applied once, when a pooled connection is opened.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-32000",  # ~32 MB page cache
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def resolve_db_path(db_path: str) -> str:
+    """
+    Normalize a database path so that "db/x.db" and "./db/x.db" share a pool
+    """
+    return os.path.abspath(db_path)
+
+
+class ConnectionPool:
+    """
+    Bounded pool of warm SQLite connections keyed by database file and
+    access mode (read-write or read-only).
+    """
+
+    def __init__(
+        self,
+        max_idle_per_db: int = POOL_MAX_IDLE_PER_DB,
+        max_idle_total: int = POOL_MAX_IDLE_TOTAL,
+        idle_timeout: float = POOL_IDLE_TIMEOUT,
+    ):
+        self.max_idle_per_db = max_idle_per_db
+        self.max_idle_total = max_idle_total
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # (path, read_only) -> stack of (connection, released_at); the warmest is on top
+        self._idle: Dict[Tuple[str, bool], List[Tuple[sqlite3.Connection, float]]] = {}
+        self._in_use: Dict[Tuple[str, bool], Set[sqlite3.Connection]] = {}
+        # In-use connections of a closed database, dropped on release
+        self._discard: Set[sqlite3.Connection] = set()
+
+    def _open(self, path: str, read_only: bool = False) -> sqlite3.Connection:
+        if read_only:
+            # mode=ro fails on a missing file instead of creating an empty database
+            uri = pathlib.Path(path).as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            try:
+                conn.execute(pragma).fetchall()
+            except sqlite3.Error:
+                # e.g. WAL is not available on read-only media
+                pass
+        return conn
+
+    def acquire(self, db_path: str, read_only: bool = False) -> sqlite3.Connection:
+        """
+        Take a connection for the current thread, opening one if none is idle
+        """
+        key = (resolve_db_path(db_path), read_only)
+        with self._lock:
+            self._evict_expired_locked(time.monotonic())
+            idle = self._idle.get(key)
+            conn = idle.pop()[0] if idle else None
+            if conn is not None:
+                self._in_use.setdefault(key, set()).add(conn)
+        if conn is None:
+            conn = self._open(key[0], read_only)
+            with self._lock:
+                self._in_use.setdefault(key, set()).add(conn)
+        return conn
+
+    def release(self, db_path: str, conn: sqlite3.Connection, read_only: bool = False) -> None:
+        """
+        Return a connection to the pool, rolling back anything left open
+        """
+        key = (resolve_db_path(db_path), read_only)
+        keep = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            keep = False
+
+        to_close = []
+        with self._lock:
+            in_use = self._in_use.get(key)
+            if in_use is not None:
+                in_use.discard(conn)
+                if not in_use:
+                    del self._in_use[key]
+            if conn in self._discard:
+                self._discard.discard(conn)
+                keep = False
+            if keep:
+                idle = self._idle.setdefault(key, [])
+                idle.append((conn, time.monotonic()))
+                if len(idle) > self.max_idle_per_db:
+                    to_close.append(idle.pop(0)[0])
+                to_close.extend(self._trim_total_locked())
+            else:
+                to_close.append(conn)
+        for c in to_close:
+            self._close_quietly(c)
+
+    def close(self, db_path: str) -> None:
+        """
+        Close every connection to a database file, e.g. before deleting it
+        """
+        path = resolve_db_path(db_path)
+        idle = []
+        with self._lock:
+            for key in ((path, False), (path, True)):
+                idle.extend(self._idle.pop(key, []))
+                self._discard.update(self._in_use.get(key, set()))
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def close_all(self) -> None:
+        with self._lock:
+            paths = {path for path, _ in list(self._idle) + list(self._in_use)}
+        for path in paths:
+            self.close(path)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "idle": sum(len(v) for v in self._idle.values()),
+                "in_use": sum(len(v) for v in self._in_use.values()),
+                "read_only": sum(len(v) for k, v in self._in_use.items() if k[1])
+                + sum(len(v) for k, v in self._idle.items() if k[1]),
+                "databases": len({path for path, _ in set(self._idle) | set(self._in_use)}),
+            }
+
+    def _evict_expired_locked(self, now: float) -> None:
+        expired = []
+        for key in list(self._idle):
+            idle = self._idle[key]
+            keep = [(c, t) for c, t in idle if now - t < self.idle_timeout]
+            expired.extend(c for c, t in idle if now - t >= self.idle_timeout)
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        for conn in expired:
+            self._close_quietly(conn)
+
+    def _trim_total_locked(self) -> List[sqlite3.Connection]:
+        # Drop the least recently released connections across all databases
+        entries = [(t, key, c) for key, idle in self._idle.items() for c, t in idle]
+        excess = len(entries) - self.max_idle_total
+        if excess <= 0:
+            return []
+        entries.sort(key=lambda e: e[0])
+        dropped = []
+        for _, key, conn in entries[:excess]:
+            self._idle[key] = [(c, t) for c, t in self._idle[key] if c is not conn]
+            if not self._idle[key]:
+                del self._idle[key]
+            dropped.append(conn)
+        return dropped
+
+    @staticmethod
+    def _close_quietly(conn: sqlite3.Connection) -> None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+_pool = ConnectionPool()
+atexit.register(_pool.close_all)
+
+
+@contextmanager
+def get_connection(db_path: str) -> Iterator[sqlite3.Connection]:
+    """
+    Borrow a pooled connection for the duration of a ``with`` block.
+
+    Any transaction still open when the block exits is rolled back, so callers
+    that write must commit explicitly.
+    """
+    conn = _pool.acquire(db_path)
+    try:
+        yield conn
+    finally:
+        _pool.release(db_path, conn)
+
+
+@contextmanager
+def read_connection(db_path: str) -> Iterator[sqlite3.Connection]:
+    """
+    Borrow a pooled read-only connection (mode=ro) for a ``with`` block.
+
+    In WAL mode it reads the last committed data without waiting for a
+    writer. Writing through it fails with "attempt to write a readonly
+    database".
+    """
+    conn = _pool.acquire(db_path, read_only=True)
+    try:
+        yield conn
+    finally:
+        _pool.release(db_path, conn, read_only=True)
+
+
+class WriteQueue:
+    """
+    First-come, first-served lock for the writers of one database.
+
+    SQLite allows one writer at a time, and a writer that finds the lock
+    taken sleeps and polls, so under load late writers can overtake early
+    ones or give up with "database is locked". Waiting here instead keeps
+    the order and leaves SQLite's lock uncontested within this process.
+    The owning thread may enter again (e.g. an import that creates an index).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._waiters: Deque[object] = deque()
+        self._owner: Optional[int] = None
+        self._depth = 0
+        self.writes = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def acquire(self, timeout: Optional[float] = WRITE_QUEUE_TIMEOUT) -> bool:
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return True
+            ticket = object()
+            self._waiters.append(ticket)
+            start = time.perf_counter()
+            ready = self._cond.wait_for(lambda: self._owner is None and self._waiters[0] is ticket, timeout)
+            self._waiters.remove(ticket)
+            if not ready:
+                self.timeouts += 1
+                self._cond.notify_all()
+                return False
+            waited = time.perf_counter() - start
+            if waited > 0.001:
+                self.waited += 1
+                self.wait_seconds += waited
+            self._owner, self._depth = me, 1
+            self.writes += 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "writes": self.writes,
+                "waited": self.waited,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "timeouts": self.timeouts,
+                "queued": len(self._waiters),
+            }
+
+
+_write_queues: Dict[str, WriteQueue] = {}
+_write_queues_lock = threading.Lock()
+
+
+def _write_queue(db_path: str) -> WriteQueue:
+    path = resolve_db_path(db_path)
+    with _write_queues_lock:
+        queue = _write_queues.get(path)
+        if queue is None:
+            queue = _write_queues[path] = WriteQueue()
+        return queue
+
+
+@contextmanager
+def write_connection(db_path: str, timeout: Optional[float] = WRITE_QUEUE_TIMEOUT) -> Iterator[sqlite3.Connection]:
+    """
+    Borrow a pooled read-write connection once every earlier writer of the
+    database in this process is done.
+
+    As with get_connection, the caller commits; anything left open is
+    rolled back.
+
+    Raises:
+        sqlite3.OperationalError: the turn did not come within timeout seconds
+    """
+    queue = _write_queue(db_path)
+    if not queue.acquire(timeout):
+        raise sqlite3.OperationalError(
+            f"database is locked: another write to this database did not finish within {timeout:.0f}s"
+        )
+    try:
+        with get_connection(db_path) as conn:
+            yield conn
+    finally:
+        queue.release()
+
+
+def is_busy_error(error: Exception) -> bool:
+    """
+    Whether an error means another connection held the lock (worth retrying)
+    """
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def retry_on_busy(work: Callable[[], Any], retries: int = WRITE_RETRIES, delay: float = WRITE_RETRY_DELAY) -> Any:
+    """
+    Call work(), calling it again with exponential backoff and jitter while
+    it fails because the database is locked, e.g. by a writer in another
+    process that outlasted the busy timeout. work must not have committed
+    anything when it raises.
+    """
+    for attempt in range(retries):
+        try:
+            return work()
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == retries - 1:
+                raise
+            time.sleep(delay * (2 ** attempt) * (1 + random.random()))
+
+
+def close_connections(db_path: str) -> None:
+    """
+    Close all pooled connections to a database file
+    """
+    _pool.close(db_path)
+
+
+def pool_stats() -> Dict[str, int]:
+    return _pool.stats()
+
+
+def write_queue_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Per-database counters of the write queues: writes, writes that had to
+    wait, total wait time, timeouts and writers currently waiting
+    """
+    with _write_queues_lock:
+        queues = dict(_write_queues)
+    return {path: queue.stats() for path, queue in queues.items()}
@@ -1,8 +1,15 @@
 # Import our database tools
-from db_tools import init_database, create_table, getAllDB, getTablesFromDB, getDataFromTable, delete_db_file
+from db_tools import (
+    init_database, create_table, create_tables, getAllDB, getTablesFromDB, get_table_page, count_table_rows,
+    delete_db_file, list_db_files, export_table,
+)
+import pandas as pd
 import streamlit as st
 import os
-import chatbot
+from columnar import rows_to_frame
+from export import EXPORT_FORMATS, available_formats, spool
+from importer import default_table_name
+from table_browser import BROWSE_PAGE_ROWS, FILTER_OPERATORS
 
 
 def db_init():
@@ -27,7 +34,7 @@ def db_init():
         return
 
     # Find all .db files
-    db_files = [f for f in os.listdir(db_folder) if f.endswith('.db')]
+    db_files = list_db_files(db_folder)
     if not db_files:
         st.info("No .db files found in the 'db' folder.")
         return
@@ -83,7 +90,7 @@ def browseDB():
     st.title("Browse")
     
     db_folder = os.path.join(os.path.dirname(__file__) or ".", "db")
-    db_files = [f for f in os.listdir(db_folder) if f.endswith('.db')]
+    db_files = list_db_files(db_folder)
     dbs = getAllDB(db_folder, db_files)
     # Let user select a database to inspect
     sel = st.selectbox("Select a database to inspect", [r['filename'] for r in dbs])
@@ -95,23 +102,88 @@ def browseDB():
     if uploaded_file is not None:
         st.write("File uploaded successfully!")
 
+        # Storage options for the typed import
+        epoch_dates = st.checkbox(
+            "Store dates as epoch integers",
+            help="Smaller and faster to compare than ISO text; read them back with date(col, 'unixepoch')",
+        )
+        dictionary = st.checkbox(
+            "Dictionary-encode repeated text",
+            help="Columns with few distinct values are stored as integer keys into a lookup table, behind a view",
+        )
+        full_text = st.checkbox(
+            "Full-text index free-form text",
+            help="Notes, comments and similar columns get an FTS5 index the assistant can search by words",
+        )
+
+        # What to do when the table already exists
+        mode = st.radio(
+            "If the table exists",
+            ["replace", "append", "upsert"],
+            format_func={"replace": "Replace it", "append": "Append rows", "upsert": "Upsert rows on key columns"}.get,
+            horizontal=True,
+            help="Append and upsert keep the table and its indexes, so a daily delta only costs its own size",
+        )
+        key_columns, skip_unchanged = None, False
+        if mode == "upsert":
+            header = list(pd.read_csv(uploaded_file, nrows=0).columns)
+            uploaded_file.seek(0)
+            key_columns = st.multiselect("Key columns", header, help="Columns that identify a row")
+            skip_unchanged = st.checkbox(
+                "Skip unchanged rows",
+                help="Keeps a content hash per row so rows that did not change are not rewritten",
+            )
+
         # Add a button to create the table
         create_tb_button = st.button("Create Table", help="Create table from uploaded CSV")
 
         # Create table if button is clicked
         if create_tb_button:
-                with st.spinner("Creating table..."):
-                    # Save uploaded file temporarily
-                    temp_path = f"temp_{uploaded_file.name}"
-                    with open(temp_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
+                progress_bar = st.progress(0.0)
+                progress_text = st.empty()
 
-                    try:
-                        create_table(sel, temp_path, tb_name)
-                        st.success(f"Table '{tb_name}' created successfully!")
+                def on_progress(p):
+                    if p.get("total_bytes"):
+                        progress_bar.progress(min(p["bytes_read"] / p["total_bytes"], 1.0))
+                    progress_text.caption(
+                        f"{p['rows']:,} rows | {p['bytes_read'] / 1_048_576:.1f} MB read | "
+                        f"{p['rows_per_sec']:,.0f} rows/s"
+                    )
 
-                        # Clean up temp file
-                        os.remove(temp_path)
+                with st.spinner("Creating table..."):
+                    try:
+                        # Stream straight from the upload buffer; no temp file copy
+                        stats = create_table(
+                            sel, uploaded_file, tb_name, progress_callback=on_progress,
+                            epoch_dates=epoch_dates, dictionary=dictionary,
+                            mode=mode, key_columns=key_columns, skip_unchanged=skip_unchanged,
+                            full_text=full_text,
+                        )
+                        progress_bar.progress(1.0)
+                        if mode == "replace":
+                            st.success(
+                                f"Table '{tb_name}' created successfully! "
+                                f"({stats['rows']:,} rows in {stats['elapsed']:.1f}s)"
+                            )
+                        else:
+                            st.success(
+                                f"Table '{tb_name}' updated: {stats['written']:,} of {stats['rows']:,} rows "
+                                f"written in {stats['elapsed']:.1f}s"
+                            )
+                        report = stats["report"]
+                        if report["default_bytes"]:
+                            st.caption(
+                                f"Typed storage: {report['stored_bytes'] / 1_048_576:.1f} MB of values instead of "
+                                f"{report['default_bytes'] / 1_048_576:.1f} MB "
+                                f"({report['bytes_saved'] / report['default_bytes']:.0%} saved)"
+                            )
+                            st.dataframe(report["columns"], hide_index=True)
+                        if full_text:
+                            indexed = stats["full_text"]
+                            st.caption(
+                                f"Full-text indexed: {', '.join(indexed)}" if indexed
+                                else "No free-form text columns to full-text index"
+                            )
 
                         # Attempt to refresh the app so new table appears
                         try:
@@ -134,9 +206,55 @@ def browseDB():
                                 pass
                     except Exception as e:
                         st.error(f"Error creating table: {str(e)}")
-                        # Clean up temp file
-                        if os.path.exists(temp_path):
-                            os.remove(temp_path)
+
+    st.header("Import several CSV files")
+    batch_files = st.file_uploader(
+        "Choose CSV files", type=['csv'], accept_multiple_files=True, key='batch_files',
+        help="Files are parsed in parallel, one table per file",
+    )
+    if batch_files:
+        batch_names = [
+            st.text_input(f"Table for {f.name}", value=default_table_name(f.name), key=f"batch_tb_{i}")
+            for i, f in enumerate(batch_files)
+        ]
+        batch_epoch = st.checkbox("Store dates as epoch integers", key='batch_epoch')
+        batch_dictionary = st.checkbox("Dictionary-encode repeated text", key='batch_dictionary')
+        batch_full_text = st.checkbox("Full-text index free-form text", key='batch_full_text')
+
+        if st.button("Create Tables", help="Create one table per uploaded CSV"):
+            rows = []
+            for f in batch_files:
+                row = st.container()
+                rows.append((row.progress(0.0, text=f.name), row.empty()))
+
+            def on_batch_progress(index, p):
+                bar, text = rows[index]
+                if p["status"] == "failed":
+                    bar.progress(0.0, text=f"{batch_files[index].name}: failed")
+                    text.error(p["error"])
+                    return
+                done = p["status"] == "done"
+                if done or p.get("total_bytes"):
+                    fraction = 1.0 if done else min(p["bytes_read"] / p["total_bytes"], 1.0)
+                    bar.progress(fraction, text=f"{batch_files[index].name} -> {p['table']}")
+                text.caption(
+                    f"{p['rows']:,} rows | {p['bytes_read'] / 1_048_576:.1f} MB read | "
+                    f"{p['elapsed']:.1f}s" + (" | done" if done else "")
+                )
+
+            with st.spinner("Creating tables..."):
+                try:
+                    results = create_tables(
+                        sel, list(zip(batch_files, batch_names)), progress_callback=on_batch_progress,
+                        epoch_dates=batch_epoch, dictionary=batch_dictionary, full_text=batch_full_text,
+                    )
+                    done = [r for r in results if r["status"] == "done"]
+                    if len(done) == len(results):
+                        st.success(f"{len(done)} tables created ({sum(r['rows'] for r in done):,} rows)")
+                    else:
+                        st.warning(f"{len(done)} of {len(results)} tables created; see the errors above")
+                except Exception as e:
+                    st.error(f"Error creating tables: {str(e)}")
 
     if sel:
         sel_path = next(r['path'] for r in dbs if r['filename'] == sel)
@@ -153,14 +271,78 @@ def browseDB():
 
         tsel = st.selectbox("Select a table to preview", tables)
         if tsel:
-            cols, data = getDataFromTable(sel_path, tsel)
-            st.write(f"Preview of {tsel} (up to 20 rows)")
-            if cols:
-                import pandas as pd
-                df = pd.DataFrame(data, columns=cols)
-                st.dataframe(df)
-            else:
-                st.write("No columns to display.")
+            browse_table(sel_path, tsel)
+
+
+def browse_table(sel_path, tsel):
+    """
+    Page through a table with sorting and column filters. Pages are read
+    with keyset pagination, so the last page loads as fast as the first.
+    """
+    first = get_table_page(sel_path, tsel, page_size=1, prefetch=False)
+    if "error" in first:
+        st.error(f"Error opening table: {first['error']}")
+        return
+    columns = first["columns"]
+
+    c1, c2, c3 = st.columns([2, 1, 1])
+    sort = c1.selectbox("Sort by", [None] + columns, format_func=lambda c: "(table order)" if c is None else c)
+    descending = c2.checkbox("Descending")
+    page_size = c3.selectbox("Rows per page", [BROWSE_PAGE_ROWS, 100, 500], index=0)
+
+    with st.expander("Filters"):
+        filters = []
+        for i in range(3):
+            f1, f2, f3 = st.columns([2, 1, 2])
+            column = f1.selectbox("Column", [None] + columns, key=f"browse_col_{i}", label_visibility="collapsed")
+            op = f2.selectbox("Operator", list(FILTER_OPERATORS), key=f"browse_op_{i}", label_visibility="collapsed")
+            value = f3.text_input(
+                "Value", key=f"browse_val_{i}", label_visibility="collapsed", disabled=op in ("is null", "is not null")
+            )
+            if column is not None:
+                filters.append({"column": column, "op": op, "value": value})
+
+    # Tokens of the pages visited; a new table, sort or filter starts over
+    spec = (sel_path, tsel, sort, descending, page_size, str(filters))
+    if st.session_state.get("browse_spec") != spec:
+        st.session_state.browse_spec = spec
+        st.session_state.browse_tokens = [None]
+    tokens = st.session_state.browse_tokens
+
+    page = get_table_page(sel_path, tsel, page_size, sort, descending, filters, tokens[-1])
+    if "error" in page:
+        st.error(page["error"])
+        return
+
+    count = count_table_rows(sel_path, tsel, filters)
+    if "error" not in count:
+        total = f"{count['rows']:,}" if count["exact"] else f"~{count['rows']:,}"
+        st.caption(f"{total} rows" + (" (estimated)" if not count["exact"] else ""))
+    first_row = (len(tokens) - 1) * page_size + 1
+    st.write(f"Rows {first_row:,}-{first_row + len(page['rows']) - 1:,} of {tsel}")
+    st.dataframe(rows_to_frame(page["rows"], page["columns"], page["kinds"]))
+
+    b1, b2, b3 = st.columns([1, 1, 4])
+    if b1.button("◀ Prev", disabled=len(tokens) == 1):
+        tokens.pop()
+        st.rerun()
+    if b2.button("Next ▶", disabled=not page["has_more"]):
+        tokens.append(page["next_page_token"])
+        st.rerun()
+    if not page["keyset"]:
+        b3.caption("This view has no key, so later pages are read with OFFSET and get slower.")
+
+    # Every row with the current sort and filters, streamed to a file when clicked
+    e1, e2 = st.columns([1, 3])
+    fmt = e1.selectbox("Export format", available_formats())
+    extension, mime = EXPORT_FORMATS[fmt]
+    e2.download_button(
+        f"Download {tsel}{extension}",
+        data=lambda: spool(lambda out: export_table(sel_path, tsel, out, fmt, sort, descending, filters)),
+        file_name=f"{tsel}{extension}",
+        mime=mime,
+        on_click="ignore",
+    )
 
 
 
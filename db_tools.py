@@ -1,177 +1,977 @@
+import base64
+import hashlib
+import json
 import sqlite3
-import pandas as pd
 import os
+import threading
+import time
 from typing import List, Dict, Any, Optional, Tuple
 
+from connections import (
+    get_connection, close_connections, is_busy_error, read_connection, resolve_db_path, retry_on_busy,
+    write_connection,
+)
+from columnar import fetch_frame, query_kinds
+from export import table_query, write_cursor
+from fulltext import SEARCH_ROWS, create_fulltext_index, fulltext_columns, search_text
+from importer import hidden_tables, import_csv, import_many, load_plan, quote_ident
+from profiles import load_profiles
+from query_log import explain_query_plan, get_query_log
+from summaries import mark_stale, refresh_summaries, rewrite_query
+from schema_context import SCHEMA_TOKEN_BUDGET, SchemaIndex, build_schema_context
+from table_browser import BROWSE_PAGE_ROWS, estimate_row_count, read_page
+from result_cache import ResultCache, normalize_sql
+
 DB_PATH = ""
 
+# Results of read-only queries run through text_to_sql
+result_cache = ResultCache()
+
 def init_database(db_name):
     global DB_PATH
     DB_PATH = "db/" + db_name
     path = "db/" + db_name
-    conn = sqlite3.connect(path)
-    conn.close()
+    # Opening a pooled connection creates the file and leaves it warm
+    with get_connection(path):
+        pass
 
     return f"Database '{db_name}' berhasil dibuat."
 
-def create_table(db_name, csv_path, table_name):
-    # Baca file CSV
-    df = pd.read_csv(csv_path)
+def create_table(
+    db_name, csv_path, table_name, progress_callback=None, epoch_dates=False, dictionary=False,
+    mode="replace", key_columns=None, skip_unchanged=False, full_text=False,
+):
+    """
+    Create (or replace) a table from a CSV file path or upload buffer, or
+    append/upsert the CSV rows into an existing table.
 
-    # Buat koneksi ke database SQLite
-    path = "db/" + db_name
-    conn = sqlite3.connect(path)
+    The CSV is streamed in chunks and every column gets the narrowest type
+    that fits it, see importer.import_csv. The returned statistics include a
+    report of the bytes saved compared to a plain import.
 
-    # Masukkan data ke tabel
-    df.to_sql(table_name, conn, if_exists='replace', index=False)
+    With full_text, the free-form text columns get an FTS5 index kept in
+    sync by triggers (see fulltext.py); stats["full_text"] lists them. An
+    existing index is kept up to date by appends and upserts.
 
-    # Tutup koneksi
-    conn.close()
+    Summary tables of the table are refreshed afterwards, incrementally
+    after an append (see summaries.py); stats["summaries"] has the results.
+    """
+    path = "db/" + db_name
+    stats = import_csv(
+        path, csv_path, table_name, progress_callback=progress_callback,
+        epoch_dates=epoch_dates, dictionary=dictionary,
+        mode=mode, key_columns=key_columns, skip_unchanged=skip_unchanged,
+    )
+    if full_text:
+        stats["full_text"] = _index_text(path, table_name, rebuild=mode == "replace")
+    with write_connection(path) as conn:
+        stats["summaries"] = refresh_summaries(conn, table_name, incremental=mode == "append")
+    result_cache.invalidate(resolve_db_path(path))
 
     print(f"Table '{table_name}' berhasil dibuat.")
+    return stats
 
-def execute_sql_query(query: str, db_path) -> List[Dict[str, Any]]:
+def create_tables(
+    db_name, files, progress_callback=None, epoch_dates=False, dictionary=False, workers=None, full_text=False,
+):
     """
-    Execute an SQL query and return the results as a list of dictionaries
+    Create (or replace) one table per CSV file, parsing the files in parallel.
+
+    Args:
+        db_name: Database file name in the db folder
+        files: (CSV file path or upload buffer, table name) pairs
+        progress_callback: Called with (file index, statistics)
+        workers: Number of parsing processes (default: one per CPU)
+        full_text: Full-text index the free-form text columns, see create_table
+
+    Returns:
+        Per-file statistics, see importer.import_many
+    """
+    path = "db/" + db_name
+    results = import_many(
+        path, files, workers=workers, progress_callback=progress_callback,
+        epoch_dates=epoch_dates, dictionary=dictionary,
+    )
+    created = [r for r in results if r["status"] == "done"]
+    if full_text:
+        for result in created:
+            result["full_text"] = _index_text(path, result["table"], rebuild=True)
+    with write_connection(path) as conn:
+        for result in created:
+            result["summaries"] = refresh_summaries(conn, result["table"], incremental=False)
+    result_cache.invalidate(resolve_db_path(path))
+
+    done = [r["table"] for r in results if r["status"] == "done"]
+    print(f"{len(done)} dari {len(results)} table berhasil dibuat.")
+    return results
+
+
+def _index_text(path: str, table_name: str, rebuild: bool) -> List[str]:
+    with write_connection(path) as conn:
+        existing = fulltext_columns(conn, table_name)
+        if existing and not rebuild:
+            return existing
+        return create_fulltext_index(conn, table_name)
+
+
+def create_fulltext(db_name, table_name, columns: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Build (or rebuild) the FTS5 index of an existing table, over the given
+    text columns or the free-form ones (see fulltext.py)
+
+    Returns:
+        Dictionary with the indexed columns, or with an "error" key
     """
+    path = "db/" + db_name
     try:
-        path = "db/" + db_path
-        conn = sqlite3.connect(path)
-        # Set row_factory to sqlite3.Row to access columns by name
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute(query)
-        
-        # Check if this is a SELECT query
-        if query.strip().upper().startswith("SELECT"):
-            # Fetch all rows and convert to list of dictionaries
-            rows = cursor.fetchall()
-            result = [{k: row[k] for k in row.keys()} for row in rows]
-        else:
-            # For non-SELECT queries, return affected row count
-            result = [{"affected_rows": cursor.rowcount}]
-            conn.commit()
-            
-        conn.close()
-        return result
-    
+        with write_connection(path) as conn:
+            indexed = create_fulltext_index(conn, table_name, columns)
+    except (ValueError, sqlite3.Error) as e:
+        return {"error": str(e)}
+    result_cache.invalidate(resolve_db_path(path))
+    return {"columns": indexed}
+
+
+def search_table_text(
+    db_path, table: str, query: str, column: Optional[str] = None, limit: int = SEARCH_ROWS
+) -> Dict[str, Any]:
+    """
+    Ranked full-text search in a table's FTS5 index (used by AI assistant)
+
+    Returns:
+        Dictionary with query (the FTS5 query), columns and results (rows
+        best first), or results holding a single {"error": ...} entry, as
+        text_to_sql returns them
+    """
+    try:
+        with read_connection("db/" + db_path) as conn:
+            found = search_text(conn, table, query, column, limit)
+    except (ValueError, sqlite3.Error) as e:
+        return {"query": query, "results": [{"error": str(e)}]}
+    return {"query": found["query"], "columns": found["columns"], "results": found["rows"]}
+
+
+# Default bounds for one page of query results
+QUERY_PAGE_ROWS = 200
+QUERY_PAGE_BYTES = 256 * 1024
+
+# Default execution budgets for agent-generated SQL
+QUERY_TIMEOUT = 10.0  # seconds of wall-clock time
+QUERY_MAX_STEPS = 1_000_000_000  # SQLite virtual machine instructions
+
+# The progress handler runs once every this many VM instructions
+_PROGRESS_INTERVAL = 10_000
+
+
+def _install_budget(
+    conn: sqlite3.Connection,
+    timeout: Optional[float],
+    max_steps: Optional[int],
+    cancel_event: Optional[threading.Event],
+) -> Dict[str, Any]:
+    """
+    Interrupt the running statement once a budget is spent or the query is
+    cancelled. The returned dict records which budget stopped it.
+    """
+    state: Dict[str, Any] = {"steps": 0, "reason": None, "started": time.monotonic()}
+    if timeout is None and max_steps is None and cancel_event is None:
+        return state
+    deadline = state["started"] + timeout if timeout is not None else None
+
+    def handler():
+        state["steps"] += _PROGRESS_INTERVAL
+        if cancel_event is not None and cancel_event.is_set():
+            state["reason"] = "cancelled"
+        elif max_steps is not None and state["steps"] > max_steps:
+            state["reason"] = "steps"
+        elif deadline is not None and time.monotonic() > deadline:
+            state["reason"] = "time"
+        # A non-zero return value aborts the statement with "interrupted"
+        return 1 if state["reason"] else 0
+
+    conn.set_progress_handler(handler, _PROGRESS_INTERVAL)
+    return state
+
+
+def _budget_error(state: Dict[str, Any], timeout: Optional[float], max_steps: Optional[int]) -> Dict[str, Any]:
+    elapsed = round(time.monotonic() - state["started"], 3)
+    if state["reason"] == "cancelled":
+        return {"error": "Query cancelled by the user", "cancelled": True}
+    if state["reason"] == "time":
+        message = f"Query exceeded its time budget of {timeout:g}s"
+        limit = timeout
+    else:
+        message = f"Query exceeded its budget of {max_steps:,} SQLite VM steps"
+        limit = max_steps
+    return {
+        "error": message,
+        "budget_exceeded": {
+            "budget": state["reason"],
+            "limit": limit,
+            "elapsed_seconds": elapsed,
+            "steps": state["steps"],
+        },
+        "hint": (
+            "Write a cheaper query: filter early with WHERE, add LIMIT, aggregate instead of "
+            "returning raw rows, and avoid cross joins or correlated subqueries."
+        ),
+    }
+
+
+def _estimate_value_bytes(value: Any) -> int:
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 8
+
+
+def _encode_page_token(query: str, offset: int) -> str:
+    payload = {"q": hashlib.sha1(query.encode("utf-8")).hexdigest()[:12], "o": offset}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def _decode_page_token(query: str, token: str) -> int:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        offset = int(payload["o"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid page token")
+    if payload.get("q") != hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]:
+        raise ValueError("Page token belongs to a different query")
+    return offset
+
+
+def execute_sql_query_page(
+    query: str,
+    db_path,
+    page_size: Optional[int] = QUERY_PAGE_ROWS,
+    max_bytes: Optional[int] = QUERY_PAGE_BYTES,
+    page_token: Optional[str] = None,
+    timeout: Optional[float] = None,
+    max_steps: Optional[int] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> Dict[str, Any]:
+    """
+    Execute an SQL query and return one bounded page of results.
+
+    Rows are pulled from the cursor only until the page is full, so SQLite
+    stops stepping the query as soon as ``page_size`` rows or ``max_bytes``
+    of values have been read. Pass ``page_token`` back to continue.
+
+    ``timeout`` (seconds) and ``max_steps`` (VM instructions) bound the work
+    SQLite may do; setting ``cancel_event`` stops the query early. A stopped
+    query returns an error with a "budget_exceeded" or "cancelled" entry.
+
+    Read-only statements run on a read-only connection, which never waits
+    for a writer. Other statements wait for their turn in the database's
+    write queue and are retried while another process holds the lock.
+
+    Every call is recorded in the query log (see query_log.py) with its wall
+    time, row count, result size, query plan and error.
+
+    Returns:
+        Dictionary with columns, rows (list of dicts), row_offset, has_more,
+        next_page_token, is_write and result_bytes, or a dictionary with an
+        "error" key
+    """
+    try:
+        offset = _decode_page_token(query, page_token) if page_token else 0
+    except ValueError as e:
+        return {"error": str(e)}
+
+    path = "db/" + db_path
+    start = time.perf_counter()
+
+    def run(conn: sqlite3.Connection, write: bool):
+        budget = _install_budget(conn, timeout, max_steps, cancel_event)
+        try:
+            result = _run_page(conn, path, query, offset, page_size, max_bytes)
+        except sqlite3.Error as e:
+            if budget["reason"]:
+                result = _budget_error(budget, timeout, max_steps)
+            elif write and is_busy_error(e):
+                raise  # nothing was written; retry_on_busy tries again
+            else:
+                result = {"error": str(e)}
+        finally:
+            conn.set_progress_handler(None, 0)
+        wall_ms = (time.perf_counter() - start) * 1000
+        # Planned after the run so the plan never counts against the budget
+        return result, wall_ms, explain_query_plan(conn, query)
+
+    def run_write():
+        with write_connection(path) as conn:
+            return run(conn, True)
+
+    plan = None
+    try:
+        with read_connection(path) as conn:
+            try:
+                actions = _statement_actions(conn, query)
+            except sqlite3.Error:
+                actions = []  # running it reports the error
+            read_only = _only_reads(actions)
+            refused = _connection_change(actions)
+            if refused:
+                result, wall_ms = {"error": refused}, (time.perf_counter() - start) * 1000
+            elif read_only:
+                result, wall_ms, plan = run(conn, False)
+        if not read_only and not refused:
+            result, wall_ms, plan = retry_on_busy(run_write)
     except sqlite3.Error as e:
-        return [{"error": str(e)}]
-    
+        wall_ms = (time.perf_counter() - start) * 1000
+        result = {"error": str(e)}
+
+    get_query_log().record(
+        db_path,
+        query,
+        wall_ms,
+        rows=len(result["rows"]) if "rows" in result else None,
+        result_bytes=result.get("result_bytes"),
+        plan=plan,
+        error=result.get("error"),
+    )
+    return result
+
+
+def _run_page(
+    conn: sqlite3.Connection,
+    path: str,
+    query: str,
+    offset: int,
+    page_size: Optional[int],
+    max_bytes: Optional[int],
+) -> Dict[str, Any]:
+    cursor = conn.cursor()
+    cursor.execute(query)
+
+    # Statements without a result set (INSERT, UPDATE, DDL, ...)
+    if cursor.description is None:
+        affected = cursor.rowcount
+        mark_stale(conn, query)
+        conn.commit()
+        result_cache.invalidate(resolve_db_path(path))
+        return {
+            "columns": ["affected_rows"],
+            "rows": [{"affected_rows": affected}],
+            "row_offset": 0,
+            "has_more": False,
+            "next_page_token": None,
+            "is_write": True,
+            "result_bytes": 0,
+        }
+
+    columns = [d[0] for d in cursor.description]
+
+    # Skip rows already returned by earlier pages
+    skipped = 0
+    while skipped < offset:
+        batch = cursor.fetchmany(min(offset - skipped, 1000))
+        if not batch:
+            break
+        skipped += len(batch)
+
+    rows = []
+    used_bytes = 0
+    has_more = False
+    while True:
+        row = cursor.fetchone()
+        if row is None:
+            break
+        full = page_size is not None and len(rows) >= page_size
+        over = max_bytes is not None and rows and used_bytes >= max_bytes
+        if full or over:
+            has_more = True
+            break
+        used_bytes += sum(_estimate_value_bytes(v) for v in row)
+        rows.append(dict(zip(columns, row)))
+
+    # e.g. INSERT ... RETURNING
+    is_write = conn.in_transaction
+    if is_write:
+        mark_stale(conn, query)
+        conn.commit()
+        result_cache.invalidate(resolve_db_path(path))
+
+    next_offset = offset + len(rows)
+    return {
+        "columns": columns,
+        "rows": rows,
+        "row_offset": offset,
+        "has_more": has_more,
+        "next_page_token": _encode_page_token(query, next_offset) if has_more else None,
+        "is_write": is_write,
+        "result_bytes": used_bytes,
+    }
+
+
+def execute_sql_query(query: str, db_path, max_rows: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Execute an SQL query and return the results as a list of dictionaries
+    """
+    page = execute_sql_query_page(query, db_path, page_size=max_rows, max_bytes=None)
+    if "error" in page:
+        return [{"error": page["error"]}]
+    return page["rows"]
+
+
+# Process-wide cache of schema and sample rows, keyed by resolved database path.
+# Entries are shared between sessions; callers must treat them as read-only.
+_schema_cache: Dict[str, Dict[str, Any]] = {}
+_schema_cache_lock = threading.Lock()
+
+# Excludes SQLite's own tables such as sqlite_stat1 (created by ANALYZE)
+_USER_TABLE = "name NOT LIKE 'sqlite\\_%' ESCAPE '\\'"
+
+# All column metadata in one round trip instead of one PRAGMA per table
+_SCHEMA_SQL = f"""
+    SELECT m.name, p.name, p.type, p."notnull", p.pk
+    FROM sqlite_master AS m
+    JOIN pragma_table_info(m.name) AS p
+    WHERE m.type IN ('table', 'view') AND m.{_USER_TABLE}
+    ORDER BY m.rowid, p.cid
+"""
+
+_FOREIGN_KEY_SQL = f"""
+    SELECT m.name, f."from", f."table", f."to"
+    FROM sqlite_master AS m
+    JOIN pragma_foreign_key_list(m.name) AS f
+    WHERE m.type = 'table' AND m.{_USER_TABLE}
+"""
+
+# How typed imports store dates, for the agent
+_DATE_NOTES = {
+    ("date", "epoch"): "date stored as Unix epoch seconds; use date({col}, 'unixepoch') to read it",
+    ("datetime", "epoch"): "datetime stored as Unix epoch seconds; use datetime({col}, 'unixepoch') to read it",
+    ("date", None): "ISO date text (YYYY-MM-DD)",
+    ("datetime", None): "ISO datetime text (YYYY-MM-DD HH:MM:SS)",
+}
+
+
+_FULLTEXT_NOTE = "full-text indexed; find words in it with the search_text tool"
+
+
+def _user_tables(conn: sqlite3.Connection) -> List[str]:
+    """
+    Tables and views a user works with, without SQLite's and the importer's
+    internal tables
+    """
+    hidden = hidden_tables(conn)
+    return [
+        name for (name,) in conn.execute(
+            f"SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND {_USER_TABLE} ORDER BY rowid"
+        )
+        if name not in hidden
+    ]
+
+
+def _data_stamp(path: str) -> Tuple:
+    """
+    Cheap fingerprint of a database file's contents.
+
+    PRAGMA data_version only changes for commits made by *other* connections,
+    and pooled connections rotate, so it cannot be compared between calls.
+    The file and WAL stat tuples change on every commit instead. An empty WAL
+    is treated like a missing one, since SQLite creates and removes it as
+    connections open and close.
+    """
+    try:
+        st = os.stat(path)
+        stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+    except OSError:
+        stamp = (None, None, None)
+    try:
+        wal = os.stat(path + "-wal")
+        if wal.st_size > 0:
+            return stamp + (wal.st_size, wal.st_mtime_ns)
+    except OSError:
+        pass
+    return stamp + (0, 0)
+
+
+def _cached_schema_entry(conn: sqlite3.Connection, path: str) -> Dict[str, Any]:
+    """
+    Return the cache entry for a database, rebuilding it if the schema changed
+    """
+    key = resolve_db_path(path)
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    with _schema_cache_lock:
+        entry = _schema_cache.get(key)
+    if entry is not None and entry["schema_version"] == version:
+        return entry
+
+    hidden = hidden_tables(conn)
+    schema: Dict[str, List[Dict[str, Any]]] = {}
+    for table_name, name, col_type, notnull, pk in conn.execute(_SCHEMA_SQL):
+        if table_name in hidden:
+            continue
+        schema.setdefault(table_name, []).append(
+            {
+                "name": name,
+                "type": col_type,
+                "notnull": bool(notnull),
+                "pk": bool(pk)
+            }
+        )
+
+    # Tell the agent how typed imports stored their dates, and which columns
+    # it can search with search_text
+    for table_name, columns in schema.items():
+        plan = load_plan(conn, table_name)
+        kinds = {c["name"]: (c["kind"], c["encoding"]) for c in plan["columns"]} if plan else {}
+        indexed = set(fulltext_columns(conn, table_name))
+        for column in columns:
+            notes = []
+            note = _DATE_NOTES.get(kinds.get(column["name"]))
+            if note:
+                notes.append(note.format(col=column["name"]))
+            if column["name"] in indexed:
+                notes.append(_FULLTEXT_NOTE)
+            if notes:
+                column["note"] = "; ".join(notes)
+    foreign_keys: Dict[str, List[Tuple[str, str, str]]] = {}
+    for table_name, column, target, target_column in conn.execute(_FOREIGN_KEY_SQL):
+        if table_name in schema:
+            foreign_keys.setdefault(table_name, []).append((column, target, target_column))
+
+    entry = {
+        "schema_version": version, "schema": schema, "foreign_keys": foreign_keys,
+        "data_stamp": None, "sample_data": None, "profiles": None, "schema_index": None,
+    }
+    with _schema_cache_lock:
+        _schema_cache[key] = entry
+    return entry
+
+
 def get_table_schema(db_path) -> Dict[str, List[Dict[str, str]]]:
     """
     Get the schema of all tables in the database
+
+    Cached per database file until PRAGMA schema_version changes.
     """
     try:
         path = "db/" + db_path
-        conn = sqlite3.connect(path)
-        cursor = conn.cursor()
-        
-        # Get all table names
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        
-        schema = {}
-        
-        for table in tables:
-            table_name = table[0]
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = cursor.fetchall()
-            
-            schema[table_name] = [
-                {
-                    "name": col[1],
-                    "type": col[2],
-                    "notnull": bool(col[3]),
-                    "pk": bool(col[5])
-                }
-                for col in columns
-            ]
-        
-        conn.close()
-        return schema
-    
+        with read_connection(path) as conn:
+            return _cached_schema_entry(conn, path)["schema"]
+
     except sqlite3.Error as e:
         return {"error": str(e)}
 
+def get_schema_fingerprint(db_path) -> Optional[str]:
+    """
+    Short hash of the table/column layout, stable across processes
+    """
+    schema = get_table_schema(db_path)
+    if "error" in schema:
+        return None
+    layout = sorted(
+        (table, [(c["name"], c["type"]) for c in columns]) for table, columns in schema.items()
+    )
+    return hashlib.sha1(json.dumps(layout).encode("utf-8")).hexdigest()[:16]
+
+
+# Authorizer actions that only read. A PRAGMA is read-only when it has no
+# argument or is one of the introspection pragmas that take a table name.
+_READ_ONLY_ACTIONS = {
+    sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE
+}
+_READ_ONLY_PRAGMAS = {"table_info", "table_xinfo", "index_list", "index_info", "foreign_key_list"}
+# Actions that change the connection rather than the database. Pooled
+# connections outlive the statement, so every later caller would inherit them.
+_CONNECTION_ACTIONS = {
+    sqlite3.SQLITE_ATTACH: "ATTACH", sqlite3.SQLITE_DETACH: "DETACH",
+    sqlite3.SQLITE_CREATE_TEMP_TABLE: "CREATE TEMP TABLE", sqlite3.SQLITE_CREATE_TEMP_INDEX: "CREATE TEMP INDEX",
+    sqlite3.SQLITE_CREATE_TEMP_VIEW: "CREATE TEMP VIEW", sqlite3.SQLITE_CREATE_TEMP_TRIGGER: "CREATE TEMP TRIGGER",
+}
+
+
+def is_read_only_query(query: str, db_path) -> bool:
+    """
+    Check, without running it, whether a statement only reads data.
+
+    The statement is compiled (via EXPLAIN) under an authorizer that records
+    every action SQLite asks permission for.
+    """
+    try:
+        with read_connection("db/" + db_path) as conn:
+            return _is_read_only(conn, query)
+    except sqlite3.Error:
+        return False
+
+
+def _statement_actions(conn: sqlite3.Connection, query: str) -> List[Tuple[int, Optional[str], Optional[str]]]:
+    """
+    (action, arg1, arg2) of every action SQLite asks permission for while
+    compiling a statement
+
+    Raises:
+        sqlite3.Error: the statement does not compile
+    """
+    actions = []
+
+    def authorizer(action, arg1, arg2, db_name, source):
+        actions.append((action, arg1, arg2))
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        conn.execute("EXPLAIN " + query).fetchall()
+    finally:
+        conn.set_authorizer(None)
+    return actions
+
+
+def _only_reads(actions: List[Tuple[int, Optional[str], Optional[str]]]) -> bool:
+    for action, arg1, arg2 in actions:
+        if action == sqlite3.SQLITE_PRAGMA:
+            if arg2 is not None and arg1 not in _READ_ONLY_PRAGMAS:
+                return False
+        elif action not in _READ_ONLY_ACTIONS:
+            return False
+    return True
+
+
+def _connection_change(actions: List[Tuple[int, Optional[str], Optional[str]]]) -> Optional[str]:
+    """
+    Why a statement is refused because it would change the pooled
+    connection (ATTACH, a PRAGMA that sets a value, temp objects), or None
+    """
+    for action, arg1, arg2 in actions:
+        if action == sqlite3.SQLITE_PRAGMA and arg2 is not None and arg1 not in _READ_ONLY_PRAGMAS:
+            what = f"PRAGMA {arg1} = ..."
+        elif action in _CONNECTION_ACTIONS:
+            what = _CONNECTION_ACTIONS[action]
+        else:
+            continue
+        return f"{what} is not allowed: it would change the shared connection, not the data"
+    return None
+
+
+def _is_read_only(conn: sqlite3.Connection, query: str) -> bool:
+    """
+    is_read_only_query on an open connection
+
+    Raises:
+        sqlite3.Error: the statement does not compile
+    """
+    return _only_reads(_statement_actions(conn, query))
+
+
 # Function to be used as a tool in the LangGraph agent
-def text_to_sql(sql_query: str, db_path) -> Dict[str, Any]:
+def text_to_sql(
+    sql_query: str,
+    db_path,
+    page_token: Optional[str] = None,
+    page_size: int = QUERY_PAGE_ROWS,
+    max_bytes: int = QUERY_PAGE_BYTES,
+    timeout: Optional[float] = QUERY_TIMEOUT,
+    max_steps: Optional[int] = QUERY_MAX_STEPS,
+    cancel_event: Optional[threading.Event] = None,
+) -> Dict[str, Any]:
     """
     Execute a SQL query against the database
     
     Args:
         sql_query: The SQL query to execute
+        page_token: Token from a previous call to fetch the next page
+        page_size: Maximum number of rows returned
+        max_bytes: Approximate byte budget for the returned values
+        timeout: Wall-clock budget in seconds
+        max_steps: Budget of SQLite VM instructions
+        cancel_event: Set it to stop the query early
         
+    A GROUP BY query that a fresh summary table covers is answered from
+    the summary (see summaries.py); the result then has a "summary" entry
+    and the query that ran as "rewritten_query".
+
     Returns:
-        Dictionary with SQL query and results
+        Dictionary with SQL query, column names, results and paging information
     """
     # # Make sure the database exists
     # if not os.path.exists(DB_PATH):
     #     init_database()
     
+    # Serve repeated read-only queries from the result cache. The key
+    # includes the file's data stamp, so any commit makes old entries miss.
+    path = resolve_db_path("db/" + db_path)
+    cache_key = (path, normalize_sql(sql_query), page_token, page_size, max_bytes, _data_stamp(path))
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached, query=sql_query)
+
     # Execute the SQL query
     try:
-        results = execute_sql_query(sql_query, db_path)
-        return {
+        rewrite = None
+        if os.path.exists(path):
+            with read_connection(path) as conn:
+                rewrite = rewrite_query(conn, sql_query)
+        page = execute_sql_query_page(
+            rewrite["sql"] if rewrite else sql_query, db_path, page_size, max_bytes, page_token,
+            timeout=timeout, max_steps=max_steps, cancel_event=cancel_event,
+        )
+        if "error" in page:
+            # Keep budget_exceeded / hint so the agent can retry with a cheaper query
+            return {
+                "query": sql_query,
+                "results": [page]
+            }
+        result = {
             "query": sql_query,
-            "results": results
+            "columns": page["columns"],
+            "results": page["rows"],
+            "has_more": page["has_more"],
+            "next_page_token": page["next_page_token"],
         }
+        if rewrite:
+            result["rewritten_query"] = rewrite["sql"]
+            result["summary"] = rewrite["summary"]
+        if page["has_more"]:
+            first = page["row_offset"] + 1
+            last = page["row_offset"] + len(page["rows"])
+            result["note"] = (
+                f"Showing rows {first}-{last}; more rows are available. "
+                "Use aggregation or LIMIT, or pass next_page_token to fetch the next page."
+            )
+        if not page["is_write"]:
+            result_cache.put(cache_key, result)
+        return dict(result)
     except Exception as e:
         return {
             "query": sql_query,
             "results": [{"error": str(e)}]
         }
 
+
+def query_frame(
+    query: str,
+    db_path,
+    max_rows: Optional[int] = None,
+    timeout: Optional[float] = QUERY_TIMEOUT,
+    max_steps: Optional[int] = QUERY_MAX_STEPS,
+) -> Dict[str, Any]:
+    """
+    Result of a read-only query as a DataFrame, read in batches straight
+    into typed columns instead of a dict per row (see columnar.py)
+
+    Args:
+        query: SELECT to run
+        db_path: Database file name inside db/
+        max_rows: Largest number of rows read
+        timeout: Wall-clock budget in seconds, as for text_to_sql
+        max_steps: Budget of SQLite VM instructions, as for text_to_sql
+
+    Returns:
+        Dictionary with frame and has_more, or a dictionary with an "error"
+        key (and "budget_exceeded" when a budget stopped the query)
+    """
+    start = time.perf_counter()
+    plan = None
+    try:
+        with read_connection("db/" + db_path) as conn:
+            if not _is_read_only(conn, query):
+                raise ValueError("Only read-only queries can be read into a frame")
+            kinds = query_kinds(conn, query)
+            budget = _install_budget(conn, timeout, max_steps, None)
+            try:
+                cursor = conn.execute(query)
+                frame = fetch_frame(cursor, kinds, max_rows)
+                has_more = max_rows is not None and cursor.fetchone() is not None
+                cursor.close()
+            except sqlite3.Error:
+                if not budget["reason"]:
+                    raise
+                result = _budget_error(budget, timeout, max_steps)
+            else:
+                result = {"frame": frame, "has_more": has_more}
+            finally:
+                conn.set_progress_handler(None, 0)
+            plan = explain_query_plan(conn, query)
+    except (ValueError, sqlite3.Error) as e:
+        result = {"error": str(e)}
+
+    get_query_log().record(
+        db_path,
+        query,
+        (time.perf_counter() - start) * 1000,
+        rows=len(result["frame"]) if "frame" in result else None,
+        plan=plan,
+        error=result.get("error"),
+    )
+    return result
+
+
+def export_query_result(query: str, db_path, out, fmt: str = "csv", progress_callback=None) -> Dict[str, Any]:
+    """
+    Stream the full result of a read-only query to a file, batch by batch,
+    without the row or byte limits of text_to_sql (see export.py)
+
+    Args:
+        query: SELECT to export
+        db_path: Database file name inside db/
+        out: File path or binary file object
+        fmt: "csv", "parquet" or "arrow"
+        progress_callback: Called with the number of rows written so far
+
+    Returns:
+        Dictionary with format, columns, rows, bytes, seconds and
+        rows_per_sec, or a dictionary with an "error" key
+    """
+    start = time.perf_counter()
+    plan = None
+    try:
+        with read_connection("db/" + db_path) as conn:
+            if not _is_read_only(conn, query):
+                raise ValueError("Only read-only queries can be exported")
+            result = write_cursor(conn.execute(query), out, fmt, progress_callback=progress_callback)
+            plan = explain_query_plan(conn, query)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        result = {"error": str(e)}
+
+    get_query_log().record(
+        db_path,
+        query,
+        (time.perf_counter() - start) * 1000,
+        rows=result.get("rows"),
+        result_bytes=result.get("bytes"),
+        plan=plan,
+        error=result.get("error"),
+    )
+    return result
+
+
+def get_result_cache_stats() -> Dict[str, Any]:
+    """
+    Hit/miss/eviction counters and memory use of the text_to_sql result cache
+    """
+    return result_cache.stats()
+
 def get_database_info(db_path) -> Dict[str, Any]:
     """
     Get information about the database schema to help with query construction
+
+    Sample rows and column profiles are cached until the database file changes.
     
     Returns:
-        Dictionary with database schema and sample data
+        Dictionary with database schema, sample data and the column profiles
+        of imported tables (null fraction, distinct count, min/max, top
+        values, quartiles and histogram; see profiles.py)
     """
     # Make sure the database exists
     # if not os.path.exists(DB_PATH):
     #     init_database()
-    
-    # Get the database schema
-    schema = get_table_schema(db_path)
-    
-    # Get sample data for each table (first 3 rows)
-    sample_data = {}
-    for table_name in schema.keys():
-        if isinstance(table_name, str):  # Skip any error entries
-            try:
-                sample_data[table_name] = execute_sql_query(f"SELECT * FROM {table_name} LIMIT 3")
-            except:
-                pass
-    
+
+    path = "db/" + db_path
+    try:
+        with read_connection(path) as conn:
+            entry = _cached_schema_entry(conn, path)
+            stamp = _data_stamp(resolve_db_path(path))
+            if entry["sample_data"] is not None and entry["data_stamp"] == stamp:
+                return {"schema": entry["schema"], "sample_data": entry["sample_data"], "profiles": entry["profiles"]}
+
+            # Get sample data for each table (first 3 rows)
+            sample_data = {}
+            for table_name, columns in entry["schema"].items():
+                try:
+                    select = ", ".join(quote_ident(c["name"]) for c in columns)
+                    cursor = conn.execute(f"SELECT {select} FROM {quote_ident(table_name)} LIMIT 3")
+                    columns = [d[0] for d in cursor.description]
+                    sample_data[table_name] = [dict(zip(columns, row)) for row in cursor]
+                except sqlite3.Error:
+                    pass
+
+            # Column statistics recorded at import time
+            profiles = {t: p for t, p in load_profiles(conn).items() if t in entry["schema"]}
+    except sqlite3.Error as e:
+        return {"schema": {"error": str(e)}, "sample_data": {}, "profiles": {}}
+
+    with _schema_cache_lock:
+        entry["sample_data"] = sample_data
+        entry["profiles"] = profiles
+        entry["data_stamp"] = stamp
+        entry["schema_index"] = None
+
     return {
-        "schema": schema,
-        "sample_data": sample_data
+        "schema": entry["schema"],
+        "sample_data": sample_data,
+        "profiles": profiles,
     }
 
+def get_schema_context(db_path, question: str = "", token_budget: int = SCHEMA_TOKEN_BUDGET) -> str:
+    """
+    Schema and sample rows of the tables relevant to a question, as compact
+    text that fits in token_budget (see schema_context.build_schema_context).
+
+    The search index is cached with the sample rows, so it is rebuilt only
+    when the database changes.
+    """
+    info = get_database_info(db_path)
+    if "error" in info["schema"]:
+        return f"Error: {info['schema']['error']}"
+    path = "db/" + db_path
+    try:
+        with read_connection(path) as conn:
+            entry = _cached_schema_entry(conn, path)
+    except sqlite3.Error as e:
+        return f"Error: {e}"
+    with _schema_cache_lock:
+        index = entry.get("schema_index")
+        if index is None or index.sample_data is not info["sample_data"]:
+            index = SchemaIndex(info["schema"], info["sample_data"], entry["foreign_keys"], info["profiles"])
+            entry["schema_index"] = index
+    return build_schema_context(index, question, token_budget)
+
+# Per-file listing facts keyed by resolved path: (stat stamp, table count)
+_listing_cache: Dict[str, Tuple[Tuple, Any]] = {}
+# Directory listings keyed by folder: (folder mtime_ns, sorted .db filenames)
+_folder_cache: Dict[str, Tuple[int, List[str]]] = {}
+_listing_lock = threading.Lock()
+
+
+def list_db_files(db_folder: str) -> List[str]:
+    """
+    List the .db files in db_folder, re-reading the directory only when its
+    mtime changes (i.e. when a file is created, renamed or deleted)
+    """
+    key = os.path.abspath(db_folder)
+    mtime = os.stat(key).st_mtime_ns
+    with _listing_lock:
+        cached = _folder_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return list(cached[1])
+    files = sorted(f for f in os.listdir(key) if f.endswith('.db'))
+    with _listing_lock:
+        _folder_cache[key] = (mtime, files)
+    return list(files)
+
+
 def getAllDB(db_folder, db_files) -> List[dict]:
     
     # db_folder: filesystem path (str), db_files: list of filenames (List[str])
-    # Build a table of metadata
+    # Build a table of metadata. Only files whose (inode, size, mtime) changed
+    # since the last call are opened to count their tables.
     rows = []
+    seen = set()
     for fname in db_files:
         path = os.path.join(db_folder, fname)
+        key = resolve_db_path(path)
+        seen.add(key)
         stat = os.stat(path)
         size_kb = stat.st_size / 1024
-        mtime = stat.st_mtime
+        stamp = _data_stamp(key)
 
-        # Count tables in the sqlite file
-        try:
-            import sqlite3
-            conn = sqlite3.connect(path)
-            cur = conn.cursor()
-            cur.execute("SELECT count(*) FROM sqlite_master WHERE type='table'")
-            table_count = cur.fetchone()[0]
-            conn.close()
-        except Exception:
-            table_count = "error"
+        with _listing_lock:
+            cached = _listing_cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            table_count = cached[1]
+        else:
+            # Count tables in the sqlite file
+            try:
+                with read_connection(path) as conn:
+                    table_count = len(_user_tables(conn))
+            except Exception:
+                table_count = "error"
+            # Re-stat: opening the file may have created its WAL
+            with _listing_lock:
+                _listing_cache[key] = (_data_stamp(key), table_count)
 
         rows.append({
             "filename": fname,
@@ -179,6 +979,12 @@ def getAllDB(db_folder, db_files) -> List[dict]:
             "tables": table_count,
             "path": path,
         })
+
+    # Forget files that disappeared from this folder
+    folder = resolve_db_path(db_folder) + os.sep
+    with _listing_lock:
+        for key in [k for k in _listing_cache if k.startswith(folder) and k not in seen]:
+            del _listing_cache[key]
         
     return rows
 
@@ -211,8 +1017,15 @@ def delete_db_file(db_folder: str, filename: str) -> dict:
     if not os.path.exists(norm_path):
         return {"ok": False, "message": "File does not exist"}
 
+    # Pooled connections would keep the file (and its WAL) open
+    close_connections(norm_path)
+    result_cache.invalidate(norm_path)
+
     try:
         os.remove(norm_path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(norm_path + suffix):
+                os.remove(norm_path + suffix)
         return {"ok": True, "message": f"Deleted {filename}"}
     except Exception as e:
         return {"ok": False, "message": f"Error deleting file: {e}"}
@@ -222,27 +1035,136 @@ def getTablesFromDB(sel_path) -> List[dict]:
         # sel_path = next(r['path'] for r in rows if r['filename'] == sel)
         # sel_path = next(r['path'] for r in dbs if r['filename'] == sel)
     try:
-        import sqlite3
-        conn = sqlite3.connect(sel_path)
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = [t[0] for t in cur.fetchall()]
-        conn.close()
+        with read_connection(sel_path) as conn:
+            tables = _user_tables(conn)
         return tables
     except Exception as e:
         f"Error opening DB: {e}"
         return
     
-def getDataFromTable(sel_path, tsel) -> Tuple[List[str], List[tuple]]:
-    try:
-        conn = sqlite3.connect(sel_path)
-        cur = conn.cursor()
-        cur.execute(f"SELECT * FROM {tsel} LIMIT 20")
-        cols = [d[0] for d in cur.description] if cur.description else []
-        data = cur.fetchall()
-        conn.close()
-        return cols, data
-    except Exception as e:
-        f"Error opening DB: {e}"
+def getDataFromTable(sel_path, tsel, page_size: int = 20) -> Tuple[List[str], List[tuple]]:
+    # First page of a table; get_table_page reads the following ones
+    page = get_table_page(sel_path, tsel, page_size=page_size, prefetch=False)
+    if "error" in page:
         return [], []
+    return page["columns"], page["rows"]
+
+
+# Browse pages being read ahead, by cache key
+_prefetching = set()
+_prefetch_lock = threading.Lock()
+
+
+def _browse_key(path: str, kind: str, table: str, *spec) -> Tuple:
+    return (path, kind, table, json.dumps(spec, sort_keys=True, default=str), _data_stamp(path))
+
+
+def get_table_page(
+    sel_path,
+    table: str,
+    page_size: int = BROWSE_PAGE_ROWS,
+    sort: Optional[str] = None,
+    descending: bool = False,
+    filters: Optional[List[Dict[str, Any]]] = None,
+    page_token: Optional[str] = None,
+    prefetch: bool = True,
+) -> Dict[str, Any]:
+    """
+    One page of a table for the Browse page, read with keyset pagination
+    so every page costs about the same (see table_browser.py).
+
+    Args:
+        sel_path: Path of the database file
+        table: Table or view to read
+        page_size: Rows per page
+        sort: Column to sort on (rowid order when None)
+        descending: Sort direction
+        filters: Column filters as {"column", "op", "value"} dictionaries,
+            with op one of table_browser.FILTER_OPERATORS
+        page_token: next_page_token of the previous page
+        prefetch: Read the next page in the background, so that asking
+            for it is served from the cache
+
+    Returns:
+        Dictionary with columns, kinds (see columnar.py), rows (tuples),
+        has_more, next_page_token and keyset (False for views paged with
+        OFFSET), or a dictionary with an "error" key
+    """
+    path = resolve_db_path(sel_path)
+    key = _browse_key(path, "page", table, page_size, sort, descending, filters, page_token)
+    page = result_cache.get(key)
+    if page is None:
+        try:
+            with read_connection(path) as conn:
+                page = read_page(conn, table, page_size, sort, descending, filters, page_token)
+        except (ValueError, sqlite3.Error) as e:
+            return {"error": str(e)}
+        result_cache.put(key, page)
+
+    if prefetch and page["next_page_token"]:
+        ahead = _browse_key(path, "page", table, page_size, sort, descending, filters, page["next_page_token"])
+        with _prefetch_lock:
+            start = ahead not in _prefetching and result_cache.get(ahead) is None
+            if start:
+                _prefetching.add(ahead)
+        if start:
+            def read_ahead():
+                try:
+                    get_table_page(
+                        path, table, page_size, sort, descending, filters, page["next_page_token"], prefetch=False
+                    )
+                finally:
+                    with _prefetch_lock:
+                        _prefetching.discard(ahead)
+
+            threading.Thread(target=read_ahead, daemon=True).start()
+    return dict(page)
+
+
+def count_table_rows(sel_path, table: str, filters: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Fast, possibly approximate row count of a table with filters, see
+    table_browser.estimate_row_count
+
+    Returns:
+        Dictionary with rows, exact and method, or a dictionary with an
+        "error" key
+    """
+    path = resolve_db_path(sel_path)
+    key = _browse_key(path, "count", table, filters)
+    count = result_cache.get(key)
+    if count is None:
+        try:
+            with read_connection(path) as conn:
+                count = estimate_row_count(conn, table, filters)
+        except (ValueError, sqlite3.Error) as e:
+            return {"error": str(e)}
+        result_cache.put(key, count)
+    return dict(count)
     
+
+
+def export_table(
+    sel_path,
+    table: str,
+    out,
+    fmt: str = "csv",
+    sort: Optional[str] = None,
+    descending: bool = False,
+    filters: Optional[List[Dict[str, Any]]] = None,
+    progress_callback=None,
+) -> Dict[str, Any]:
+    """
+    Stream every row of a table to a file in the order and with the filters
+    of the Browse page (see get_table_page and export.py)
+
+    Returns:
+        Dictionary with format, columns, rows, bytes, seconds and
+        rows_per_sec, or a dictionary with an "error" key
+    """
+    try:
+        with read_connection(resolve_db_path(sel_path)) as conn:
+            query, params = table_query(conn, table, sort, descending, filters)
+            return write_cursor(conn.execute(query, params), out, fmt, progress_callback=progress_callback)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        return {"error": str(e)}
@@ -0,0 +1,234 @@
+"""
+Streaming export of query results and tables to CSV, Parquet or Arrow IPC.
+
+Rows are pulled from the cursor EXPORT_BATCH_ROWS at a time and written out
+before the next batch is read, so memory stays flat however many rows the
+query returns. Parquet and Arrow need pyarrow; without it only CSV is
+offered (see available_formats).
+
+Column types of the columnar formats are taken from the first batch: a
+column of integers becomes int64, integers mixed with reals become float64,
+text becomes string and blobs binary. A column that later holds a value of
+another type (SQLite allows this outside STRICT tables) stops the export
+with an error; CAST it in the query or export CSV instead.
+"""
+import csv
+import io
+import tempfile
+import time
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from importer import quote_ident
+from table_browser import browse_source, filter_clause
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional dependency
+    pa = None
+
+# Rows fetched and written per batch; also the Parquet row group size
+EXPORT_BATCH_ROWS = 10_000
+# Format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+}
+
+ExportTarget = Union[str, BinaryIO]
+
+
+def available_formats() -> List[str]:
+    """
+    Export formats usable in this environment
+    """
+    return [f for f in EXPORT_FORMATS if f == "csv" or pa is not None]
+
+
+def _csv_value(value: Any) -> Any:
+    # csv writes None as an empty field and floats with repr already
+    return value.hex() if isinstance(value, bytes) else value
+
+
+def _write_csv(cursor, out: BinaryIO, columns: List[str], batch_rows: int, on_batch: Callable[[int], None]) -> int:
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    try:
+        writer = csv.writer(text)
+        writer.writerow(columns)
+        total = 0
+        while True:
+            batch = cursor.fetchmany(batch_rows)
+            if not batch:
+                break
+            if any(type(v) is bytes for row in batch for v in row):
+                batch = [[_csv_value(v) for v in row] for row in batch]
+            writer.writerows(batch)
+            total += len(batch)
+            on_batch(total)
+        text.flush()
+    finally:
+        # Leave the caller's file open
+        text.detach()
+    return total
+
+
+def _arrow_type(values: Sequence[Any]):
+    kinds = {type(v) for v in values if v is not None}
+    if not kinds:
+        return pa.string()
+    if kinds == {int}:
+        return pa.int64()
+    if kinds <= {int, float}:
+        return pa.float64()
+    if kinds == {bytes}:
+        return pa.binary()
+    return pa.string()
+
+
+def _arrow_array(name: str, values: List[Any], arrow_type):
+    if arrow_type == pa.string():
+        values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        raise ValueError(
+            f"Column {name!r} holds values of more than one type ({arrow_type} expected); "
+            "CAST it in the query or export as CSV"
+        ) from None
+
+
+def _write_arrow(
+    cursor, out: BinaryIO, columns: List[str], fmt: str, batch_rows: int, on_batch: Callable[[int], None]
+) -> int:
+    writer = None
+    schema = None
+    total = 0
+    try:
+        while True:
+            batch = cursor.fetchmany(batch_rows)
+            if not batch and writer is not None:
+                break
+            values = list(zip(*batch)) if batch else [()] * len(columns)
+            if schema is None:
+                schema = pa.schema([pa.field(c, _arrow_type(v)) for c, v in zip(columns, values)])
+                if fmt == "parquet":
+                    writer = pa.parquet.ParquetWriter(out, schema)
+                else:
+                    writer = pa.ipc.new_file(out, schema)
+            if not batch:
+                break
+            arrays = [_arrow_array(f.name, list(v), f.type) for f, v in zip(schema, values)]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            total += len(batch)
+            on_batch(total)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def write_cursor(
+    cursor,
+    out: ExportTarget,
+    fmt: str = "csv",
+    batch_rows: int = EXPORT_BATCH_ROWS,
+    progress_callback: Optional[Callable[[int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Write every remaining row of an executed cursor to a file.
+
+    Args:
+        cursor: Cursor of an executed SELECT
+        out: File path or binary file object (left open)
+        fmt: "csv", "parquet" or "arrow" (Arrow IPC file)
+        batch_rows: Rows held in memory at a time
+        progress_callback: Called with the number of rows written so far
+            after every batch
+
+    Returns:
+        Dictionary with format, columns, rows, bytes, seconds and rows_per_sec
+
+    Raises:
+        ValueError: unknown or unavailable format, or a column whose type
+            changes in a columnar export
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(EXPORT_FORMATS)}")
+    if fmt not in available_formats():
+        raise ValueError(f"Exporting {fmt} needs pyarrow (pip install pyarrow)")
+    if cursor.description is None:
+        raise ValueError("The statement returns no rows to export")
+
+    columns = [d[0] for d in cursor.description]
+    on_batch = progress_callback or (lambda rows: None)
+    start = time.perf_counter()
+    handle = open(out, "wb") if isinstance(out, str) else out
+    try:
+        position = handle.tell() if handle.seekable() else 0
+        if fmt == "csv":
+            rows = _write_csv(cursor, handle, columns, batch_rows, on_batch)
+        else:
+            rows = _write_arrow(cursor, handle, columns, fmt, batch_rows, on_batch)
+        size = handle.tell() - position if handle.seekable() else None
+    finally:
+        if handle is not out:
+            handle.close()
+    seconds = time.perf_counter() - start
+    return {
+        "format": fmt,
+        "columns": columns,
+        "rows": rows,
+        "bytes": size,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds) if seconds > 0 else None,
+    }
+
+
+def table_query(
+    conn,
+    table: str,
+    sort: Optional[str] = None,
+    descending: bool = False,
+    filters: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[str, List[Any]]:
+    """
+    SELECT and parameters reading a whole table in the order and with the
+    filters of the Browse page (dictionary-encoded columns decoded)
+
+    Raises:
+        ValueError: unknown table, column or operator
+    """
+    source = browse_source(conn, table)
+    if sort is not None and sort not in source["columns"]:
+        raise ValueError(f"Unknown column: {sort}")
+    where, params = filter_clause(source, filters)
+    select = ", ".join(f"{expr} AS {quote_ident(name)}" for name, expr in source["columns"].items())
+    direction = " DESC" if descending else ""
+    order = ([source["columns"][sort] + direction] if sort is not None else []) + [k + direction for k in source["key"]]
+    query = f"SELECT {select} FROM {source['from']} WHERE {where}"
+    if order:
+        query += " ORDER BY " + ", ".join(order)
+    return query, params
+
+
+def spool(export: Callable[[BinaryIO], Dict[str, Any]]) -> BinaryIO:
+    """
+    Run an export into an anonymous temporary file and return the file
+    rewound, e.g. as the data of a Streamlit download button
+
+    Args:
+        export: Function writing to the file it is given, returning the
+            result of write_cursor or a dictionary with an "error" key
+
+    Raises:
+        RuntimeError: the export failed
+    """
+    out = tempfile.TemporaryFile()
+    result = export(out)
+    if "error" in result:
+        out.close()
+        raise RuntimeError(result["error"])
+    out.seek(0)
+    return out
@@ -0,0 +1,221 @@
+"""
+FTS5 full-text indexes over the free-form text columns of a table.
+
+A `LIKE '%refund%'` over a notes column reads every row. An FTS5 index
+"<table>__fts" over such columns answers the same question from an inverted
+index and ranks the matches by BM25. The index is an external-content table:
+it stores only the index and reads the text from the table itself, and
+triggers on the table keep it in sync through appends, upserts and deletes.
+Dictionary-encoded tables are indexed on their data table, whose text
+columns hold the values themselves.
+
+Free-form columns are text columns whose sampled values have several words
+on average and are mostly distinct, such as notes, comments, descriptions
+or addresses; names and category labels are left out.
+"""
+import re
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+from importer import data_table_name, fulltext_table_name, plan_from_table, quote_ident
+from table_browser import browse_source
+
+# Values read per column to decide whether it is free-form text
+FTS_SAMPLE_ROWS = 10_000
+# Average words per value of a free-form column
+FTS_MIN_WORDS = 3.0
+# Distinct values among the sampled ones (at most half the sample is needed),
+# which leaves out multi-word category labels
+FTS_MIN_DISTINCT = 100
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+# Rows returned by search_text
+SEARCH_ROWS = 20
+# Words of context around the matches in a snippet
+SNIPPET_WORDS = 12
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _content_table(conn: sqlite3.Connection, table: str) -> Optional[Dict[str, Any]]:
+    """
+    Plan of a table and the rowid table holding its text, or None when
+    there is no such table (views the importer did not create and WITHOUT
+    ROWID tables cannot be indexed)
+    """
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+    plan = plan_from_table(conn, table) if kind is not None else None
+    if plan is None:
+        return None
+    content = data_table_name(plan)
+    if kind[0] == "view" and content == table:
+        return None
+    try:
+        conn.execute(f"SELECT rowid FROM {quote_ident(content)} LIMIT 0")
+    except sqlite3.Error:
+        return None
+    return {"plan": plan, "content": content}
+
+
+def free_text_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    """
+    Text columns of a table that hold free-form text, judged on a sample of
+    FTS_SAMPLE_ROWS values: at least FTS_MIN_WORDS words per value on
+    average and FTS_MIN_DISTINCT distinct values (or half the sample)
+    """
+    source = _content_table(conn, table)
+    if source is None:
+        return []
+    columns = []
+    for column in source["plan"]["columns"]:
+        if column["kind"] != "text" or column["encoding"] is not None:
+            continue
+        name = quote_ident(column["name"])
+        values = [
+            v for (v,) in conn.execute(
+                f"SELECT {name} FROM {quote_ident(source['content'])} WHERE {name} IS NOT NULL LIMIT ?",
+                (FTS_SAMPLE_ROWS,),
+            )
+            if isinstance(v, str)
+        ]
+        if not values:
+            continue
+        words = sum(len(_WORD.findall(v)) for v in values) / len(values)
+        if words >= FTS_MIN_WORDS and len(set(values)) >= min(FTS_MIN_DISTINCT, len(values) / 2):
+            columns.append(column["name"])
+    return columns
+
+
+def fulltext_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    """
+    Columns covered by the table's full-text index; empty without one
+    """
+    name = fulltext_table_name(table)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is None:
+        return []
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({quote_ident(name)})")]
+
+
+def drop_fulltext_index(conn: sqlite3.Connection, table: str) -> None:
+    """
+    Drop a table's full-text index and its triggers
+    """
+    for suffix in ("ai", "ad", "au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {quote_ident(fulltext_table_name(table) + '_' + suffix)}")
+    conn.execute(f"DROP TABLE IF EXISTS {quote_ident(fulltext_table_name(table))}")
+
+
+def create_fulltext_index(conn: sqlite3.Connection, table: str, columns: Optional[List[str]] = None) -> List[str]:
+    """
+    (Re)build the full-text index of a table and the triggers that keep it
+    in sync. Runs in its own transaction.
+
+    Args:
+        conn: Writable connection
+        table: Table (or dictionary-encoded view) to index
+        columns: Text columns to index; the free-form ones when None
+
+    Returns:
+        The indexed columns; empty (and no index) when there are none
+
+    Raises:
+        ValueError: unknown table or column
+    """
+    source = _content_table(conn, table)
+    if source is None:
+        raise ValueError(f"Table '{table}' cannot be full-text indexed")
+    if columns is None:
+        columns = free_text_columns(conn, table)
+    known = {c["name"] for c in source["plan"]["columns"] if c["encoding"] is None}
+    for column in columns:
+        if column not in known:
+            raise ValueError(f"Column '{column}' of '{table}' cannot be full-text indexed")
+
+    fts = quote_ident(fulltext_table_name(table))
+    content = quote_ident(source["content"])
+    names = ", ".join(quote_ident(c) for c in columns)
+    new = ", ".join(f"new.{quote_ident(c)}" for c in columns)
+    old = ", ".join(f"old.{quote_ident(c)}" for c in columns)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        drop_fulltext_index(conn, table)
+        if columns:
+            escaped = source["content"].replace("'", "''")
+            conn.execute(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, "
+                f"content='{escaped}', content_rowid='rowid', tokenize='{FTS_TOKENIZER}')"
+            )
+            conn.execute(f"INSERT INTO {fts}({fts}) VALUES('rebuild')")
+            trigger = fulltext_table_name(table)
+            insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.rowid, {new});"
+            delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.rowid, {old});"
+            conn.execute(f"CREATE TRIGGER {quote_ident(trigger + '_ai')} AFTER INSERT ON {content} BEGIN {insert} END")
+            conn.execute(f"CREATE TRIGGER {quote_ident(trigger + '_ad')} AFTER DELETE ON {content} BEGIN {delete} END")
+            conn.execute(
+                f"CREATE TRIGGER {quote_ident(trigger + '_au')} AFTER UPDATE OF {names} ON {content} "
+                f"BEGIN {delete} {insert} END"
+            )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return list(columns)
+
+
+def _quote_terms(query: str) -> str:
+    # Every word as a plain term: punctuation and FTS5 operators lose meaning
+    return " ".join('"' + word + '"' for word in _WORD.findall(query))
+
+
+def search_text(
+    conn: sqlite3.Connection,
+    table: str,
+    query: str,
+    column: Optional[str] = None,
+    limit: int = SEARCH_ROWS,
+) -> Dict[str, Any]:
+    """
+    Rows of a table matching a full-text query, best first.
+
+    The query uses FTS5 syntax (words, "phrases", prefix*, AND/OR/NOT,
+    NEAR); a query that is not valid FTS5 is retried as plain words.
+
+    Args:
+        conn: Connection to the database
+        table: Table with a full-text index
+        query: Words to look for
+        column: Only match in this indexed column
+        limit: Largest number of rows returned
+
+    Returns:
+        Dictionary with columns, rows (dicts, with a "_snippet" of the
+        matched text and a BM25 "_score", lower is better) and query (the
+        FTS5 query that ran)
+
+    Raises:
+        ValueError: the table has no full-text index, or an unknown column
+    """
+    indexed = fulltext_columns(conn, table)
+    if not indexed:
+        raise ValueError(f"Table '{table}' has no full-text index")
+    if column is not None and column not in indexed:
+        raise ValueError(f"Column '{column}' is not full-text indexed; indexed columns: {', '.join(indexed)}")
+
+    source = browse_source(conn, table)
+    fts = quote_ident(fulltext_table_name(table))
+    select = ", ".join(f"{expr} AS {quote_ident(name)}" for name, expr in source["columns"].items())
+    target = f"{fts}.{quote_ident(column)}" if column else fts
+    sql = (
+        f"SELECT {select}, snippet({fts}, -1, '[', ']', '...', {SNIPPET_WORDS}) AS _snippet, "
+        f"round(bm25({fts}), 3) AS _score "
+        f"FROM {fts} JOIN {source['from']} WHERE d.rowid = {fts}.rowid AND {target} MATCH ? "
+        f"ORDER BY {fts}.rank LIMIT ?"
+    )
+    try:
+        cursor = conn.execute(sql, (query, limit))
+    except sqlite3.OperationalError:
+        query = _quote_terms(query)
+        if not query:
+            raise ValueError("The search query has no words")
+        cursor = conn.execute(sql, (query, limit))
+    columns = [d[0] for d in cursor.description]
+    return {"columns": columns, "rows": [dict(zip(columns, row)) for row in cursor], "query": query}
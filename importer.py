@@ -0,0 +1,1276 @@
+"""
+Streaming CSV import into SQLite.
+
+The CSV is parsed in bounded chunks and every chunk is written with
+``executemany`` inside one transaction, so memory stays flat no matter how big
+the upload is and SQLite only syncs to disk once at the end.
+
+Column types are chosen by a small schema engine in three steps, kept
+separate so other import paths can reuse them:
+
+* ``infer_plan`` picks the narrowest type per column (bool, int, float, date,
+  text) from a sample of the file.
+* ``transform_chunk`` converts each parsed chunk to those types and verifies
+  it on the way. A value that does not fit widens the column, and the import
+  restarts with the wider type.
+* ``TableWriter`` creates the table (STRICT when SQLite supports it) and
+  inserts the rows. With dictionary encoding, low-cardinality text columns
+  are stored as integer keys into lookup tables, behind a view that has the
+  table's name.
+
+The chosen plan is recorded in the ``_dbassist_columns`` table, and column
+statistics gathered on the way in ``_dbassist_profiles`` (see profiles.py).
+Upserts that skip unchanged rows keep a content hash per row in
+``_dbassist_row_hashes``.
+"""
+import io
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from connections import write_connection
+from profiles import TableProfile, drop_profile
+
+# Rows parsed per chunk; bounds peak memory during an import.
+IMPORT_CHUNK_ROWS = 50_000
+# Rows read up front to infer column types
+INFER_SAMPLE_ROWS = 10_000
+
+# Relaxed durability for the duration of an import, restored afterwards.
+IMPORT_PRAGMAS = {
+    "synchronous": "OFF",
+    "cache_size": "-131072",  # ~128 MB page cache while bulk loading
+}
+
+# STRICT tables reject values that do not match the declared column type
+STRICT_TABLES = sqlite3.sqlite_version_info >= (3, 37, 0)
+
+# Text columns with at most this many distinct values (and few distinct
+# values relative to the sample) are dictionary-encoded when enabled
+DICT_MAX_DISTINCT = 1_000
+DICT_MAX_RATIO = 0.2
+
+METADATA_TABLE = "_dbassist_columns"
+
+# replace recreates the table; append and upsert keep it (and its indexes)
+IMPORT_MODES = ("replace", "append", "upsert")
+# Content hash of each upserted row by rowid, kept when unchanged rows are
+# skipped on upsert; outside the user's table so queries never see it
+ROW_HASH_TABLE = "_dbassist_row_hashes"
+# Keys looked up per query when comparing a chunk with the stored hashes
+_HASH_LOOKUP_PARAMS = 900
+
+# Tried in order; day-first before month-first for ambiguous dates
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y/%m/%d",
+    "%d/%m/%Y",
+    "%m/%d/%Y",
+    "%d-%m-%Y",
+]
+
+_BOOL_VALUES = {"true": 1, "false": 0, "yes": 1, "no": 0, "t": 1, "f": 0, "y": 1, "n": 0}
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+CsvSource = Union[str, os.PathLike, bytes, BinaryIO]
+
+
+def quote_ident(name: str) -> str:
+    """
+    Quote an SQLite identifier (table or column name)
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def pandas_dtype_to_sqlite(dtype) -> str:
+    """
+    Map a pandas dtype to an SQLite column type
+    """
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+class _CountingReader(io.RawIOBase):
+    """
+    Raw byte stream that counts how much of the source has been consumed
+    """
+
+    def __init__(self, raw: BinaryIO):
+        self._raw = raw
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._raw.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.bytes_read += n
+        return n
+
+
+def _open_source(source: CsvSource) -> Tuple[BinaryIO, Optional[int], bool]:
+    """
+    Return (binary stream, total size if known, whether we opened it)
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb"), os.path.getsize(source), True
+    if isinstance(source, bytes):
+        return io.BytesIO(source), len(source), True
+
+    # File-like object, e.g. a Streamlit UploadedFile
+    if hasattr(source, "seek"):
+        source.seek(0)
+    total = getattr(source, "size", None)
+    if total is None and hasattr(source, "getbuffer"):
+        total = source.getbuffer().nbytes
+    return source, total, False
+
+
+class _SourceReader:
+    """
+    CSV source that can be read again from the start (after a widening) and
+    counts the bytes consumed by the current pass
+    """
+
+    def __init__(self, source: CsvSource):
+        self.raw, self.total_bytes, self._owned = _open_source(source)
+        self._counter = _CountingReader(self.raw)
+
+    @property
+    def bytes_read(self) -> int:
+        return self._counter.bytes_read
+
+    def rewind(self) -> io.BufferedReader:
+        if self._counter.bytes_read:
+            if not hasattr(self.raw, "seek"):
+                raise ValueError("The CSV source cannot be re-read")
+            self.raw.seek(0)
+        self._counter = _CountingReader(self.raw)
+        return io.BufferedReader(self._counter, buffer_size=1 << 20)
+
+    def close(self) -> None:
+        if self._owned:
+            self.raw.close()
+
+
+# --- plan inference ---------------------------------------------------------
+
+def _int_sizes(values: np.ndarray) -> int:
+    """
+    Total bytes SQLite needs to store these integers in records
+    """
+    if values.size == 0:
+        return 0
+    mag = np.abs(values.astype(np.float64))
+    sizes = np.select(
+        [values == 0, values == 1, mag < 1 << 7, mag < 1 << 15, mag < 1 << 23, mag < 1 << 31, mag < 1 << 47],
+        [0, 0, 1, 2, 3, 4, 6],
+        default=8,
+    )
+    return int(sizes.sum())
+
+
+def infer_column(values: pd.Series, dictionary: bool = False) -> Dict[str, Any]:
+    """
+    Narrowest kind that fits every non-null value of a column sample
+
+    Returns:
+        Dictionary with kind ("bool", "int", "float", "date", "datetime" or
+        "text"), date_format and dictionary (True for a text column worth
+        dictionary-encoding)
+    """
+    present = values.dropna().astype(str).str.strip()
+    present = present[present != ""]
+    info: Dict[str, Any] = {"kind": "text", "date_format": None, "dictionary": False}
+    if present.empty:
+        return info
+
+    if present.str.lower().isin(_BOOL_VALUES).all():
+        info["kind"] = "bool"
+        return info
+
+    numbers = pd.to_numeric(present, errors="coerce")
+    if numbers.notna().all():
+        # Codes such as "007" or "+62..." must keep their exact text
+        if present.str.match(r"^[+-]?0\d|^\+").any():
+            return info
+        integral = (numbers % 1 == 0).all() and numbers.abs().max() < 2 ** 63
+        info["kind"] = "int" if integral and not present.str.contains(r"[.eE]").any() else "float"
+        return info
+
+    for fmt in DATE_FORMATS:
+        parsed = pd.to_datetime(present, format=fmt, errors="coerce")
+        if parsed.notna().all():
+            info["kind"] = "datetime" if "%H" in fmt else "date"
+            info["date_format"] = fmt
+            return info
+
+    if dictionary:
+        distinct = present.nunique()
+        info["dictionary"] = (
+            distinct <= DICT_MAX_DISTINCT
+            and distinct <= len(present) * DICT_MAX_RATIO
+            and present.str.len().mean() > 2
+        )
+    return info
+
+
+def _column_plan(name: str, kind: str, date_format: Optional[str], dictionary: bool, epoch_dates: bool) -> Dict[str, Any]:
+    encoding = None
+    if kind in ("date", "datetime") and epoch_dates:
+        encoding = "epoch"
+    elif kind == "text" and dictionary:
+        encoding = "dict"
+    if kind in ("bool", "int") or encoding is not None:
+        sqlite_type = "INTEGER"
+    elif kind == "float":
+        sqlite_type = "REAL"
+    else:
+        sqlite_type = "TEXT"
+    return {
+        "name": name,
+        "kind": kind,
+        "sqlite_type": sqlite_type,
+        "encoding": encoding,
+        "date_format": date_format,
+    }
+
+
+def infer_plan(
+    sample: pd.DataFrame,
+    table_name: str,
+    epoch_dates: bool = False,
+    dictionary: bool = False,
+) -> Dict[str, Any]:
+    """
+    Build the import plan of a table from a sample read with dtype=str
+
+    Args:
+        sample: First rows of the CSV, every column as strings
+        table_name: Name of the table to create
+        epoch_dates: Store dates as integer Unix epoch seconds instead of
+            ISO-8601 text
+        dictionary: Move low-cardinality text columns into lookup tables
+
+    Returns:
+        Plan dictionary with table, strict and columns (name, kind,
+        sqlite_type, encoding, date_format)
+    """
+    columns = []
+    for name in sample.columns:
+        info = infer_column(sample[name], dictionary=dictionary)
+        columns.append(_column_plan(str(name), info["kind"], info["date_format"], info["dictionary"], epoch_dates))
+    return {"table": table_name, "strict": STRICT_TABLES, "epoch_dates": epoch_dates, "columns": columns}
+
+
+def widen_column(plan: Dict[str, Any], position: int, kind: str) -> None:
+    """
+    Give a column of the plan a wider kind, keeping its other options
+    """
+    column = plan["columns"][position]
+    keep_dict = column["encoding"] == "dict"
+    plan["columns"][position] = _column_plan(
+        column["name"], kind, None, keep_dict and kind == "text", plan.get("epoch_dates", False)
+    )
+
+
+def read_dtypes(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    dtype argument for pd.read_csv: numeric columns use pandas' fast parser,
+    everything else is read as text and converted by transform_chunk
+    """
+    return {c["name"]: str for c in plan["columns"] if c["kind"] not in ("int", "float")}
+
+
+# --- chunk transform --------------------------------------------------------
+
+class WidenColumn(Exception):
+    """
+    A value does not fit its column's kind; the import must restart
+    """
+
+    def __init__(self, position: int, kind: str, value: Any):
+        super().__init__(f"column {position} needs {kind} for value {value!r}")
+        self.position = position
+        self.kind = kind
+        self.value = value
+
+
+def _as_objects(values: pd.Series) -> list:
+    # Python scalars with None for missing values, ready for sqlite3
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def _text_lengths(values: pd.Series) -> int:
+    present = values.dropna()
+    return int(present.astype(str).str.len().sum()) if not present.empty else 0
+
+
+def transform_chunk(chunk: pd.DataFrame, plan: Dict[str, Any]) -> Tuple[List[list], List[Tuple[int, int]]]:
+    """
+    Convert a parsed chunk to the plan's storage types
+
+    Returns:
+        (one list of values per column, (default_bytes, stored_bytes) per
+        column), where default_bytes is what a plain pandas-typed import would
+        store for the same values
+
+    Raises:
+        WidenColumn: when a value does not fit its column's kind
+    """
+    columns: List[list] = []
+    sizes: List[Tuple[int, int]] = []
+    for position, column in enumerate(plan["columns"]):
+        kind = column["kind"]
+        values = chunk.iloc[:, position]
+        present = values.notna()
+
+        if kind in ("int", "float"):
+            if not (pd.api.types.is_integer_dtype(values) or pd.api.types.is_float_dtype(values)):
+                numbers = pd.to_numeric(values, errors="coerce")
+                bad = present & numbers.isna()
+                if bad.any():
+                    raise WidenColumn(position, "text", values[bad].iloc[0])
+                raise WidenColumn(position, "float" if kind == "int" else "text", values[present].iloc[0])
+            if kind == "int" and pd.api.types.is_float_dtype(values):
+                fraction = values[present] % 1 != 0
+                if fraction.any():
+                    raise WidenColumn(position, "float", values[present][fraction].iloc[0])
+            if kind == "int":
+                ints = values.astype("Int64")
+                stored = _int_sizes(ints[present].to_numpy(dtype=np.int64))
+                columns.append(_as_objects(ints) if not present.all() else values.astype(np.int64).tolist())
+            else:
+                stored = 8 * int(present.sum())
+                columns.append(values.astype(np.float64).tolist())
+            sizes.append((stored, stored))
+            continue
+
+        default = _text_lengths(values)
+        if kind == "bool":
+            mapped = values.str.strip().str.lower().map(_BOOL_VALUES)
+            bad = present & mapped.isna()
+            if bad.any():
+                raise WidenColumn(position, "text", values[bad].iloc[0])
+            columns.append(_as_objects(mapped.astype("Int64")))
+            # SQLite stores 0 and 1 in the record header alone
+            sizes.append((default, 0))
+        elif kind in ("date", "datetime"):
+            parsed = pd.to_datetime(values, format=column["date_format"], errors="coerce")
+            bad = present & parsed.isna()
+            if bad.any():
+                raise WidenColumn(position, "text", values[bad].iloc[0])
+            if column["encoding"] == "epoch":
+                epoch = parsed.astype("datetime64[s]").astype("int64")
+                epoch = pd.Series(epoch.to_numpy(), index=values.index).where(present)
+                ints = epoch.astype("Int64")
+                columns.append(_as_objects(ints))
+                sizes.append((default, _int_sizes(ints[present].to_numpy(dtype=np.int64))))
+            else:
+                text = parsed.dt.strftime("%Y-%m-%d %H:%M:%S" if kind == "datetime" else "%Y-%m-%d")
+                columns.append(_as_objects(text))
+                sizes.append((default, _text_lengths(text)))
+        else:
+            columns.append(_as_objects(values))
+            sizes.append((default, default))
+    return columns, sizes
+
+
+# --- writer -----------------------------------------------------------------
+
+def _ensure_metadata(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {METADATA_TABLE} (
+            table_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            column_name TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            sqlite_type TEXT NOT NULL,
+            encoding TEXT,
+            date_format TEXT,
+            PRIMARY KEY (table_name, position)
+        )
+        """
+    )
+
+
+def _ensure_row_hashes(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {ROW_HASH_TABLE} (
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            hash INTEGER NOT NULL,
+            PRIMARY KEY (table_name, row_id)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def _has_row_hashes(conn: sqlite3.Connection, table_name: str) -> bool:
+    return _has_table(conn, ROW_HASH_TABLE) and conn.execute(
+        f"SELECT 1 FROM {ROW_HASH_TABLE} WHERE table_name = ? LIMIT 1", (table_name,)
+    ).fetchone() is not None
+
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def load_plan(conn: sqlite3.Connection, table_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Import plan recorded for a table, or None if it was not created here
+    """
+    if not _has_table(conn, METADATA_TABLE):
+        return None
+    rows = conn.execute(
+        f"SELECT column_name, kind, sqlite_type, encoding, date_format FROM {METADATA_TABLE} "
+        "WHERE table_name = ? ORDER BY position",
+        (table_name,),
+    ).fetchall()
+    if not rows:
+        return None
+    columns = [
+        {"name": r[0], "kind": r[1], "sqlite_type": r[2], "encoding": r[3], "date_format": r[4]}
+        for r in rows
+    ]
+    return {
+        "table": table_name,
+        "strict": STRICT_TABLES,
+        "epoch_dates": any(c["encoding"] == "epoch" for c in columns),
+        "columns": columns,
+    }
+
+
+def plan_from_table(conn: sqlite3.Connection, table_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Plan of an existing table: the recorded one, or one derived from the
+    declared column types for tables created elsewhere. None if there is no
+    such table.
+    """
+    plan = load_plan(conn, table_name)
+    if plan is not None or not _has_table(conn, table_name):
+        return plan
+    columns = []
+    for name, declared in conn.execute("SELECT name, type FROM pragma_table_info(?)", (table_name,)):
+        affinity = (declared or "").upper()
+        if "INT" in affinity:
+            kind = "int"
+        elif any(t in affinity for t in ("REAL", "FLOA", "DOUB")):
+            kind = "float"
+        else:
+            kind = "text"
+        columns.append({
+            "name": name, "kind": kind, "sqlite_type": declared or "TEXT", "encoding": None, "date_format": None,
+        })
+    return {"table": table_name, "strict": False, "epoch_dates": False, "columns": columns}
+
+
+def profile_table(conn: sqlite3.Connection, plan: Dict[str, Any], chunksize: int = IMPORT_CHUNK_ROWS) -> TableProfile:
+    """
+    Profile an existing table by scanning it once, e.g. before the first
+    append to a table imported without a profile
+    """
+    profile = TableProfile.for_plan(plan)
+    select = ", ".join(quote_ident(c["name"]) for c in plan["columns"])
+    cursor = conn.execute(f"SELECT {select} FROM {quote_ident(plan['table'])}")
+    while True:
+        rows = cursor.fetchmany(chunksize)
+        if not rows:
+            break
+        profile.update([list(values) for values in zip(*rows)])
+    return profile
+
+
+def row_hashes(columns: List[list]) -> List[int]:
+    """
+    Stable 64-bit content hash of each row of a transformed chunk
+    """
+    frame = pd.DataFrame({i: pd.Series(values, dtype=object) for i, values in enumerate(columns)})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().view(np.int64).tolist()
+
+
+def data_table_name(plan: Dict[str, Any]) -> str:
+    """
+    Table that holds the rows: the table itself, or "<table>__data" when
+    some columns are dictionary-encoded
+    """
+    if any(c["encoding"] == "dict" for c in plan["columns"]):
+        return f"{plan['table']}__data"
+    return plan["table"]
+
+
+def lookup_table_name(table_name: str, column_name: str) -> str:
+    return f"{table_name}__lookup_{column_name}"
+
+
+def fulltext_table_name(table_name: str) -> str:
+    return f"{table_name}__fts"
+
+
+# Tables FTS5 creates next to a full-text index
+_FTS_SHADOW_SUFFIXES = ("_data", "_idx", "_docsize", "_config", "_content")
+
+
+def hidden_tables(conn: sqlite3.Connection) -> Set[str]:
+    """
+    Tables that are storage details rather than user tables: metadata, the
+    data/lookup tables behind dictionary-encoded views and full-text indexes
+    """
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '\\_dbassist\\_%' ESCAPE '\\'")}
+    for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%' "
+        "AND name LIKE '%\\_\\_fts' ESCAPE '\\'"
+    ):
+        names.add(name)
+        names.update(name + suffix for suffix in _FTS_SHADOW_SUFFIXES)
+    if METADATA_TABLE in names:
+        for table, column in conn.execute(
+            f"SELECT table_name, column_name FROM {METADATA_TABLE} WHERE encoding = 'dict'"
+        ):
+            names.add(f"{table}__data")
+            names.add(lookup_table_name(table, column))
+    return names
+
+
+def drop_table_objects(conn: sqlite3.Connection, table_name: str) -> None:
+    """
+    Drop a table or view along with its lookup tables, full-text index and
+    metadata
+    """
+    plan = load_plan(conn, table_name)
+    row = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = ? AND type IN ('table', 'view')", (table_name,)
+    ).fetchone()
+    if row is not None:
+        conn.execute(f"DROP {'VIEW' if row[0] == 'view' else 'TABLE'} {quote_ident(table_name)}")
+    # Its sync triggers go with the table they are on
+    conn.execute(f"DROP TABLE IF EXISTS {quote_ident(fulltext_table_name(table_name))}")
+    if plan is not None:
+        for column in plan["columns"]:
+            if column["encoding"] == "dict":
+                conn.execute(f"DROP TABLE IF EXISTS {quote_ident(lookup_table_name(table_name, column['name']))}")
+        conn.execute(f"DROP TABLE IF EXISTS {quote_ident(table_name + '__data')}")
+        conn.execute(f"DELETE FROM {METADATA_TABLE} WHERE table_name = ?", (table_name,))
+    if _has_table(conn, ROW_HASH_TABLE):
+        conn.execute(f"DELETE FROM {ROW_HASH_TABLE} WHERE table_name = ?", (table_name,))
+    drop_profile(conn, table_name)
+
+
+def staging_table_name(table_name: str) -> str:
+    """
+    Hidden name a batch import builds a table under until the file is
+    complete, so a failed file leaves the existing table untouched
+    """
+    return f"_dbassist_staging_{table_name}"
+
+
+def rename_table_objects(conn: sqlite3.Connection, table_name: str, new_name: str) -> None:
+    """
+    Rename an imported table along with its lookup tables and metadata. A
+    table of the new name must not exist.
+    """
+    plan = load_plan(conn, table_name)
+    if plan is None:
+        raise ValueError(f"Table '{table_name}' was not imported")
+    if data_table_name(plan) == table_name:
+        conn.execute(f"ALTER TABLE {quote_ident(table_name)} RENAME TO {quote_ident(new_name)}")
+    else:
+        # The view names its tables, so it is created again for the new names
+        conn.execute(f"DROP VIEW {quote_ident(table_name)}")
+        for column in plan["columns"]:
+            if column["encoding"] == "dict":
+                conn.execute(
+                    f"ALTER TABLE {quote_ident(lookup_table_name(table_name, column['name']))} "
+                    f"RENAME TO {quote_ident(lookup_table_name(new_name, column['name']))}"
+                )
+        conn.execute(f"ALTER TABLE {quote_ident(table_name + '__data')} RENAME TO {quote_ident(new_name + '__data')}")
+        TableWriter(conn, dict(plan, table=new_name)).create_view()
+    conn.execute(f"UPDATE {METADATA_TABLE} SET table_name = ? WHERE table_name = ?", (new_name, table_name))
+    if _has_table(conn, ROW_HASH_TABLE):
+        conn.execute(f"UPDATE {ROW_HASH_TABLE} SET table_name = ? WHERE table_name = ?", (new_name, table_name))
+    drop_profile(conn, table_name)
+
+
+class TableWriter:
+    """
+    Creates the tables of an import plan and writes transformed chunks.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, plan: Dict[str, Any]):
+        self.conn = conn
+        self.plan = plan
+        self.table = plan["table"]
+        self.data_table = data_table_name(plan)
+        self.dict_positions = [i for i, c in enumerate(plan["columns"]) if c["encoding"] == "dict"]
+        # value -> id for every dictionary-encoded column
+        self.dictionaries: Dict[int, Dict[str, int]] = {i: {} for i in self.dict_positions}
+        self.key_columns: List[str] = []
+        self.row_hash = False
+        # Rows inserted or updated; unchanged rows skipped by an upsert are not counted
+        self.changed = 0
+        self.insert_sql = self._insert_sql()
+
+    def _insert_sql(self, key_columns: Optional[List[str]] = None) -> str:
+        names = [c["name"] for c in self.plan["columns"]]
+        table = quote_ident(self.data_table)
+        sql = (
+            f"INSERT INTO {table} ({', '.join(quote_ident(n) for n in names)}) "
+            f"VALUES ({', '.join('?' for _ in names)})"
+        )
+        if not key_columns:
+            return sql
+        sql += f" ON CONFLICT ({', '.join(quote_ident(k) for k in key_columns)}) DO "
+        updates = [quote_ident(n) for n in names if n not in key_columns]
+        if not updates:
+            return sql + "NOTHING"
+        return sql + "UPDATE SET " + ", ".join(f"{n} = excluded.{n}" for n in updates)
+
+    def create(self) -> None:
+        """
+        Replace any existing table of the same name with the plan's tables
+        """
+        conn = self.conn
+        drop_table_objects(conn, self.table)
+        strict = " STRICT" if self.plan.get("strict") else ""
+        columns = ", ".join(f"{quote_ident(c['name'])} {c['sqlite_type']}" for c in self.plan["columns"])
+        conn.execute(f"CREATE TABLE {quote_ident(self.data_table)} ({columns}){strict}")
+
+        if self.dict_positions:
+            for i in self.dict_positions:
+                lookup = quote_ident(lookup_table_name(self.table, self.plan["columns"][i]["name"]))
+                conn.execute(
+                    f"CREATE TABLE {lookup} (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE){strict}"
+                )
+            self.create_view()
+
+        _ensure_metadata(conn)
+        conn.executemany(
+            f"INSERT INTO {METADATA_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (self.table, i, c["name"], c["kind"], c["sqlite_type"], c["encoding"], c["date_format"])
+                for i, c in enumerate(self.plan["columns"])
+            ],
+        )
+
+    def create_view(self) -> None:
+        """
+        Create the view that joins a dictionary-encoded table's data table
+        back to its lookup tables
+        """
+        select, joins = [], []
+        for i, column in enumerate(self.plan["columns"]):
+            name = quote_ident(column["name"])
+            if column["encoding"] != "dict":
+                select.append(f"d.{name}")
+                continue
+            lookup = quote_ident(lookup_table_name(self.table, column["name"]))
+            select.append(f"l{i}.value AS {name}")
+            joins.append(f"LEFT JOIN {lookup} AS l{i} ON l{i}.id = d.{name}")
+        self.conn.execute(
+            f"CREATE VIEW {quote_ident(self.table)} AS SELECT {', '.join(select)} "
+            f"FROM {quote_ident(self.data_table)} AS d {' '.join(joins)}"
+        )
+
+    def open_existing(self, key_columns: Optional[List[str]] = None, skip_unchanged: bool = False) -> None:
+        """
+        Prepare to add rows to the existing tables instead of creating them.
+
+        Args:
+            key_columns: Upsert on these columns; a unique index on them is
+                created if needed
+            skip_unchanged: Keep a content hash per row (by rowid, in
+                ROW_HASH_TABLE) so that upserting an unchanged row writes
+                nothing
+        """
+        conn = self.conn
+        self.load_dictionaries()
+        self.key_columns = list(key_columns or [])
+        # Once a table has hashes, every upsert keeps them current. Appended
+        # rows have none, so the next upsert writes them.
+        self.row_hash = bool(key_columns) and (skip_unchanged or _has_row_hashes(conn, self.table))
+        if self.row_hash:
+            try:
+                conn.execute(f"SELECT rowid FROM {quote_ident(self.data_table)} LIMIT 0")
+            except sqlite3.OperationalError:
+                raise ValueError(f"Table '{self.table}' has no rowid to keep row hashes by") from None
+            _ensure_row_hashes(conn)
+        if key_columns:
+            index = quote_ident(f"ux_{self.data_table}__{'__'.join(key_columns)}")
+            try:
+                conn.execute(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {quote_ident(self.data_table)} "
+                    f"({', '.join(quote_ident(k) for k in key_columns)})"
+                )
+            except sqlite3.IntegrityError:
+                raise ValueError(
+                    f"Key columns {', '.join(key_columns)} are not unique in table '{self.table}'"
+                ) from None
+        self.insert_sql = self._insert_sql(key_columns)
+
+    def load_dictionaries(self) -> None:
+        """
+        Read the existing lookup tables, e.g. before appending rows
+        """
+        for i in self.dict_positions:
+            lookup = quote_ident(lookup_table_name(self.table, self.plan["columns"][i]["name"]))
+            self.dictionaries[i] = {value: id_ for id_, value in self.conn.execute(f"SELECT id, value FROM {lookup}")}
+
+    def encode(self, columns: List[list], sizes: Optional[List[Tuple[int, int]]] = None) -> List[list]:
+        """
+        Replace dictionary-encoded values by their ids, adding new values to
+        the lookup tables (and their cost to sizes)
+        """
+        for i in self.dict_positions:
+            mapping = self.dictionaries[i]
+            new = []
+            for value in set(columns[i]):
+                if value is not None and value not in mapping:
+                    mapping[value] = len(mapping) + 1
+                    new.append((mapping[value], value))
+            if new:
+                lookup = quote_ident(lookup_table_name(self.table, self.plan["columns"][i]["name"]))
+                self.conn.executemany(f"INSERT INTO {lookup} VALUES (?, ?)", new)
+            get = mapping.get
+            columns[i] = [get(v) if v is not None else None for v in columns[i]]
+            if sizes is not None:
+                ids = np.array([v for v in columns[i] if v is not None], dtype=np.int64)
+                lookup_bytes = sum(len(str(v)) + 4 for _, v in new)
+                sizes[i] = (sizes[i][0], _int_sizes(ids) + lookup_bytes)
+        return columns
+
+    def write(self, columns: List[list], sizes: Optional[List[Tuple[int, int]]] = None) -> int:
+        """
+        Insert one transformed chunk and return the number of rows written
+        """
+        columns = self.encode(columns, sizes)
+        rows = list(zip(*columns))
+        if not self.row_hash:
+            before = self.conn.total_changes
+            self.conn.executemany(self.insert_sql, rows)
+            self.changed += self.conn.total_changes - before
+            return len(rows)
+
+        positions = [[c["name"] for c in self.plan["columns"]].index(k) for k in self.key_columns]
+        keys = [tuple(row[i] for i in positions) for row in rows]
+        stored = self._stored_hashes(keys)
+        changed = [
+            (row, key, digest) for row, key, digest in zip(rows, keys, row_hashes(columns))
+            if stored.get(key) != digest
+        ]
+        before = self.conn.total_changes
+        self.conn.executemany(self.insert_sql, [row for row, _, _ in changed])
+        self.changed += self.conn.total_changes - before
+        # NULL keys never match, so such rows get no hash and are always written
+        match = " AND ".join(f"{quote_ident(k)} = ?" for k in self.key_columns)
+        self.conn.executemany(
+            f"INSERT INTO {ROW_HASH_TABLE} (table_name, row_id, hash) "
+            f"SELECT ?, rowid, ? FROM {quote_ident(self.data_table)} WHERE {match} "
+            "ON CONFLICT (table_name, row_id) DO UPDATE SET hash = excluded.hash",
+            [(self.table, digest) + key for _, key, digest in changed],
+        )
+        return len(rows)
+
+    def _stored_hashes(self, keys: List[tuple]) -> Dict[tuple, int]:
+        """
+        Stored hash of the rows with the given key values, by key
+        """
+        names = ", ".join(f"d.{quote_ident(k)}" for k in self.key_columns)
+        row = "(" + ", ".join("?" for _ in self.key_columns) + ")"
+        step = max(_HASH_LOOKUP_PARAMS // len(self.key_columns), 1)
+        unique = list(set(keys))
+        stored: Dict[tuple, int] = {}
+        for start in range(0, len(unique), step):
+            batch = unique[start:start + step]
+            for found in self.conn.execute(
+                f"SELECT {names}, h.hash FROM {quote_ident(self.data_table)} AS d "
+                f"JOIN {ROW_HASH_TABLE} AS h ON h.table_name = ? AND h.row_id = d.rowid "
+                f"WHERE ({names}) IN (VALUES {', '.join(row for _ in batch)})",
+                [self.table] + [value for key in batch for value in key],
+            ):
+                stored[tuple(found[:-1])] = found[-1]
+        return stored
+
+
+# --- import -----------------------------------------------------------------
+
+def _read_sample(reader: io.BufferedReader) -> pd.DataFrame:
+    return pd.read_csv(reader, dtype=str, nrows=INFER_SAMPLE_ROWS)
+
+
+@contextmanager
+def _bulk_load(conn: sqlite3.Connection):
+    """
+    Apply IMPORT_PRAGMAS for the duration of the block, rolling back on error
+    """
+    saved = {
+        name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+        for name in IMPORT_PRAGMAS
+    }
+    for name, value in IMPORT_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        for name, value in saved.items():
+            conn.execute(f"PRAGMA {name}={value}")
+
+
+def _match_columns(sample: pd.DataFrame, plan: Dict[str, Any], key_columns: Optional[List[str]]) -> List[str]:
+    """
+    Check that a CSV has the columns of the table it is added to, and
+    return them in table order
+    """
+    names = [c["name"] for c in plan["columns"]]
+    header = [str(c) for c in sample.columns]
+    missing = [n for n in names if n not in header]
+    extra = [n for n in header if n not in names]
+    if missing or extra:
+        raise ValueError(
+            f"The CSV columns do not match table '{plan['table']}': "
+            f"missing {missing or 'none'}, unexpected {extra or 'none'}"
+        )
+    unknown = [k for k in key_columns or [] if k not in names]
+    if unknown:
+        raise ValueError(f"Key columns not in table '{plan['table']}': {', '.join(unknown)}")
+    return names
+
+
+def _build_report(plan: Dict[str, Any], sizes_total: List[List[int]]) -> Dict[str, Any]:
+    """
+    Bytes a plain import would store versus bytes stored, overall and per column
+    """
+    default_bytes = sum(t[0] for t in sizes_total)
+    stored_bytes = sum(t[1] for t in sizes_total)
+    return {
+        "default_bytes": default_bytes,
+        "stored_bytes": stored_bytes,
+        "bytes_saved": default_bytes - stored_bytes,
+        "columns": [
+            dict(column, default_bytes=t[0], stored_bytes=t[1])
+            for column, t in zip(plan["columns"], sizes_total)
+        ],
+    }
+
+
+def import_csv(
+    db_path: str,
+    source: CsvSource,
+    table_name: str,
+    chunksize: int = IMPORT_CHUNK_ROWS,
+    progress_callback: Optional[ProgressCallback] = None,
+    epoch_dates: bool = False,
+    dictionary: bool = False,
+    mode: str = "replace",
+    key_columns: Optional[List[str]] = None,
+    skip_unchanged: bool = False,
+) -> Dict[str, Any]:
+    """
+    Stream a CSV file into ``table_name``.
+
+    In replace mode any existing table is dropped and recreated. Append and
+    upsert keep the existing table, its types and its indexes, so loading a
+    delta costs time proportional to the delta; the CSV must have the
+    table's columns. A missing table is created as in replace mode. An
+    upsert that changes rows scans the table once more afterwards, to
+    rebuild its column profile.
+
+    Args:
+        db_path: Path of the SQLite database file
+        source: CSV file path or binary file-like object (e.g. an upload buffer)
+        table_name: Name of the table to create
+        chunksize: Number of rows parsed and inserted per batch
+        progress_callback: Called after each batch with the import statistics
+        epoch_dates: Store date columns as Unix epoch seconds
+        dictionary: Dictionary-encode low-cardinality text columns
+        mode: "replace", "append" or "upsert"
+        key_columns: Columns identifying a row, required for upsert
+        skip_unchanged: On upsert, skip rows whose content hash did not change
+
+    Returns:
+        Dictionary with mode, rows, written (rows inserted or updated),
+        bytes_read, total_bytes, elapsed, rows_per_sec, restarts, plan and
+        report (bytes a plain import would store, bytes stored and bytes
+        saved, overall and per column)
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode '{mode}', expected one of {', '.join(IMPORT_MODES)}")
+    if mode == "upsert" and not key_columns:
+        raise ValueError("Upsert needs at least one key column")
+
+    reader = _SourceReader(source)
+    start = time.perf_counter()
+    stats: Dict[str, Any] = {
+        "mode": mode, "rows": 0, "written": 0, "bytes_read": 0, "total_bytes": reader.total_bytes, "restarts": 0,
+    }
+
+    def report() -> None:
+        elapsed = time.perf_counter() - start
+        stats["bytes_read"] = reader.bytes_read
+        stats["elapsed"] = elapsed
+        stats["rows_per_sec"] = stats["rows"] / elapsed if elapsed > 0 else 0.0
+        if progress_callback is not None:
+            progress_callback({k: v for k, v in stats.items() if k not in ("plan", "report")})
+
+    try:
+        sample = _read_sample(reader.rewind())
+        with write_connection(db_path) as conn, _bulk_load(conn):
+            plan = plan_from_table(conn, table_name) if mode != "replace" else None
+            appending = plan is not None
+            if appending:
+                names = _match_columns(sample, plan, key_columns)
+            else:
+                plan = infer_plan(sample, table_name, epoch_dates, dictionary)
+            while True:
+                stats["rows"] = 0
+                sizes_total = [[0, 0] for _ in plan["columns"]]
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    writer = TableWriter(conn, plan)
+                    if appending:
+                        writer.open_existing(key_columns if mode == "upsert" else None, skip_unchanged)
+                        # Sketches cannot subtract the rows an upsert replaces, so
+                        # its profile is rebuilt from the table afterwards
+                        profile = None if mode == "upsert" else (
+                            TableProfile.load(conn, table_name) or profile_table(conn, plan, chunksize)
+                        )
+                    else:
+                        writer.create()
+                        profile = TableProfile.for_plan(plan)
+                    for chunk in pd.read_csv(reader.rewind(), chunksize=chunksize, dtype=read_dtypes(plan)):
+                        if appending:
+                            chunk = chunk[names]
+                        columns, sizes = transform_chunk(chunk, plan)
+                        if profile is not None:
+                            profile.update(columns)
+                        stats["rows"] += writer.write(columns, sizes)
+                        stats["written"] = writer.changed
+                        for total, (default, stored) in zip(sizes_total, sizes):
+                            total[0] += default
+                            total[1] += stored
+                        report()
+                    if profile is None and not writer.changed:
+                        profile = TableProfile.load(conn, table_name)
+                    if profile is None:
+                        profile = profile_table(conn, plan, chunksize)
+                    profile.save(conn)
+                    conn.commit()
+                    break
+                except WidenColumn as e:
+                    conn.rollback()
+                    if appending:
+                        column = plan["columns"][e.position]
+                        raise ValueError(
+                            f"Value {e.value!r} does not fit column '{column['name']}' ({column['kind']}) "
+                            f"of table '{table_name}'; import the file in replace mode to change its type"
+                        ) from None
+                    # The sample missed a value; start over with a wider type
+                    widen_column(plan, e.position, e.kind)
+                    stats["restarts"] += 1
+    finally:
+        reader.close()
+
+    stats["plan"] = plan
+    stats["report"] = _build_report(plan, sizes_total)
+    report()
+    return stats
+
+
+# --- batch import -----------------------------------------------------------
+#
+# Parsing and type conversion are CPU-bound, so a batch of files is parsed in
+# a process pool. Workers send transformed chunks over a bounded queue to the
+# calling process, which owns the only SQLite connection and writes them in
+# arrival order: SQLite allows one writer at a time anyway, and a single
+# connection keeps dictionary ids and metadata consistent.
+
+# Block size used to copy uploads of a batch to temporary files
+SPOOL_BLOCK_BYTES = 1024 * 1024
+# Transformed chunks buffered per worker before parsing blocks
+BATCH_QUEUE_CHUNKS = 2
+# How often blocked workers and the writer look up from the queue
+_BATCH_POLL_SECONDS = 0.5
+
+BatchProgressCallback = Callable[[int, Dict[str, Any]], None]
+
+
+def _batch_put(out, message: tuple, stopped, index: int) -> bool:
+    """
+    Queue a message for the writer; False once the writer gave up on the file
+    """
+    while not stopped.get(index):
+        try:
+            out.put(message, timeout=_BATCH_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _parse_worker(
+    index: int,
+    source: CsvSource,
+    table_name: str,
+    chunksize: int,
+    epoch_dates: bool,
+    dictionary: bool,
+    out,
+    stopped,
+) -> None:
+    """
+    Parse one CSV file in a worker process and send its chunks to the writer.
+
+    Messages are (kind, file index, payload) tuples: start (plan, total
+    bytes), chunk (columns, sizes, bytes read), restart (widened plan), done
+    (column profiles, gathered in the worker too) and error (message).
+    """
+    try:
+        reader = _SourceReader(source)
+        try:
+            plan = infer_plan(_read_sample(reader.rewind()), table_name, epoch_dates, dictionary)
+            if not _batch_put(out, ("start", index, (plan, reader.total_bytes)), stopped, index):
+                return
+            while True:
+                profile = TableProfile.for_plan(plan)
+                try:
+                    for chunk in pd.read_csv(reader.rewind(), chunksize=chunksize, dtype=read_dtypes(plan)):
+                        columns, sizes = transform_chunk(chunk, plan)
+                        profile.update(columns)
+                        if not _batch_put(out, ("chunk", index, (columns, sizes, reader.bytes_read)), stopped, index):
+                            return
+                    break
+                except WidenColumn as e:
+                    # The writer recreates the table, then the file is parsed again
+                    widen_column(plan, e.position, e.kind)
+                    if not _batch_put(out, ("restart", index, plan), stopped, index):
+                        return
+        finally:
+            reader.close()
+        _batch_put(out, ("done", index, profile), stopped, index)
+    except Exception as e:
+        _batch_put(out, ("error", index, str(e)), stopped, index)
+
+
+def default_table_name(filename: str) -> str:
+    """
+    Table name derived from a CSV file name, e.g. "Sales 2024.csv" -> "sales_2024"
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return re.sub(r"\W+", "_", stem).strip("_").lower() or "table"
+
+
+def _batch_source(source: CsvSource) -> Tuple[CsvSource, Optional[str]]:
+    """
+    Something a worker process can open, and the temporary file to delete
+    afterwards. Paths are passed as they are; buffers and bytes are copied
+    to a temporary file block by block, so workers read them from disk
+    instead of getting a pickled copy of every upload.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return source, None
+    fd, path = tempfile.mkstemp(prefix="dbassist_import_", suffix=".csv")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(source, bytes):
+                f.write(source)
+            else:
+                if hasattr(source, "seek"):
+                    source.seek(0)
+                shutil.copyfileobj(source, f, SPOOL_BLOCK_BYTES)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, path
+
+
+def import_many(
+    db_path: str,
+    files: List[Tuple[CsvSource, str]],
+    workers: Optional[int] = None,
+    chunksize: int = IMPORT_CHUNK_ROWS,
+    progress_callback: Optional[BatchProgressCallback] = None,
+    epoch_dates: bool = False,
+    dictionary: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Import several CSV files at once, one table per file, replacing existing
+    tables.
+
+    Files are parsed in parallel by a process pool and written by this
+    process over a single connection. Each file is built under a hidden
+    staging name and replaces the existing table only once it is complete,
+    so a file that fails leaves any existing table of its name as it was;
+    the other files are still imported. Uploads are copied to temporary
+    files for the workers.
+
+    Args:
+        db_path: Path of the SQLite database file
+        files: (CSV file path or buffer, table name) pairs
+        workers: Number of parsing processes (default: one per CPU, at most one per file)
+        chunksize: Number of rows parsed and inserted per batch
+        progress_callback: Called with (file index, statistics) as files progress
+        epoch_dates: Store date columns as Unix epoch seconds
+        dictionary: Dictionary-encode low-cardinality text columns
+
+    Returns:
+        One dictionary per file, in input order, with table, status ("done"
+        or "failed"), rows, bytes_read, total_bytes, restarts, elapsed and
+        either plan and report (see import_csv) or error
+    """
+    results: List[Dict[str, Any]] = []
+    writers: Dict[int, TableWriter] = {}
+    sizes_total: Dict[int, List[List[int]]] = {}
+    started: Dict[int, float] = {}
+
+    def report(index: int) -> None:
+        stats = results[index]
+        if index in started:
+            stats["elapsed"] = time.perf_counter() - started[index]
+        if progress_callback is not None:
+            progress_callback(index, {k: v for k, v in stats.items() if k not in ("plan", "report")})
+
+    pending: Set[int] = set()
+    seen: Set[str] = set()
+    for index, (_, table_name) in enumerate(files):
+        results.append({
+            "table": table_name, "status": "queued", "rows": 0, "bytes_read": 0,
+            "total_bytes": None, "restarts": 0, "elapsed": 0.0,
+        })
+        if table_name.lower() in seen:
+            results[index].update(status="failed", error=f"Table '{table_name}' appears more than once in the batch")
+            report(index)
+        else:
+            seen.add(table_name.lower())
+            pending.add(index)
+    if not pending:
+        return results
+
+    workers = workers or min(len(pending), os.cpu_count() or 1)
+
+    def begin_table(index: int, plan: Dict[str, Any]) -> None:
+        writers[index] = TableWriter(conn, dict(plan, table=staging_table_name(plan["table"])))
+        writers[index].create()
+        sizes_total[index] = [[0, 0] for _ in plan["columns"]]
+        results[index].update(status="importing", rows=0, plan=plan)
+
+    def fail(index: int, error: str) -> None:
+        stopped[index] = True
+        if index in writers and conn.in_transaction:
+            drop_table_objects(conn, staging_table_name(results[index]["table"]))
+        results[index].pop("plan", None)
+        results[index].update(status="failed", error=error)
+        pending.discard(index)
+        report(index)
+
+    # Uploads are handed to the workers as temporary files
+    sources: Dict[int, CsvSource] = {}
+    spooled: List[str] = []
+    try:
+        for index in sorted(pending):
+            sources[index], temp = _batch_source(files[index][0])
+            if temp is not None:
+                spooled.append(temp)
+        # spawn: forking a multi-threaded server process is not safe
+        context = multiprocessing.get_context("spawn")
+        with context.Manager() as manager, ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            out = manager.Queue(maxsize=BATCH_QUEUE_CHUNKS * workers)
+            stopped = manager.dict()
+            futures = {
+                pool.submit(
+                    _parse_worker, index, sources[index], files[index][1],
+                    chunksize, epoch_dates, dictionary, out, stopped,
+                ): index
+                for index in sorted(pending)
+            }
+            try:
+                with write_connection(db_path) as conn, _bulk_load(conn):
+                    conn.execute("BEGIN IMMEDIATE")
+                    while pending:
+                        try:
+                            kind, index, payload = out.get(timeout=_BATCH_POLL_SECONDS)
+                        except queue.Empty:
+                            # A worker process that died never sends its error
+                            for future, index in futures.items():
+                                if index in pending and future.done() and future.exception() is not None:
+                                    fail(index, str(future.exception()))
+                            continue
+                        if index not in pending:
+                            continue
+                        try:
+                            if kind == "start":
+                                plan, results[index]["total_bytes"] = payload
+                                started[index] = time.perf_counter()
+                                begin_table(index, plan)
+                            elif kind == "restart":
+                                begin_table(index, payload)
+                                results[index]["restarts"] += 1
+                            elif kind == "chunk":
+                                columns, sizes, results[index]["bytes_read"] = payload
+                                results[index]["rows"] += writers[index].write(columns, sizes)
+                                for total, (default, stored) in zip(sizes_total[index], sizes):
+                                    total[0] += default
+                                    total[1] += stored
+                            elif kind == "done":
+                                table = results[index]["table"]
+                                drop_table_objects(conn, table)
+                                rename_table_objects(conn, staging_table_name(table), table)
+                                payload.save(conn)
+                                # Commit per finished file so the journal does not
+                                # grow with the whole batch
+                                conn.commit()
+                                conn.execute("BEGIN IMMEDIATE")
+                                results[index].update(
+                                    status="done",
+                                    report=_build_report(results[index]["plan"], sizes_total[index]),
+                                )
+                                pending.discard(index)
+                            else:
+                                fail(index, payload)
+                                continue
+                        except sqlite3.Error as e:
+                            if conn.in_transaction:
+                                fail(index, str(e))
+                            else:
+                                # SQLite rolled back the whole transaction, and with
+                                # it the other files written since the last commit
+                                for other in list(pending):
+                                    fail(other, f"Write failed: {e}")
+                            continue
+                        report(index)
+                    conn.commit()
+            except BaseException:
+                # Unblock workers waiting on a full queue so the pool can shut down
+                for index in pending:
+                    stopped[index] = True
+                raise
+    finally:
+        for path in spooled:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+    return results
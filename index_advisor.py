@@ -0,0 +1,607 @@
+"""
+Index advisor for the query log.
+
+Tables created by the importer have no indexes, so every filter or join the
+agent writes scans the whole table. The advisor re-plans the logged queries of
+a database with EXPLAIN QUERY PLAN, and for every table that is still scanned
+it proposes a composite index built from the query's predicates: equality
+columns first, then one range column, then ORDER BY / GROUP BY columns. When
+the query only touches a few columns of the table, the index is made covering.
+
+A dictionary-encoded table is a view over "<table>__data" (see importer.py).
+Queries against the view are analyzed as queries against that data table,
+which is where its indexes go.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from connections import read_connection, retry_on_busy, write_connection
+from importer import data_table_name, load_plan, quote_ident
+from query_log import get_query_log
+from summaries import SUMMARY_TABLE_PREFIX
+
+# Tables smaller than this are cheap to scan and never get an index
+INDEX_MIN_ROWS = 1_000
+# Longest index the advisor proposes, covering columns included
+INDEX_MAX_COLUMNS = 5
+# Default disk budget for automatically created indexes, per database
+INDEX_AUTO_BUDGET_BYTES = 256 * 1024 * 1024
+# Automatic indexes are only created for queries that cost at least this much
+INDEX_AUTO_MIN_BENEFIT_MS = 200.0
+# Logged query fingerprints considered per analysis, most expensive first
+INDEX_MAX_FINGERPRINTS = 200
+
+AUTO_INDEX_PREFIX = "ix_auto_"
+
+_TOKEN = re.compile(
+    r"""\s+
+    |(?P<ident>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|[A-Za-z_][\w$]*)
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)
+    |(?P<op><=|>=|==|!=|<>|\|\||[-+*/%=<>(),.;])
+    |(?P<other>.)""",
+    re.X | re.S,
+)
+
+_CLAUSES = {"select", "from", "where", "group", "order", "having", "limit", "on", "using", "window", "values", "set"}
+# Words that can follow a table reference but are never an alias
+_NOT_ALIAS = _CLAUSES | {
+    "join", "inner", "left", "right", "full", "outer", "cross", "natural", "union", "except",
+    "intersect", "as", "indexed", "not", "returning",
+}
+_EQ_OPS = {"=", "==", "is", "in"}
+_RANGE_OPS = {"<", ">", "<=", ">=", "between"}
+
+_PLAN_SCAN = re.compile(r"^SCAN (\S+)(?: USING (?:COVERING )?INDEX \S+)?$")
+# Skip-scan: the leading index column is not constrained, so every distinct
+# value of it is searched in turn
+_PLAN_SKIP_SCAN = re.compile(r"^SEARCH (\S+) USING .*\bANY\(")
+_PLAN_AUTOMATIC = re.compile(r"^SEARCH (\S+) USING AUTOMATIC (?:COVERING |PARTIAL )*INDEX \((.*)\)$")
+
+
+def _tokenize(sql: str) -> List[Tuple[str, str]]:
+    """
+    Split SQL into (kind, value) tokens; identifiers are unquoted and
+    lower-cased, keywords are plain identifiers
+    """
+    tokens = []
+    for m in _TOKEN.finditer(sql):
+        kind = m.lastgroup
+        if kind is None:
+            continue
+        value = m.group()
+        if kind == "ident":
+            quoted = value[0] in "\"`["
+            value = value[1:-1].replace('""', '"') if quoted else value
+            tokens.append(("qident" if quoted else "ident", value.lower()))
+        else:
+            tokens.append((kind, value.lower()))
+    return tokens
+
+
+def _table_refs(tokens: List[Tuple[str, str]]) -> Dict[str, str]:
+    """
+    Map every alias in FROM / JOIN clauses to its table; an unaliased table
+    is its own alias
+    """
+    refs: Dict[str, str] = {}
+    i = 0
+    in_from = []  # paren depth of each open FROM clause
+    depth = 0
+    expect_table = False
+    while i < len(tokens):
+        kind, value = tokens[i]
+        if value == "(":
+            depth += 1
+            # A subquery in FROM, not a table name
+            expect_table = False
+        elif value == ")":
+            depth -= 1
+            while in_from and in_from[-1] > depth:
+                in_from.pop()
+        elif kind == "ident" and value in ("from", "join"):
+            if value == "from":
+                in_from.append(depth)
+            expect_table = True
+        elif value == "," and in_from and in_from[-1] == depth:
+            expect_table = True
+        elif kind == "ident" and value in _CLAUSES and in_from and in_from[-1] == depth and value != "from":
+            in_from.pop()
+        elif expect_table and kind in ("ident", "qident"):
+            expect_table = False
+            table = value
+            # schema.table
+            if i + 2 < len(tokens) and tokens[i + 1][1] == "." and tokens[i + 2][0] in ("ident", "qident"):
+                table = tokens[i + 2][1]
+                i += 2
+            alias = table
+            j = i + 1
+            if j < len(tokens) and tokens[j] == ("ident", "as"):
+                j += 1
+            if j < len(tokens) and (tokens[j][0] == "qident" or (tokens[j][0] == "ident" and tokens[j][1] not in _NOT_ALIAS)):
+                alias = tokens[j][1]
+                i = j
+            refs[alias] = table
+        else:
+            expect_table = False
+        i += 1
+    return refs
+
+
+def analyze_query(
+    sql: str, schema: Dict[str, List[str]], views: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Find how a query uses the columns of each table it reads.
+
+    Args:
+        sql: The query text
+        schema: Lower-cased column names of every table in the database
+        views: Dictionary-encoded views, see _dictionary_views. A view is
+            reported as its data table; encoded columns hold lookup ids, so
+            only their equality tests with constants are kept.
+
+    Returns:
+        Dictionary keyed by alias with table, view (the dictionary-encoded
+        view read, or None), eq, join, range and order column lists,
+        referenced columns and star (True when ``*`` selects all columns of
+        the table)
+    """
+    views = views or {}
+    schema = dict(schema, **{name: view["columns"] for name, view in views.items()})
+    tokens = _tokenize(sql)
+    refs = {alias: table for alias, table in _table_refs(tokens).items() if table in schema}
+    usage = {
+        alias: {
+            "table": table, "view": None, "eq": [], "join": [], "range": [], "order": [],
+            "referenced": set(), "star": False,
+        }
+        for alias, table in refs.items()
+    }
+
+    def resolve(i: int) -> Tuple[Optional[str], Optional[str], int]:
+        """(alias, column, index of the column token) for a column reference at i"""
+        kind, value = tokens[i]
+        if kind not in ("ident", "qident"):
+            return None, None, i
+        if i + 2 < len(tokens) and tokens[i + 1][1] == "." and tokens[i + 2][0] in ("ident", "qident"):
+            alias, column = value, tokens[i + 2][1]
+            if alias in usage and column in schema[usage[alias]["table"]]:
+                return alias, column, i + 2
+            return None, None, i + 2
+        if i > 0 and tokens[i - 1][1] == ".":
+            return None, None, i
+        # An unqualified column belongs to the only table that has it
+        owners = [a for a, u in usage.items() if value in schema[u["table"]]]
+        if len(owners) == 1:
+            return owners[0], value, i
+        return None, None, i
+
+    clause = None
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        if kind == "ident" and value in _CLAUSES:
+            clause = value
+            i += 1
+            continue
+        if value == "*" and clause == "select":
+            prev = tokens[i - 1][1] if i else ""
+            if prev in ("select", ",", "distinct", "all"):
+                for u in usage.values():
+                    u["star"] = True
+            elif prev == "." and i >= 2 and tokens[i - 2][1] in usage:
+                usage[tokens[i - 2][1]]["star"] = True
+            i += 1
+            continue
+
+        alias, column, end = resolve(i)
+        if alias is None:
+            i = end + 1
+            continue
+        u = usage[alias]
+        u["referenced"].add(column)
+        nxt = tokens[end + 1][1] if end + 1 < len(tokens) else ""
+        if nxt in ("not", "is") and end + 2 < len(tokens) and tokens[end + 2][1] in ("not", "in", "between", "null"):
+            # NOT IN, IS NOT, IS NULL, ... cannot use an index for a lookup
+            nxt = nxt + " " + tokens[end + 2][1]
+        prev = tokens[i - 1][1] if i else ""
+        if clause in ("where", "on", "having"):
+            if nxt in _EQ_OPS or prev in ("=", "=="):
+                at = end + 2 if nxt in _EQ_OPS else i - 2
+                other = tokens[at] if 0 <= at < len(tokens) else ("", "")
+                # Join columns go after columns compared with constants
+                is_join = other[0] in ("ident", "qident") and other[1] not in ("null", "true", "false", "(")
+                u["join" if is_join else "eq"].append(column)
+            elif nxt in _RANGE_OPS or prev in ("<", ">", "<=", ">="):
+                u["range"].append(column)
+        elif clause in ("order", "group"):
+            u["order"].append(column)
+        i = end + 1
+
+    for u in usage.values():
+        view = views.get(u["table"])
+        if view is not None:
+            # Lookup ids are neither in value order nor comparable to
+            # another table's values
+            for key in ("join", "range", "order"):
+                u[key] = [c for c in u[key] if c not in view["encoded"]]
+            u["view"], u["table"] = u["table"], view["table"]
+    return usage
+
+
+def _dedupe(columns: List[str]) -> List[str]:
+    seen = []
+    for column in columns:
+        if column not in seen:
+            seen.append(column)
+    return seen
+
+
+def propose_index(usage: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Build the composite (and if possible covering) index for one table usage
+    """
+    key = _dedupe(usage["eq"] + usage["join"])
+    ranges = [c for c in _dedupe(usage["range"]) if c not in key]
+    if ranges:
+        key.append(ranges[0])
+    else:
+        key += [c for c in _dedupe(usage["order"]) if c not in key]
+    key = key[:INDEX_MAX_COLUMNS]
+    if not key:
+        return None
+
+    columns = list(key)
+    covering = False
+    extra = sorted(usage["referenced"] - set(key))
+    if not usage["star"] and len(key) + len(extra) <= INDEX_MAX_COLUMNS:
+        columns += extra
+        covering = True
+    return {"table": usage["table"], "key_columns": key, "columns": columns, "covering": covering}
+
+
+def _scanned_aliases(plan: List[Tuple[int, int, str]]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Aliases read in full (or skip-scanned), and automatic indexes SQLite
+    had to build at run time (alias -> columns)
+    """
+    scanned, automatic = [], {}
+    for _, _, detail in plan:
+        m = _PLAN_SCAN.match(detail) or _PLAN_SKIP_SCAN.match(detail)
+        # A scan of a whole index (e.g. to avoid sorting) still reads every row
+        if m and not detail.startswith("SCAN CONSTANT ROW"):
+            scanned.append(m.group(1).lower())
+            continue
+        m = _PLAN_AUTOMATIC.match(detail)
+        if m:
+            cols = [part.split("=")[0].strip().lower() for part in m.group(2).split(" AND ")]
+            automatic[m.group(1).lower()] = cols
+    return scanned, automatic
+
+
+def _table_info(conn: sqlite3.Connection) -> Tuple[Dict[str, List[str]], Dict[str, List[List[str]]]]:
+    """
+    Lower-cased columns of each table, and the column lists of its indexes
+    """
+    columns: Dict[str, List[str]] = {}
+    indexes: Dict[str, List[List[str]]] = {}
+    for table, column in conn.execute(
+        "SELECT m.name, p.name FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p "
+        "WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite\\_%' ESCAPE '\\' ORDER BY m.rowid, p.cid"
+    ):
+        columns.setdefault(table.lower(), []).append(column.lower())
+    for table, index, column in conn.execute(
+        "SELECT m.name, il.name, ii.name FROM sqlite_master AS m "
+        "JOIN pragma_index_list(m.name) AS il JOIN pragma_index_info(il.name) AS ii "
+        "WHERE m.type = 'table' ORDER BY m.name, il.name, ii.seqno"
+    ):
+        per_table = indexes.setdefault(table.lower(), {})
+        per_table.setdefault(index, []).append((column or "").lower())
+    return columns, {t: list(ix.values()) for t, ix in indexes.items()}
+
+
+def _dictionary_views(conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+    """
+    Views of dictionary-encoded tables, keyed by lower-cased name: their data
+    table, its alias inside the view (query plans name that alias), and the
+    view's columns and encoded columns, all lower-cased
+    """
+    views: Dict[str, Dict[str, Any]] = {}
+    for name, sql in conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'view'").fetchall():
+        plan = load_plan(conn, name)
+        if plan is None or data_table_name(plan) == name:
+            continue
+        data = data_table_name(plan).lower()
+        alias = next((a for a, t in _table_refs(_tokenize(sql)).items() if t == data), data)
+        views[name.lower()] = {
+            "table": data,
+            "alias": alias,
+            "columns": [c["name"].lower() for c in plan["columns"]],
+            "encoded": {c["name"].lower() for c in plan["columns"] if c["encoding"] == "dict"},
+        }
+    return views
+
+
+def _plan_usages(
+    alias: str, usage: Dict[str, Dict[str, Any]], views: Dict[str, Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Table usages a plan line refers to. Inside a dictionary-encoded view the
+    plan names the view's own alias of its data table, not the query's.
+    """
+    if alias in usage:
+        return [usage[alias]]
+    return [u for u in usage.values() if u["view"] and views[u["view"]]["alias"] == alias]
+
+
+def _table_rows(conn: sqlite3.Connection, table: str) -> int:
+    """
+    Row count estimate: sqlite_stat1 when ANALYZE has run, else max(rowid)
+    """
+    try:
+        row = conn.execute(
+            "SELECT stat FROM sqlite_stat1 WHERE tbl = ? COLLATE NOCASE LIMIT 1", (table,)
+        ).fetchone()
+        if row and row[0]:
+            return int(row[0].split()[0])
+    except sqlite3.Error:
+        pass
+    try:
+        return conn.execute(f"SELECT max(rowid) FROM {quote_ident(table)}").fetchone()[0] or 0
+    except sqlite3.Error:
+        return conn.execute(f"SELECT count(*) FROM {quote_ident(table)}").fetchone()[0]
+
+
+def _int_bytes(value: int) -> int:
+    """
+    Bytes SQLite uses to store an integer in a record
+    """
+    for size, bound in ((1, 1 << 7), (2, 1 << 15), (3, 1 << 23), (4, 1 << 31), (6, 1 << 47)):
+        if -bound <= value < bound:
+            return size
+    return 8
+
+
+def estimate_index_bytes(conn: sqlite3.Connection, table: str, columns: List[str], rows: Optional[int] = None) -> int:
+    """
+    Approximate on-disk size of an index, from the average stored width of
+    its columns in a sample of the table
+    """
+    if rows is None:
+        rows = _table_rows(conn, table)
+    widths = ", ".join(
+        f"avg(CASE typeof({quote_ident(c)}) "
+        f"WHEN 'integer' THEN (CASE WHEN abs({quote_ident(c)}) < 128 THEN 1 WHEN abs({quote_ident(c)}) < 32768 THEN 2 "
+        f"WHEN abs({quote_ident(c)}) < 8388608 THEN 3 WHEN abs({quote_ident(c)}) < 2147483648 THEN 4 ELSE 8 END) "
+        f"WHEN 'real' THEN 8 WHEN 'null' THEN 0 "
+        f"ELSE length(CAST({quote_ident(c)} AS BLOB)) END)"
+        for c in columns
+    )
+    sample = conn.execute(
+        f"SELECT {widths} FROM (SELECT * FROM {quote_ident(table)} LIMIT 1000)"
+    ).fetchone()
+    # Per entry: the column values and rowid, a record header byte per
+    # column, and the cell's size varint and page pointer
+    entry = sum(w or 0 for w in sample) + _int_bytes(rows) + len(columns) + 2 + 3
+    return int(rows * entry * 1.05)
+
+
+def index_name(table: str, columns: List[str]) -> str:
+    name = AUTO_INDEX_PREFIX + re.sub(r"\W+", "_", f"{table}_{'_'.join(columns)}").strip("_").lower()
+    if len(name) > 60:
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+        name = name[:51] + "_" + digest
+    return name
+
+
+def _covered(indexes: List[List[str]], columns: List[str]) -> bool:
+    return any(ix[:len(columns)] == columns for ix in indexes)
+
+
+def suggest_indexes(db_name: str, since: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Propose indexes for a database from its logged queries.
+
+    Every logged query is planned again against the current schema, so
+    queries already served by an index drop out.
+
+    Args:
+        db_name: Database file name inside db/
+        since: Only consider queries logged after this timestamp
+
+    Returns:
+        Proposals sorted by benefit, each with table, columns, key_columns,
+        covering, name, queries (fingerprints served), runs, benefit_ms
+        (wall time spent in those queries), rows and est_bytes
+    """
+    if not os.path.exists("db/" + db_name):
+        return []
+    entries = get_query_log().entries(since=since, db_name=db_name)
+    groups: Dict[str, Dict[str, Any]] = {}
+    for entry in entries:
+        if entry["error"] or entry["plan"] is None:
+            continue
+        group = groups.setdefault(entry["fingerprint"], {"sql": entry["sql"], "runs": 0, "total_ms": 0.0})
+        group["sql"] = entry["sql"]
+        group["runs"] += 1
+        group["total_ms"] += entry["wall_ms"]
+    ranked = sorted(groups.items(), key=lambda kv: kv[1]["total_ms"], reverse=True)[:INDEX_MAX_FINGERPRINTS]
+
+    proposals: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+    with read_connection("db/" + db_name) as conn:
+        schema, indexes = _table_info(conn)
+        views = _dictionary_views(conn)
+        row_counts: Dict[str, int] = {}
+        for fingerprint, group in ranked:
+            try:
+                plan = [(r[0], r[1], r[3]) for r in conn.execute("EXPLAIN QUERY PLAN " + group["sql"])]
+            except sqlite3.Error:
+                continue
+            scanned, automatic = _scanned_aliases(plan)
+            if not scanned and not automatic:
+                continue
+            usage = analyze_query(group["sql"], schema, views)
+            candidates = []
+            for alias in scanned:
+                for u in _plan_usages(alias, usage, views):
+                    candidates.append(propose_index(u))
+            for alias, cols in automatic.items():
+                for u in _plan_usages(alias, usage, views):
+                    table = u["table"]
+                    key = [c for c in cols if c in schema[table]]
+                    if key:
+                        candidates.append({"table": table, "key_columns": key, "columns": key, "covering": False})
+
+            for candidate in candidates:
+                if candidate is None or _covered(indexes.get(candidate["table"], []), candidate["key_columns"]):
+                    continue
+                # Summary tables are rebuilt on refresh, which would drop the index
+                if candidate["table"].startswith(SUMMARY_TABLE_PREFIX):
+                    continue
+                table = candidate["table"]
+                if table not in row_counts:
+                    row_counts[table] = _table_rows(conn, table)
+                if row_counts[table] < INDEX_MIN_ROWS:
+                    continue
+                proposal = proposals.setdefault(
+                    (table, tuple(candidate["columns"])),
+                    dict(candidate, queries=[], runs=0, benefit_ms=0.0, rows=row_counts[table]),
+                )
+                if fingerprint not in proposal["queries"]:
+                    proposal["queries"].append(fingerprint)
+                    proposal["runs"] += group["runs"]
+                    proposal["benefit_ms"] += group["total_ms"]
+
+        # An index whose columns start with another proposal's columns serves
+        # that proposal's queries too
+        merged = sorted(proposals.values(), key=lambda p: len(p["columns"]), reverse=True)
+        result: List[Dict[str, Any]] = []
+        for proposal in merged:
+            wider = next(
+                (p for p in result if p["table"] == proposal["table"]
+                 and p["columns"][:len(proposal["key_columns"])] == proposal["key_columns"]
+                 and set(proposal["columns"]) <= set(p["columns"])),
+                None,
+            )
+            if wider is not None:
+                for fingerprint in proposal["queries"]:
+                    if fingerprint not in wider["queries"]:
+                        wider["queries"].append(fingerprint)
+                        wider["runs"] += groups[fingerprint]["runs"]
+                        wider["benefit_ms"] += groups[fingerprint]["total_ms"]
+                continue
+            result.append(proposal)
+
+        for proposal in result:
+            proposal["name"] = index_name(proposal["table"], proposal["columns"])
+            proposal["est_bytes"] = estimate_index_bytes(conn, proposal["table"], proposal["columns"], proposal["rows"])
+
+    return sorted(result, key=lambda p: p["benefit_ms"], reverse=True)
+
+
+def create_index(db_name: str, table: str, columns: List[str], name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Create an index and refresh the planner statistics for its table
+
+    Returns:
+        Dictionary with ok, index and seconds, or a dictionary with an
+        "error" key
+    """
+    name = name or index_name(table, columns)
+    cols = ", ".join(quote_ident(c) for c in columns)
+    start = time.perf_counter()
+    def build():
+        with write_connection("db/" + db_name) as conn:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {quote_ident(name)} ON {quote_ident(table)} ({cols})")
+            # Without statistics the planner may still prefer a scan
+            conn.execute(f"ANALYZE {quote_ident(table)}")
+            conn.commit()
+
+    try:
+        retry_on_busy(build)
+    except sqlite3.Error as e:
+        return {"error": str(e)}
+    return {"ok": True, "index": name, "seconds": time.perf_counter() - start}
+
+
+def auto_index_bytes(db_name: str) -> int:
+    """
+    Estimated size of the indexes the advisor created in a database
+    """
+    total = 0
+    if not os.path.exists("db/" + db_name):
+        return total
+    with read_connection("db/" + db_name) as conn:
+        rows = conn.execute(
+            "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' AND name LIKE ? ESCAPE '\\'",
+            (AUTO_INDEX_PREFIX.replace("_", "\\_") + "%",),
+        ).fetchall()
+        for index, table in rows:
+            columns = [r[2] for r in conn.execute(f"PRAGMA index_info({quote_ident(index)})")]
+            total += estimate_index_bytes(conn, table, columns)
+    return total
+
+
+def auto_apply_indexes(
+    db_name: str,
+    budget_bytes: int = INDEX_AUTO_BUDGET_BYTES,
+    min_benefit_ms: float = INDEX_AUTO_MIN_BENEFIT_MS,
+) -> List[Dict[str, Any]]:
+    """
+    Create the most valuable proposed indexes while the estimated size of all
+    advisor-created indexes stays within budget_bytes
+
+    Returns:
+        The create_index result of every index that was created
+    """
+    used = auto_index_bytes(db_name)
+    proposals = [p for p in suggest_indexes(db_name) if p["benefit_ms"] >= min_benefit_ms]
+    # Most time saved per byte first
+    proposals.sort(key=lambda p: p["benefit_ms"] / max(p["est_bytes"], 1), reverse=True)
+    created = []
+    for proposal in proposals:
+        if used + proposal["est_bytes"] > budget_bytes:
+            continue
+        result = create_index(db_name, proposal["table"], proposal["columns"], proposal["name"])
+        if "error" not in result:
+            used += proposal["est_bytes"]
+            created.append(dict(result, table=proposal["table"], columns=proposal["columns"]))
+    return created
+
+
+def _auto_apply_quietly(db_name: str, budget_bytes: int) -> None:
+    try:
+        auto_apply_indexes(db_name, budget_bytes)
+    except sqlite3.Error:
+        # e.g. the database was deleted meanwhile; the next run retries
+        pass
+
+
+_auto_running: Dict[str, threading.Thread] = {}
+_auto_lock = threading.Lock()
+
+
+def schedule_auto_index(db_name: str, budget_bytes: int = INDEX_AUTO_BUDGET_BYTES) -> bool:
+    """
+    Run auto_apply_indexes in a background thread, unless a run for the same
+    database is still going
+
+    Returns:
+        True if a run was started
+    """
+    with _auto_lock:
+        running = _auto_running.get(db_name)
+        if running is not None and running.is_alive():
+            return False
+        thread = threading.Thread(
+            target=_auto_apply_quietly, args=(db_name, budget_bytes), name=f"auto-index-{db_name}", daemon=True
+        )
+        _auto_running[db_name] = thread
+        thread.start()
+    return True
@@ -0,0 +1,347 @@
+"""
+Column statistics computed while a table is imported.
+
+Each column keeps mergeable sketches instead of exact answers, so a profile
+can be updated chunk by chunk and again when rows are appended, without
+rescanning the table:
+
+* row and null counts
+* a HyperLogLog sketch for the number of distinct values
+* min and max
+* the most frequent values (counts are approximate once more than
+  TOP_CAPACITY distinct values were seen)
+* a reservoir sample of numeric values, turned into a histogram on read
+
+Profiles are stored in the ``_dbassist_profiles`` table next to the data.
+"""
+import json
+import math
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+PROFILE_TABLE = "_dbassist_profiles"
+
+# HyperLogLog precision: 2**12 registers, about 1.6% standard error
+HLL_PRECISION = 12
+# Distinct values tracked for the most-frequent list, and how many are shown
+TOP_CAPACITY = 512
+TOP_VALUES = 10
+# Numeric values kept for the histogram, and its number of bins
+RESERVOIR_SIZE = 1_024
+HISTOGRAM_BINS = 10
+
+_HLL_REGISTERS = 1 << HLL_PRECISION
+_HASH_BITS = 64 - HLL_PRECISION
+
+
+def _hashes(values: np.ndarray) -> np.ndarray:
+    return pd.util.hash_array(values, categorize=False)
+
+
+def hll_add(registers: np.ndarray, hashes: np.ndarray) -> None:
+    """
+    Add 64-bit hashes to HyperLogLog registers in place
+    """
+    if hashes.size == 0:
+        return
+    index = (hashes >> np.uint64(_HASH_BITS)).astype(np.int64)
+    rest = hashes & np.uint64((1 << _HASH_BITS) - 1)
+    # Position of the leftmost 1-bit in the remaining bits
+    with np.errstate(divide="ignore"):
+        rank = _HASH_BITS - np.floor(np.log2(rest.astype(np.float64)))
+    rank = np.where(rest == 0, _HASH_BITS + 1, rank).astype(np.uint8)
+    np.maximum.at(registers, index, rank)
+
+
+def hll_estimate(registers: np.ndarray) -> int:
+    m = registers.size
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -registers.astype(np.int64))))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Linear counting is more accurate for small cardinalities
+        estimate = m * math.log(m / zeros)
+    return int(round(estimate))
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ColumnProfile:
+    """
+    Mergeable statistics of one column.
+
+    Args:
+        name: Column name
+        kind: Import kind of the column (int, float, bool, date, datetime, text)
+        encoding: "epoch" when dates are stored as Unix seconds
+    """
+
+    def __init__(self, name: str, kind: str, encoding: Optional[str] = None):
+        self.name = name
+        self.kind = kind
+        self.encoding = encoding
+        self.rows = 0
+        self.nulls = 0
+        self.min: Any = None
+        self.max: Any = None
+        self.registers = np.zeros(_HLL_REGISTERS, dtype=np.uint8)
+        self.top: Dict[Any, int] = {}
+        self.sample: List[Any] = []
+        # Numeric values seen so far, for the reservoir
+        self.numeric_seen = 0
+        self._rng = np.random.default_rng()
+
+    @property
+    def numeric(self) -> bool:
+        return self.kind in ("int", "float") or self.encoding == "epoch"
+
+    def update(self, values: list) -> None:
+        """
+        Add one chunk of (transformed) values; None and NaN are missing values
+        """
+        self.rows += len(values)
+        try:
+            if self.kind == "float":
+                series = pd.Series(values, dtype=np.float64)
+            elif self.numeric:
+                series = pd.Series(values, dtype="Int64")
+            else:
+                series = pd.Series(values, dtype=object)
+        except (TypeError, ValueError):
+            # Tables without declared-type checks can hold anything; profile
+            # such a column as text from here on
+            self.kind, self.encoding = "text", None
+            self.min = self.max = None
+            self.sample, self.numeric_seen = [], 0
+            series = pd.Series([None if v is None else str(v) for v in values], dtype=object)
+        # Distinct values with their counts; everything below works on these
+        counts = series.value_counts()
+        present = int(counts.sum())
+        self.nulls += len(values) - present
+        if not present:
+            return
+
+        distinct = counts.index.to_numpy(dtype=np.int64 if series.dtype == "Int64" else None)
+        hll_add(self.registers, _hashes(distinct))
+
+        try:
+            low, high = distinct.min(), distinct.max()
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+        except TypeError:
+            # Mixed value types in an unchecked column: compare them as text
+            text = [str(v) for v in distinct]
+            self.min = min(text + ([str(self.min)] if self.min is not None else []))
+            self.max = max(text + ([str(self.max)] if self.max is not None else []))
+
+        # Only the chunk's heaviest values can make it into the top list
+        top = self.top
+        for value, count in counts.head(TOP_CAPACITY).items():
+            top[value] = top.get(value, 0) + int(count)
+        if len(top) > TOP_CAPACITY * 2:
+            # Keep the heaviest values; counts of the others are forgotten
+            self.top = dict(sorted(top.items(), key=lambda item: -item[1])[:TOP_CAPACITY])
+
+        if self.numeric:
+            present_values = series.dropna()
+            self._sample(present_values.to_numpy(dtype=np.int64 if series.dtype == "Int64" else np.float64))
+
+    def _sample(self, array: np.ndarray) -> None:
+        """
+        Reservoir sampling (algorithm R), vectorized per chunk
+        """
+        fill = min(RESERVOIR_SIZE - len(self.sample), array.size)
+        if fill > 0:
+            self.sample.extend(array[:fill].tolist())
+        rest = array[fill:]
+        if rest.size:
+            seen = self.numeric_seen + fill + np.arange(1, rest.size + 1)
+            slots = (self._rng.random(rest.size) * seen).astype(np.int64)
+            keep = slots < RESERVOIR_SIZE
+            sample = np.asarray(self.sample, dtype=array.dtype)
+            # Later values overwrite earlier ones, as in the sequential algorithm
+            sample[slots[keep]] = rest[keep]
+            self.sample = sample.tolist()
+        self.numeric_seen += array.size
+
+    def _display(self, value: Any) -> Any:
+        if value is None:
+            return None
+        value = _to_json(value)
+        if self.encoding == "epoch":
+            fmt = "%Y-%m-%d" if self.kind == "date" else "%Y-%m-%d %H:%M:%S"
+            return time.strftime(fmt, time.gmtime(value))
+        return value
+
+    def _edge(self, value: float) -> Any:
+        return float(f"{value:.6g}") if self.kind == "float" else int(value)
+
+    def histogram(self) -> List[Dict[str, Any]]:
+        """
+        Equal-width bins over [min, max] with row counts scaled from the sample
+        """
+        if not self.sample or self.min is None or self.min == self.max:
+            return []
+        sample = np.asarray(self.sample, dtype=np.float64)
+        counts, edges = np.histogram(sample, bins=HISTOGRAM_BINS, range=(float(self.min), float(self.max)))
+        scale = (self.rows - self.nulls) / sample.size
+        return [
+            {"from": self._display(self._edge(edges[i])),
+             "to": self._display(self._edge(edges[i + 1])),
+             "rows": int(round(counts[i] * scale))}
+            for i in range(len(counts))
+        ]
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        JSON-friendly statistics of the column
+        """
+        present = self.rows - self.nulls
+        result: Dict[str, Any] = {
+            "rows": self.rows,
+            "null_fraction": round(self.nulls / self.rows, 4) if self.rows else 0.0,
+            "distinct": min(hll_estimate(self.registers), present),
+            "min": self._display(self.min),
+            "max": self._display(self.max),
+        }
+        top = sorted(self.top.items(), key=lambda item: -item[1])[:TOP_VALUES]
+        if top and top[0][1] > 1:
+            result["top_values"] = [[self._display(v), c] for v, c in top if c > 1]
+        if self.sample and self.numeric:
+            quartiles = np.percentile(np.asarray(self.sample, dtype=np.float64), [25, 50, 75])
+            result["quartiles"] = [self._display(self._edge(q)) for q in quartiles]
+        # A handful of distinct values is better described by top_values
+        histogram = self.histogram() if result["distinct"] > HISTOGRAM_BINS else []
+        if histogram:
+            result["histogram"] = histogram
+        return result
+
+
+class TableProfile:
+    """
+    Column profiles of one table, in plan order
+    """
+
+    def __init__(self, table_name: str, columns: List[ColumnProfile], approximate: bool = False):
+        self.table = table_name
+        self.columns = columns
+        # Upserts replace rows, which sketches cannot subtract
+        self.approximate = approximate
+
+    @classmethod
+    def for_plan(cls, plan: Dict[str, Any]) -> "TableProfile":
+        return cls(plan["table"], [ColumnProfile(c["name"], c["kind"], c["encoding"]) for c in plan["columns"]])
+
+    def update(self, columns: List[list]) -> None:
+        """
+        Add a chunk given as one list of values per column
+        """
+        for profile, values in zip(self.columns, columns):
+            profile.update(values)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        result = {c.name: c.summary() for c in self.columns}
+        if self.approximate:
+            for stats in result.values():
+                stats["approximate"] = True
+        return result
+
+    def save(self, conn: sqlite3.Connection) -> None:
+        """
+        Replace the stored profile of the table (within the caller's transaction)
+        """
+        _ensure_table(conn)
+        conn.execute(f"DELETE FROM {PROFILE_TABLE} WHERE table_name = ?", (self.table,))
+        now = time.time()
+        conn.executemany(
+            f"INSERT INTO {PROFILE_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    self.table, c.name, position, c.kind, c.encoding, c.rows, c.nulls,
+                    json.dumps(_to_json(c.min)), json.dumps(_to_json(c.max)), c.registers.tobytes(),
+                    json.dumps([[_to_json(v), n] for v, n in c.top.items()]),
+                    json.dumps(c.sample), c.numeric_seen, int(self.approximate), now,
+                )
+                for position, c in enumerate(self.columns)
+            ],
+        )
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, table_name: str) -> Optional["TableProfile"]:
+        """
+        Stored profile of a table, or None
+        """
+        profiles = _load_rows(conn, "WHERE table_name = ?", (table_name,))
+        return profiles.get(table_name)
+
+
+def _ensure_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {PROFILE_TABLE} (
+            table_name TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            encoding TEXT,
+            rows INTEGER NOT NULL,
+            nulls INTEGER NOT NULL,
+            min_value TEXT,
+            max_value TEXT,
+            hll BLOB NOT NULL,
+            top_values TEXT NOT NULL,
+            sample TEXT NOT NULL,
+            numeric_seen INTEGER NOT NULL,
+            approximate INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (table_name, column_name)
+        )
+        """
+    )
+
+
+def _load_rows(conn: sqlite3.Connection, where: str = "", params: tuple = ()) -> Dict[str, TableProfile]:
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (PROFILE_TABLE,)
+    ).fetchone()
+    if exists is None:
+        return {}
+    profiles: Dict[str, TableProfile] = {}
+    for row in conn.execute(
+        f"SELECT table_name, column_name, kind, encoding, rows, nulls, min_value, max_value, hll, "
+        f"top_values, sample, numeric_seen, approximate FROM {PROFILE_TABLE} {where} "
+        f"ORDER BY table_name, position",
+        params,
+    ):
+        table, name, kind, encoding, rows, nulls, low, high, hll, top, sample, seen, approximate = row
+        column = ColumnProfile(name, kind, encoding)
+        column.rows, column.nulls, column.numeric_seen = rows, nulls, seen
+        column.min, column.max = json.loads(low), json.loads(high)
+        column.registers = np.frombuffer(hll, dtype=np.uint8).copy()
+        column.top = {v: n for v, n in json.loads(top)}
+        column.sample = json.loads(sample)
+        profile = profiles.setdefault(table, TableProfile(table, [], bool(approximate)))
+        profile.columns.append(column)
+    return profiles
+
+
+def load_profiles(conn: sqlite3.Connection) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Summaries of every stored profile: table -> column -> statistics
+    """
+    return {table: profile.summary() for table, profile in _load_rows(conn).items()}
+
+
+def drop_profile(conn: sqlite3.Connection, table_name: str) -> None:
+    if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (PROFILE_TABLE,)
+    ).fetchone() is not None:
+        conn.execute(f"DELETE FROM {PROFILE_TABLE} WHERE table_name = ?", (table_name,))
@@ -0,0 +1,245 @@
+import time
+
+import pandas as pd
+import streamlit as st
+
+from db_tools import get_result_cache_stats
+from index_advisor import INDEX_AUTO_BUDGET_BYTES, auto_apply_indexes, auto_index_bytes, create_index, suggest_indexes
+from query_log import get_query_log, sql_pattern
+from summaries import (
+    create_summary, drop_summary, format_age, list_summaries, refresh_summary, suggest_summaries,
+)
+
+# Time windows offered on the dashboard, in seconds (None = everything)
+WINDOWS = {
+    "Last hour": 3600,
+    "Last 24 hours": 24 * 3600,
+    "Last 7 days": 7 * 24 * 3600,
+    "All time": None,
+}
+
+
+def load_log(window: str, db_name: str = None) -> pd.DataFrame:
+    """
+    Query log entries of the selected window as a DataFrame
+    """
+    seconds = WINDOWS[window]
+    since = time.time() - seconds if seconds else None
+    return pd.DataFrame(get_query_log().entries(since=since, db_name=db_name))
+
+
+def summarize_fingerprints(log: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per query fingerprint with run count and latency statistics
+    """
+    log = log.assign(failed=log["error"].notna())
+    summary = log.groupby("fingerprint").agg(
+        db_name=("db_name", "last"),
+        sql=("sql", "last"),
+        runs=("id", "count"),
+        errors=("failed", "sum"),
+        avg_ms=("wall_ms", "mean"),
+        p95_ms=("wall_ms", lambda s: s.quantile(0.95)),
+        max_ms=("wall_ms", "max"),
+        total_ms=("wall_ms", "sum"),
+        avg_rows=("rows", "mean"),
+        full_scan=("full_scan", "max"),
+    )
+    summary["pattern"] = summary["sql"].map(sql_pattern)
+    return summary.reset_index()
+
+
+def latency_by_database(log: pd.DataFrame) -> pd.DataFrame:
+    return (
+        log.groupby("db_name")["wall_ms"]
+        .agg(
+            queries="count",
+            p50_ms=lambda s: s.quantile(0.5),
+            p95_ms=lambda s: s.quantile(0.95),
+            max_ms="max",
+        )
+        .reset_index()
+    )
+
+
+def run():
+    st.title("Query Performance")
+
+    window = st.sidebar.selectbox("Time window", list(WINDOWS), index=1)
+    log = load_log(window)
+    if log.empty:
+        st.info("No queries logged yet. Ask the assistant a question to populate the log.")
+        return
+
+    db_names = sorted(log["db_name"].unique())
+    db_filter = st.sidebar.selectbox("Database", ["All"] + db_names)
+    if db_filter != "All":
+        log = log[log["db_name"] == db_filter]
+
+    cols = st.columns(4)
+    cols[0].metric("Queries", len(log))
+    cols[1].metric("Distinct queries", log["fingerprint"].nunique())
+    cols[2].metric("p95 latency", f"{log['wall_ms'].quantile(0.95):.1f} ms")
+    cols[3].metric("Errors", int(log["error"].notna().sum()))
+
+    summary = summarize_fingerprints(log)
+    display_cols = ["pattern", "db_name", "runs", "avg_ms", "p95_ms", "max_ms", "avg_rows", "errors"]
+
+    st.header("Slowest queries")
+    st.dataframe(
+        summary.sort_values("p95_ms", ascending=False).head(20)[display_cols],
+        hide_index=True,
+    )
+
+    st.header("Most frequent queries")
+    st.dataframe(
+        summary.sort_values(["runs", "total_ms"], ascending=False).head(20)[display_cols + ["total_ms"]],
+        hide_index=True,
+    )
+
+    st.header("Latency per database")
+    st.dataframe(latency_by_database(log), hide_index=True)
+
+    st.header("Full table scans")
+    scans = log[log["full_scan"] == 1].drop_duplicates("fingerprint", keep="last")
+    if scans.empty:
+        st.write("No full-scan plans in this window.")
+    for _, entry in scans.sort_values("wall_ms", ascending=False).head(20).iterrows():
+        with st.expander(f"{entry['db_name']} | {entry['wall_ms']:.1f} ms | {sql_pattern(entry['sql'])[:100]}"):
+            st.code(entry["sql"], language="sql")
+            st.code(entry["plan"] or "", language="text")
+
+    st.header("Result cache")
+    cache = get_result_cache_stats()
+    cols = st.columns(4)
+    cols[0].metric("Hit rate", f"{cache['hit_rate']:.0%}")
+    cols[1].metric("Entries", cache["entries"])
+    cols[2].metric("Memory", f"{cache['bytes'] / 1024 / 1024:.1f} MB")
+    cols[3].metric("Evictions", cache["evictions"])
+
+    index_advisor(db_filter if db_filter != "All" else None, db_names)
+    summary_tables(db_filter if db_filter != "All" else None, db_names)
+
+    if st.sidebar.button("Clear query log"):
+        get_query_log().clear()
+        st.rerun()
+
+
+def index_advisor(db_name, db_names):
+    st.header("Index advisor")
+    if db_name is None:
+        db_name = st.selectbox("Database to analyze", db_names, key="advisor_db")
+    proposals = suggest_indexes(db_name)
+    if not proposals:
+        st.write("No index proposals: the logged queries of this database do not scan large tables.")
+    for proposal in proposals:
+        cols = st.columns([4, 2, 1])
+        kind = "covering" if proposal["covering"] else "composite"
+        cols[0].markdown(f"`{proposal['table']}({', '.join(proposal['columns'])})` ({kind})")
+        cols[1].caption(
+            f"{len(proposal['queries'])} queries, {proposal['runs']} runs, "
+            f"{proposal['benefit_ms']:.0f} ms spent | ~{proposal['est_bytes'] / 1024 / 1024:.1f} MB"
+        )
+        if cols[2].button("Create", key=f"create_{proposal['name']}"):
+            with st.spinner(f"Creating {proposal['name']}..."):
+                res = create_index(db_name, proposal["table"], proposal["columns"], proposal["name"])
+            if "error" in res:
+                st.error(res["error"])
+            else:
+                st.success(f"Created {res['index']} in {res['seconds']:.1f}s")
+
+    used = auto_index_bytes(db_name)
+    st.caption(f"Indexes created by the advisor: ~{used / 1024 / 1024:.1f} MB")
+    budget_mb = st.number_input(
+        "Index size budget (MB)", min_value=1, value=INDEX_AUTO_BUDGET_BYTES // (1024 * 1024), key="advisor_budget"
+    )
+    if proposals and st.button("Create the best indexes within budget"):
+        with st.spinner("Creating indexes..."):
+            created = auto_apply_indexes(db_name, budget_mb * 1024 * 1024, min_benefit_ms=0)
+        if created:
+            st.success("Created " + ", ".join(f"{c['index']} ({c['seconds']:.1f}s)" for c in created))
+        else:
+            st.info("No proposal fits in the remaining budget.")
+
+
+def summary_tables(db_name, db_names):
+    st.header("Summary tables")
+    if db_name is None:
+        db_name = st.selectbox("Database to summarize", db_names, key="summary_db")
+    st.caption(
+        "Repeated GROUP BY questions are answered from a fresh summary instead of the whole table. "
+        "Imports refresh summaries (appends incrementally); a write query makes them stale until refreshed."
+    )
+    summaries = list_summaries(db_name)
+    if not summaries:
+        st.write("No summary tables in this database yet.")
+    for summary in summaries:
+        status = summary["status"]
+        definition = summary["definition"]
+        cols = st.columns([4, 3, 1, 1])
+        keys = ", ".join(k["name"] for k in definition["keys"])
+        aggregates = ", ".join(f"{a['func']}({a['expr']})" for a in definition["aggregates"]) or "count(*)"
+        cols[0].markdown(f"`{summary['name']}`: {summary['table_name']} by {keys} | {aggregates}")
+        state = "fresh" if status["fresh"] else f"stale: {status['reason']}"
+        if status["rows_behind"]:
+            state += f" ({status['rows_behind']:,} rows behind)"
+        cols[1].caption(
+            f"{state} | {summary['groups'] or 0:,} groups over {summary['base_rows'] or 0:,} rows | "
+            f"refreshed {format_age(status['age_seconds'])} ({summary['refresh_kind'] or '-'})"
+        )
+        if cols[2].button("Refresh", key=f"refresh_{summary['name']}"):
+            res = refresh_summary(db_name, summary["name"])
+            if "error" in res:
+                st.error(res["error"])
+            else:
+                st.rerun()
+        if cols[3].button("Drop", key=f"drop_{summary['name']}"):
+            drop_summary(db_name, summary["name"])
+            st.rerun()
+
+    st.subheader("Proposed from the query log")
+    proposals = suggest_summaries(db_name)
+    if not proposals:
+        st.write("No proposals: no logged GROUP BY query over a large table lacks a summary.")
+    for proposal in proposals:
+        cols = st.columns([4, 2, 1])
+        aggregates = ", ".join(["count(*)"] + proposal["aggregates"])
+        cols[0].markdown(
+            f"`{proposal['table']}` by {', '.join(f'{n} = {e}' if n != e else n for n, e in proposal['keys'].items())}"
+            f" | {aggregates}"
+        )
+        cols[1].caption(
+            f"{len(proposal['queries'])} queries, {proposal['runs']} runs, {proposal['benefit_ms']:.0f} ms spent | "
+            f"~{proposal['est_groups']:,} groups of {proposal['rows']:,} rows"
+        )
+        if cols[2].button("Create", key=f"summary_{proposal['name']}"):
+            with st.spinner(f"Building {proposal['name']}..."):
+                res = create_summary(
+                    db_name, proposal["table"], proposal["keys"], proposal["aggregates"], proposal["name"]
+                )
+            if "error" in res:
+                st.error(res["error"])
+            else:
+                st.success(f"Built {res['name']}: {res['groups']:,} groups in {res['seconds']:.1f}s")
+
+    with st.expander("Define a summary"):
+        table = st.text_input("Table", key="summary_table")
+        keys_text = st.text_area(
+            "Group keys, one per line", key="summary_keys",
+            placeholder="region\nmonth = strftime('%Y-%m', order_date)",
+        )
+        aggregates_text = st.text_area(
+            "Aggregates, one per line", key="summary_aggregates", placeholder="sum(quantity * price)\navg(price)",
+        )
+        if st.button("Create summary", disabled=not (table and keys_text.strip())):
+            keys = {}
+            for line in keys_text.splitlines():
+                if line.strip():
+                    name, _, expr = line.partition("=") if "=" in line else (line, "", line)
+                    keys[name.strip()] = expr.strip()
+            aggregates = [line.strip() for line in aggregates_text.splitlines() if line.strip()]
+            res = create_summary(db_name, table.strip(), keys, aggregates)
+            if "error" in res:
+                st.error(res["error"])
+            else:
+                st.success(f"Built {res['name']}: {res['groups']:,} groups in {res['seconds']:.1f}s")
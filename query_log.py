@@ -0,0 +1,215 @@
+"""
+Query log for SQL executed through db_tools.
+
+Every query records its fingerprint, database, wall time, rows, result bytes,
+EXPLAIN QUERY PLAN output and error in a local SQLite store. Records are
+written by a background thread in batches, so logging adds almost nothing to
+query latency.
+"""
+import hashlib
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from connections import CACHE_DIR, read_connection, write_connection
+from result_cache import normalize_sql
+
+QUERY_LOG_PATH = os.path.join(CACHE_DIR, "query_log.sqlite")
+
+# Oldest records are pruned once the log grows past this many rows
+QUERY_LOG_MAX_ROWS = 200_000
+
+# Quoted identifiers are matched first so digits inside them are kept
+_LITERAL = re.compile(
+    r'("(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])'
+    r"|x'[0-9a-f]*'|'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:e[+-]?\d+)?\b",
+    re.I,
+)
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+# "SCAN t" reads every row, with or without an index; SCAN CONSTANT ROW does not
+_FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)")
+
+
+def sql_pattern(sql: str) -> str:
+    """
+    Normalized SQL with literals replaced by "?" and IN lists collapsed
+    """
+    pattern = _LITERAL.sub(lambda m: m.group(1) or "?", normalize_sql(sql))
+    return _IN_LIST.sub("(?)", pattern)
+
+
+def fingerprint_sql(sql: str) -> str:
+    """
+    Stable id shared by queries that differ only in literal values
+    """
+    return hashlib.sha1(sql_pattern(sql).encode("utf-8")).hexdigest()[:16]
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str) -> Optional[List[Tuple[int, int, str]]]:
+    """
+    Return EXPLAIN QUERY PLAN rows as (id, parent, detail), or None if the
+    statement cannot be planned
+    """
+    try:
+        return [(row[0], row[1], row[3]) for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    except sqlite3.Error:
+        return None
+
+
+def format_plan(plan: List[Tuple[int, int, str]]) -> str:
+    """
+    Render plan rows as an indented tree, like the sqlite3 shell does
+    """
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, detail in plan:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return "\n".join(lines)
+
+
+def has_full_scan(plan: Optional[List[Tuple[int, int, str]]]) -> bool:
+    return bool(plan) and any(_FULL_SCAN.match(detail) for _, _, detail in plan)
+
+
+class QueryLog:
+    """
+    Append-only log of executed queries backed by SQLite.
+    """
+
+    def __init__(self, path: str = QUERY_LOG_PATH, max_rows: int = QUERY_LOG_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._queue: "queue.Queue[Tuple]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._since_prune = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with write_connection(path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS query_log (
+                    id INTEGER PRIMARY KEY,
+                    ts REAL NOT NULL,
+                    db_name TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    wall_ms REAL NOT NULL,
+                    rows INTEGER,
+                    result_bytes INTEGER,
+                    plan TEXT,
+                    full_scan INTEGER NOT NULL DEFAULT 0,
+                    error TEXT
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS query_log_ts ON query_log(ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS query_log_fingerprint ON query_log(fingerprint)")
+            conn.commit()
+
+    def record(
+        self,
+        db_name: str,
+        sql: str,
+        wall_ms: float,
+        rows: Optional[int] = None,
+        result_bytes: Optional[int] = None,
+        plan: Optional[List[Tuple[int, int, str]]] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        """
+        Queue one query for the background writer
+        """
+        self._queue.put((
+            time.time(),
+            db_name,
+            fingerprint_sql(sql),
+            sql,
+            wall_ms,
+            rows,
+            result_bytes,
+            format_plan(plan) if plan else None,
+            int(has_full_scan(plan)),
+            error,
+        ))
+        self._ensure_writer()
+
+    def flush(self) -> None:
+        """
+        Wait until every queued record has been written
+        """
+        self._queue.join()
+
+    def entries(self, since: Optional[float] = None, db_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        self.flush()
+        sql = "SELECT * FROM query_log WHERE ts >= ?"
+        params: List[Any] = [since or 0]
+        if db_name:
+            sql += " AND db_name = ?"
+            params.append(db_name)
+        with read_connection(self.path) as conn:
+            cursor = conn.execute(sql + " ORDER BY ts", params)
+            columns = [d[0] for d in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def clear(self) -> None:
+        self.flush()
+        with write_connection(self.path) as conn:
+            conn.execute("DELETE FROM query_log")
+            conn.commit()
+
+    def _ensure_writer(self) -> None:
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="query-log-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # Drain whatever else is waiting and write it in one transaction
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with write_connection(self.path) as conn:
+                    conn.executemany(
+                        "INSERT INTO query_log (ts, db_name, fingerprint, sql, wall_ms, rows, result_bytes, "
+                        "plan, full_scan, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        batch,
+                    )
+                    self._since_prune += len(batch)
+                    if self._since_prune >= 1000:
+                        self._since_prune = 0
+                        conn.execute(
+                            "DELETE FROM query_log WHERE id <= (SELECT max(id) FROM query_log) - ?",
+                            (self.max_rows,),
+                        )
+                    conn.commit()
+            except sqlite3.Error:
+                # Losing log records must never break query execution
+                pass
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+_query_log: Optional[QueryLog] = None
+_query_log_lock = threading.Lock()
+
+
+def get_query_log() -> QueryLog:
+    """
+    Process-wide query log, created on first use
+    """
+    global _query_log
+    with _query_log_lock:
+        if _query_log is None:
+            _query_log = QueryLog()
+        return _query_log
@@ -0,0 +1,146 @@
+"""
+Persistent question -> SQL cache for the SQL assistant.
+
+Answers are keyed on the normalized question plus the schema fingerprint of
+the selected database. A hit lets the assistant replay the stored SQL
+directly instead of running the whole agent loop again.
+
+A fuzzy lookup also matches rewordings, but only when both questions have
+exactly the same content words: filler words ("show", "the", "what") and
+word order may differ, while every other word (names, numbers, negations,
+sort directions) must be there in both. Similar-looking questions such as
+"paid orders" and "not paid orders" never share an answer.
+"""
+import os
+import re
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from connections import CACHE_DIR, read_connection, write_connection
+
+QUESTION_CACHE_PATH = os.path.join(CACHE_DIR, "questions.sqlite")
+
+# Number of recent questions compared during a fuzzy lookup
+FUZZY_CANDIDATES = 500
+# Words that do not change what a question asks for. Negations, numbers,
+# names, "or" and sort directions must never be added here.
+FILLER_WORDS = frozenset(
+    "a an the of in on at to for from by per with is are was were be what which who how show me list give "
+    "get find tell please can could would you i we my our do does did "
+    "apa yang tampilkan berikan tolong di dari ke untuk dengan"
+    .split()
+)
+
+
+def normalize_question(question: str) -> str:
+    """
+    Lower-case, drop punctuation and collapse whitespace
+    """
+    text = re.sub(r"[^\w\s]", " ", question.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def question_terms(question: str) -> Tuple[str, ...]:
+    """
+    Content words of a normalized question, sorted: its words without
+    FILLER_WORDS. Two questions with the same terms ask the same thing.
+    """
+    return tuple(sorted(w for w in question.split() if w not in FILLER_WORDS))
+
+
+class QuestionCache:
+    """
+    SQLite-backed store of questions, the SQL that answered them and the
+    time the agent needed to produce it.
+    """
+
+    def __init__(self, path: str = QUESTION_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with write_connection(path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS question_cache (
+                    schema_fingerprint TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    original_question TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    agent_seconds REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    seconds_saved REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_hit_at REAL,
+                    PRIMARY KEY (schema_fingerprint, question)
+                )
+                """
+            )
+            conn.commit()
+
+    def lookup(self, fingerprint: str, question: str, fuzzy: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Find the cached SQL for a question, optionally allowing rewordings
+        with the same content words (see question_terms)
+
+        Returns:
+            Dictionary with question, sql, agent_seconds and match ("exact" or
+            "fuzzy"), or None
+        """
+        key = normalize_question(question)
+        with read_connection(self.path) as conn:
+            row = conn.execute(
+                "SELECT question, sql, agent_seconds FROM question_cache "
+                "WHERE schema_fingerprint = ? AND question = ?",
+                (fingerprint, key),
+            ).fetchone()
+            if row is not None:
+                return {"question": row[0], "sql": row[1], "agent_seconds": row[2], "match": "exact"}
+            if not fuzzy:
+                return None
+
+            candidates = conn.execute(
+                "SELECT question, sql, agent_seconds FROM question_cache "
+                "WHERE schema_fingerprint = ? ORDER BY COALESCE(last_hit_at, created_at) DESC LIMIT ?",
+                (fingerprint, FUZZY_CANDIDATES),
+            ).fetchall()
+
+        terms = question_terms(key)
+        if not terms:
+            return None
+        # Candidates come most recently used first
+        best = next((c for c in candidates if question_terms(c[0]) == terms), None)
+        if best is None:
+            return None
+        return {"question": best[0], "sql": best[1], "agent_seconds": best[2], "match": "fuzzy"}
+
+    def store(self, fingerprint: str, question: str, sql: str, agent_seconds: float) -> None:
+        with write_connection(self.path) as conn:
+            conn.execute(
+                """
+                INSERT INTO question_cache
+                    (schema_fingerprint, question, original_question, sql, agent_seconds, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (schema_fingerprint, question) DO UPDATE SET
+                    original_question = excluded.original_question,
+                    sql = excluded.sql,
+                    agent_seconds = excluded.agent_seconds,
+                    created_at = excluded.created_at
+                """,
+                (fingerprint, normalize_question(question), question, sql, agent_seconds, time.time()),
+            )
+            conn.commit()
+
+    def record_hit(self, fingerprint: str, cached_question: str, seconds_saved: float) -> None:
+        with write_connection(self.path) as conn:
+            conn.execute(
+                "UPDATE question_cache SET hits = hits + 1, seconds_saved = seconds_saved + ?, "
+                "last_hit_at = ? WHERE schema_fingerprint = ? AND question = ?",
+                (max(seconds_saved, 0.0), time.time(), fingerprint, cached_question),
+            )
+            conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with read_connection(self.path) as conn:
+            entries, hits, saved = conn.execute(
+                "SELECT count(*), COALESCE(SUM(hits), 0), COALESCE(SUM(seconds_saved), 0) FROM question_cache"
+            ).fetchone()
+        return {"entries": entries, "hits": hits, "seconds_saved": saved}
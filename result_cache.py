@@ -0,0 +1,138 @@
+"""
+LRU cache for query results with a byte budget.
+
+Used by db_tools.text_to_sql. Keys are built by the caller and always start
+with the resolved database path, so every entry of one database can be
+dropped at once when it is written to.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Default memory budget for cached results
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+
+# String literals, quoted identifiers and comments; everything else is
+# case-folded and has its whitespace collapsed
+_SQL_SPECIAL = re.compile(
+    r"'(?:[^']|'')*'"
+    r'|"(?:[^"]|"")*"'
+    r"|`[^`]*`"
+    r"|\[[^\]]*\]"
+    r"|--[^\n]*"
+    r"|/\*.*?\*/",
+    re.S,
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Canonical form of a query for cache keys.
+
+    Comments are dropped, whitespace is collapsed and keywords/identifiers are
+    lower-cased, while string literals and quoted identifiers are kept as-is.
+    """
+    parts = []
+    plain = []
+    pos = 0
+
+    def flush():
+        if plain:
+            parts.append(re.sub(r"\s+", " ", "".join(plain)).lower())
+            plain.clear()
+
+    for m in _SQL_SPECIAL.finditer(sql):
+        plain.append(sql[pos:m.start()])
+        token = m.group()
+        if token.startswith("--") or token.startswith("/*"):
+            plain.append(" ")
+        else:
+            flush()
+            parts.append(token)
+        pos = m.end()
+    plain.append(sql[pos:])
+    flush()
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Rough in-memory size of a cached result, in bytes
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value) + 49
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(estimate_size(v) for v in value)
+    return 24
+
+
+class ResultCache:
+    """
+    Thread-safe LRU mapping with a total byte budget and usage counters.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Tuple[Hashable, ...], value: Any) -> None:
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, db_key: str) -> None:
+        """
+        Drop every entry whose key starts with db_key
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == db_key]:
+                self._bytes -= self._entries.pop(key)[1]
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,155 @@
+"""
+Compact encoding of query results for the model.
+
+The execute_sql tool used to hand the model the Python repr of a list of
+dicts, which repeats every column name on every row and has no size limit.
+encode_result writes the column names once (CSV or a markdown table), stops
+at a row and a character budget, and adds a short summary of every column so
+the model can still describe the rows it was not shown. The full result goes
+to the UI separately (the tool's artifact).
+"""
+import csv
+import io
+import math
+from typing import Any, Dict, List, Optional
+
+# Rows and characters of a result sent to the model
+RESULT_ROW_BUDGET = 50
+RESULT_CHAR_BUDGET = 6_000
+RESULT_FORMATS = ("csv", "markdown")
+# Longest cell written before it is cut
+RESULT_VALUE_CHARS = 200
+# Characters kept for the summary lines after the table
+_SUMMARY_RESERVE = 600
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, float):
+        text = repr(value)
+    else:
+        text = str(value)
+    if len(text) > RESULT_VALUE_CHARS:
+        text = text[:RESULT_VALUE_CHARS - 3] + "..."
+    return text
+
+
+def _csv_line(cells: List[str]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(cells)
+    return buffer.getvalue()
+
+
+def _markdown_line(cells: List[str]) -> str:
+    return "| " + " | ".join(c.replace("|", "\\|").replace("\n", " ") for c in cells) + " |"
+
+
+def format_rows(columns: List[str], rows: List[Dict[str, Any]], fmt: str = "csv", max_chars: Optional[int] = None):
+    """
+    Rows as a CSV or markdown table with the header written once.
+
+    Rows are added until max_chars would be exceeded.
+
+    Returns:
+        (text, number of rows written)
+    """
+    if fmt not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result format {fmt!r}; expected one of {', '.join(RESULT_FORMATS)}")
+    line = _csv_line if fmt == "csv" else _markdown_line
+    lines = [line([str(c) for c in columns])]
+    if fmt == "markdown":
+        lines.append("|" + "---|" * len(columns))
+    size = sum(len(text) + 1 for text in lines)
+    written = 0
+    for row in rows:
+        text = line([_cell(row.get(c)) for c in columns])
+        if max_chars is not None and size + len(text) + 1 > max_chars:
+            break
+        lines.append(text)
+        size += len(text) + 1
+        written += 1
+    return "\n".join(lines), written
+
+
+def summarize_columns(columns: List[str], rows: List[Dict[str, Any]]) -> List[str]:
+    """
+    One line per column: nulls, and min/max/mean of numbers or the distinct
+    count and range of other values
+    """
+    lines = []
+    for column in columns:
+        values = [row.get(column) for row in rows]
+        present = [v for v in values if v is not None]
+        parts = []
+        if len(present) < len(values):
+            parts.append(f"{len(values) - len(present)} null")
+        numbers = [v for v in present if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        if numbers and len(numbers) == len(present):
+            finite = [v for v in numbers if not (isinstance(v, float) and math.isnan(v))]
+            if finite:
+                mean = sum(finite) / len(finite)
+                parts.append(f"min {_cell(min(finite))}, max {_cell(max(finite))}, mean {mean:.6g}")
+        elif present:
+            texts = [_cell(v) for v in present]
+            parts.append(f"{len(set(texts))} distinct")
+            parts.append(f"from {min(texts)[:40]!r} to {max(texts)[:40]!r}")
+        lines.append(f"- {column}: " + (", ".join(parts) or "no values"))
+    return lines
+
+
+def encode_result(
+    result: Dict[str, Any],
+    max_rows: int = RESULT_ROW_BUDGET,
+    max_chars: int = RESULT_CHAR_BUDGET,
+    fmt: str = "csv",
+) -> str:
+    """
+    Text for the model describing a text_to_sql result within the budgets.
+
+    Args:
+        result: Dictionary returned by db_tools.text_to_sql
+        max_rows: Largest number of rows written out
+        max_chars: Approximate size limit of the returned text
+        fmt: "csv" or "markdown"
+
+    Returns:
+        Row count line, the (possibly truncated) table, a truncation notice
+        and a per-column summary; errors are returned as "Error: ..." lines
+    """
+    rows = result.get("results") or []
+    if rows and "error" in rows[0]:
+        error = rows[0]
+        lines = [f"Error: {error['error']}"]
+        for key in ("budget_exceeded", "cancelled", "hint"):
+            if error.get(key):
+                lines.append(f"{key}: {error[key]}")
+        return "\n".join(lines)
+
+    columns = result.get("columns") or (list(rows[0]) if rows else [])
+    has_more = bool(result.get("has_more"))
+    count = f"{len(rows)}{'+' if has_more else ''} rows x {len(columns)} columns"
+    if not rows:
+        return f"{count}: the query returned no rows." + (f"\nColumns: {', '.join(columns)}" if columns else "")
+
+    header = f"{count}."
+    table, written = format_rows(
+        columns, rows[:max_rows], fmt, max_chars=max(max_chars - len(header) - _SUMMARY_RESERVE, 0)
+    )
+    parts = [header, table]
+    if written < len(rows) or has_more:
+        notice = f"Showing {written} of {len(rows)} rows"
+        if has_more:
+            notice += f"; the query has more rows (next_page_token: {result.get('next_page_token')})"
+        parts.append(notice + ". Use aggregation or LIMIT instead of reading every row.")
+    if len(rows) > 1:
+        # Also covers the rows the model was not shown
+        summary = "\n".join(summarize_columns(columns, rows))
+        budget = max_chars - sum(len(p) + 1 for p in parts) - 30
+        if len(summary) > budget:
+            summary = summary[:max(budget, 0)].rsplit("\n", 1)[0]
+        if summary:
+            parts.append(f"Summary of {'all ' if written < len(rows) else ''}{len(rows)} rows:\n{summary}")
+    return "\n".join(parts)
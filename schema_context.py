@@ -0,0 +1,338 @@
+"""
+Relevance-ranked schema context for the agent.
+
+Sending every table and its sample rows to the model does not scale to
+databases with hundreds of tables. SchemaIndex keeps a small BM25 index over
+table names, column names, sample values and the most common values recorded
+in the column profiles; build_schema_context picks the
+tables relevant to a question, adds the tables they join to (foreign keys or
+shared key columns) and renders them as compact text within a token budget.
+"""
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Default size of the schema context handed to the model
+SCHEMA_TOKEN_BUDGET = 4_000
+# Tables picked by relevance before related tables are added
+SCHEMA_TOP_K = 8
+# Related tables score this fraction of the table they were reached from
+RELATED_DECAY = 0.5
+# Sample values are cut to this many characters in the context
+SAMPLE_VALUE_CHARS = 40
+# Most common values shown per column in the stats line
+STATS_TOP_VALUES = 3
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+# Identifier tokens weigh more than sample values
+_TABLE_WEIGHT = 3
+_COLUMN_WEIGHT = 2
+# Character trigrams catch partial matches ("cust" vs "customers")
+_TRIGRAM_WEIGHT = 0.3
+# Tables scoring below this fraction of the best match are not relevant
+_MIN_RELATIVE_SCORE = 0.3
+# Budget kept for the "Other tables" line
+_TRAILER_TOKENS = 40
+
+_WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+# Words that say nothing about which table is meant
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "for", "from", "how", "in", "is", "it", "many", "much",
+    "of", "on", "or", "per", "show", "the", "to", "what", "which", "who", "with", "all", "list", "me",
+    "give", "get", "find", "each", "every", "top", "most", "least", "number", "count", "total",
+    "yang", "dan", "di", "ke", "dari", "berapa", "apa", "tampilkan", "semua",
+}
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: Any) -> List[str]:
+    """
+    Lower-cased, lightly stemmed words of a name, value or question;
+    snake_case and camelCase identifiers are split into their words
+    """
+    return [
+        _stem(w.lower()) for w in _WORD.findall(str(text))
+        if w.lower() not in _STOPWORDS
+    ]
+
+
+def _trigrams(words: List[str]) -> List[str]:
+    grams = []
+    for word in words:
+        padded = f" {word} "
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def estimate_tokens(text: str) -> int:
+    # About four characters per token for English text and identifiers
+    return len(text) // 4 + 1
+
+
+class _BM25:
+    """
+    Okapi BM25 over a fixed set of documents (bags of terms)
+    """
+
+    def __init__(self, documents: List[Counter]):
+        lengths = [sum(d.values()) for d in documents]
+        avg_length = (sum(lengths) / len(documents)) if documents else 0.0
+        self.size = len(documents)
+        # term -> [(document, term weight)], with the length normalization folded in
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        for i, document in enumerate(documents):
+            norm = 1 - _B + _B * lengths[i] / (avg_length or 1)
+            for term, tf in document.items():
+                self.postings.setdefault(term, []).append((i, tf * (_K1 + 1) / (tf + _K1 * norm)))
+        self.idf = {
+            term: math.log(1 + (self.size - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()
+        }
+
+    def scores(self, terms: List[str]) -> List[float]:
+        result = [0.0] * self.size
+        for term in set(terms):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, weight in self.postings[term]:
+                result[i] += idf * weight
+        return result
+
+
+class SchemaIndex:
+    """
+    Search index over the tables of one database.
+
+    Args:
+        schema: Table name -> column dictionaries (name, type, pk, note)
+        sample_data: Table name -> sample rows
+        foreign_keys: Table name -> (column, referenced table, referenced column)
+        profiles: Table name -> column name -> profile summary (see profiles.py)
+    """
+
+    def __init__(
+        self,
+        schema: Dict[str, List[Dict[str, Any]]],
+        sample_data: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        foreign_keys: Optional[Dict[str, List[Tuple[str, str, str]]]] = None,
+        profiles: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None,
+    ):
+        self.schema = schema
+        self.sample_data = sample_data or {}
+        self.foreign_keys = foreign_keys or {}
+        self.profiles = profiles or {}
+        self.tables = list(schema)
+
+        words, grams = [], []
+        for table in self.tables:
+            bag: Counter = Counter()
+            bag.update(tokenize(table) * _TABLE_WEIGHT)
+            for column in schema[table]:
+                bag.update(tokenize(column["name"]) * _COLUMN_WEIGHT)
+            for row in self.sample_data.get(table, []):
+                for value in row.values():
+                    if isinstance(value, str):
+                        bag.update(tokenize(value[:100]))
+            # Common values find tables the sample rows do not show ("Jakarta")
+            for stats in self.profiles.get(table, {}).values():
+                for value, _ in stats.get("top_values", []):
+                    if isinstance(value, str):
+                        bag.update(tokenize(value[:100]))
+            words.append(bag)
+            grams.append(Counter(_trigrams(list(bag.elements()))))
+        self._words = _BM25(words)
+        self._grams = _BM25(grams)
+        self._related = self._related_tables()
+
+    def _related_tables(self) -> Dict[str, Dict[str, str]]:
+        """
+        Table -> {related table: reason}, through foreign keys (both ways)
+        and through shared key-like column names
+        """
+        related: Dict[str, Dict[str, str]] = {t: {} for t in self.tables}
+        for table, keys in self.foreign_keys.items():
+            for column, target, target_column in keys:
+                if table in related and target in related and target != table:
+                    related[table][target] = f"{table}.{column} -> {target}.{target_column or 'rowid'}"
+                    related[target][table] = f"{table}.{column} -> {target}.{target_column or 'rowid'}"
+
+        # A column named like a key ("customer_id", or another table's
+        # primary key) links the tables that have it
+        by_column: Dict[str, List[str]] = {}
+        primary = {c["name"].lower() for cols in self.schema.values() for c in cols if c.get("pk")}
+        for table in self.tables:
+            for column in self.schema[table]:
+                name = column["name"].lower()
+                if name.endswith("_id") or (name in primary and name != "id"):
+                    by_column.setdefault(name, []).append(table)
+        for name, tables in by_column.items():
+            if len(tables) > 20:
+                continue  # too common to mean a join
+            for a in tables:
+                for b in tables:
+                    if a != b:
+                        related[a].setdefault(b, f"shared column {name}")
+        return related
+
+    def rank(self, question: str) -> List[Tuple[str, float]]:
+        """
+        Tables ordered by relevance to the question, best first; tables with
+        no match are left out
+        """
+        terms = tokenize(question)
+        if not terms:
+            return []
+        words = self._words.scores(terms)
+        grams = self._grams.scores(_trigrams(terms))
+        scored = [(table, w + _TRIGRAM_WEIGHT * g) for table, w, g in zip(self.tables, words, grams)]
+        best = max((score for _, score in scored), default=0.0)
+        # Stray trigram overlaps give most tables a tiny score
+        return sorted(
+            [(table, score) for table, score in scored if score > 0 and score >= best * _MIN_RELATIVE_SCORE],
+            key=lambda item: -item[1],
+        )
+
+    def select(self, question: str, top_k: int = SCHEMA_TOP_K) -> List[Tuple[str, float, Optional[str]]]:
+        """
+        The top_k tables for a question followed by their related tables, as
+        (table, score, reason it was added or None)
+        """
+        chosen: Dict[str, Tuple[float, Optional[str]]] = {}
+        for table, score in self.rank(question)[:top_k]:
+            chosen[table] = (score, None)
+        for table, (score, _) in list(chosen.items()):
+            for other, reason in self._related[table].items():
+                current = chosen.get(other)
+                # Tables picked for themselves keep their place
+                if current is None or (current[1] is not None and current[0] < score * RELATED_DECAY):
+                    chosen[other] = (score * RELATED_DECAY, reason)
+        ordered = sorted(chosen.items(), key=lambda item: (item[1][1] is not None, -item[1][0]))
+        return [(table, score, reason) for table, (score, reason) in ordered]
+
+
+def _format_value(value: Any) -> str:
+    text = format(value, ".6g") if isinstance(value, float) else str(value)
+    if len(text) > SAMPLE_VALUE_CHARS:
+        text = text[:SAMPLE_VALUE_CHARS - 3] + "..."
+    return text
+
+
+def _format_stats(name: str, stats: Dict[str, Any]) -> str:
+    parts = []
+    if stats.get("null_fraction"):
+        parts.append(f"{stats['null_fraction']:.0%} null")
+    parts.append(f"{'~' if stats.get('approximate') else ''}{stats['distinct']} distinct")
+    if stats.get("min") is not None and stats.get("max") is not None and stats["distinct"] > 1:
+        parts.append(f"{_format_value(stats['min'])}..{_format_value(stats['max'])}")
+    if stats.get("quartiles"):
+        parts.append(f"median {_format_value(stats['quartiles'][1])}")
+    # Values under 1% of the rows say little about the column
+    top = [(v, c) for v, c in stats.get("top_values", []) if c * 100 >= stats.get("rows", 0)][:STATS_TOP_VALUES]
+    if top and stats.get("approximate"):
+        # Counts that may include replaced rows do not make a share
+        parts.append("top " + ", ".join(_format_value(v) for v, _ in top) + " (approximate)")
+    elif top:
+        parts.append("top " + ", ".join(f"{_format_value(v)} ({c / stats['rows']:.0%})" for v, c in top))
+    return f"{name}: " + ", ".join(parts)
+
+
+def render_table(
+    index: SchemaIndex, table: str, samples: bool = True, reason: Optional[str] = None, stats: bool = True
+) -> str:
+    """
+    Compact description of one table: columns with types and notes, its
+    foreign keys and (optionally) its sample rows and column statistics
+    """
+    columns = []
+    for column in index.schema[table]:
+        text = f"{column['name']} {column['type'] or 'ANY'}"
+        if column.get("pk"):
+            text += " PK"
+        if column.get("note"):
+            text += f" ({column['note']})"
+        columns.append(text)
+    lines = [f"TABLE {table}" + (f"  -- related: {reason}" if reason else ""), "  columns: " + ", ".join(columns)]
+    for column, target, target_column in index.foreign_keys.get(table, []):
+        lines.append(f"  foreign key: {column} -> {target}.{target_column or 'rowid'}")
+    profile = index.profiles.get(table) if stats else None
+    if profile:
+        lines.append("  column stats:")
+        for column in index.schema[table]:
+            if column["name"] in profile:
+                lines.append("    " + _format_stats(column["name"], profile[column["name"]]))
+    rows = index.sample_data.get(table) if samples else None
+    if rows:
+        names = list(rows[0])
+        lines.append("  sample rows (" + " | ".join(names) + "):")
+        for row in rows:
+            lines.append("    " + " | ".join(_format_value(row.get(n)) for n in names))
+    return "\n".join(lines)
+
+
+def build_schema_context(index: SchemaIndex, question: str = "", token_budget: int = SCHEMA_TOKEN_BUDGET) -> str:
+    """
+    Schema context for a question that fits in token_budget.
+
+    The relevant tables (and their related tables) come first with sample
+    rows and column statistics; when the budget runs short, tables lose
+    their sample rows, then their statistics, and whatever does not fit is
+    only listed by name. Without a question, or
+    when nothing matches, tables are taken in database order.
+    """
+    selected = index.select(question) if question else []
+    if not selected:
+        selected = [(table, 0.0, None) for table in index.tables]
+    else:
+        seen = {table for table, _, _ in selected}
+        selected += [(table, 0.0, None) for table in index.tables if table not in seen]
+    relevant = {table for table, score, _ in selected if score > 0}
+
+    header = f"Database with {len(index.tables)} tables."
+    if relevant:
+        header += " Showing the tables most relevant to the question first."
+    parts = [header]
+    used = estimate_tokens(header)
+    omitted = []
+    for table, score, reason in selected:
+        if omitted:
+            # Keep the order: once one table is left out, list the rest by name
+            omitted.append(table)
+            continue
+        for samples, stats in ((True, True), (False, True), (False, False)):
+            block = render_table(index, table, samples=samples, reason=reason, stats=stats)
+            cost = estimate_tokens(block) + 1  # with the blank line before it
+            # Keep room for the list of tables left out
+            if used + cost <= token_budget - _TRAILER_TOKENS:
+                parts.append(block)
+                used += cost
+                break
+        else:
+            omitted.append(table)
+
+    if omitted:
+        prefix = "Other tables (not shown; call get_schema_info with their names to see them): "
+        # Leave room for the separator and the "... and N more" suffix
+        remaining = token_budget - used - estimate_tokens(prefix) - 6
+        shown = []
+        for table in omitted:
+            cost = estimate_tokens(table + ", ")
+            if cost > remaining:
+                break
+            shown.append(table)
+            remaining -= cost
+        names = ", ".join(shown)
+        if len(shown) < len(omitted):
+            names += f"{', ' if shown else ''}... and {len(omitted) - len(shown)} more"
+        parts.append(prefix + names)
+    return "\n\n".join(parts)
@@ -0,0 +1,929 @@
+"""
+Materialized summary tables for recurring GROUP BY questions.
+
+Many questions are the same aggregate over a large table, e.g. revenue by
+month or units by product, and each one scans the whole table again. A
+summary stores such a GROUP BY once: its key expressions and the partial
+aggregates count(*), sum, total, count, min and max (avg is kept as a sum and
+a count). Partial aggregates can be combined, so a summary
+
+  * refreshes incrementally after an append: only the rows past the rowid
+    it was built up to are aggregated and merged into it, and
+  * answers queries that group by its keys or by fewer of them, filter on
+    its keys, and aggregate what it stores: rewrite_query turns them into a
+    GROUP BY over the summary, which has one row per group instead of one
+    per base row.
+
+Summaries are hidden tables "_dbassist_summary_<name>" described in
+"_dbassist_summaries", with the rowid they cover and when they were last
+refreshed. Imports through create_table refresh them. A write query on the
+base table marks them stale, and a stale summary is never used to answer a
+query until it is refreshed. Rows appended by other programs are noticed
+(the table's largest rowid moves), updates and deletes made outside the app
+are not.
+
+Summaries can be defined by hand or proposed from the GROUP BY queries in
+the query log (suggest_summaries), like the index advisor does for indexes.
+"""
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from connections import read_connection, retry_on_busy, write_connection
+from importer import quote_ident
+from profiles import load_profiles
+from query_log import get_query_log
+from table_browser import browse_source
+
+SUMMARIES_TABLE = "_dbassist_summaries"
+SUMMARY_TABLE_PREFIX = "_dbassist_summary_"
+# Tables smaller than this are cheap to aggregate and get no proposals
+SUMMARY_MIN_ROWS = 10_000
+# A proposal must have at most this many groups per base row
+SUMMARY_MAX_GROUP_RATIO = 0.1
+# Logged query fingerprints considered per analysis, most expensive first
+SUMMARY_MAX_FINGERPRINTS = 200
+
+# Aggregate -> stored partial aggregates; how partials of several groups
+# combine; how the query's aggregate is read back from them
+_PARTS = {
+    "count": ("count",), "sum": ("sum",), "total": ("total",), "min": ("min",), "max": ("max",), "avg": ("sum", "count"),
+}
+_MERGE = {"count": "sum", "sum": "sum", "total": "total", "min": "min", "max": "max"}
+_READ = {
+    "count": "sum({count})",
+    "sum": "sum({sum})",
+    "total": "total({total})",
+    "min": "min({min})",
+    "max": "max({max})",
+    # avg() is a real; division by a zero count gives NULL, as avg() does
+    "avg": "(total({sum}) / sum({count}))",
+}
+
+_TOKEN = re.compile(
+    r"""\s+|--[^\n]*|/\*.*?(?:\*/|$)
+    |(?P<ident>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|[A-Za-z_][\w$]*)
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+    |(?P<param>[?:@$][\w]*)
+    |(?P<op><=|>=|==|!=|<>|\|\||<<|>>|[-+*/%=<>(),.;&|~])
+    |(?P<other>.)""",
+    re.X | re.S,
+)
+
+_CLAUSES = ("select", "from", "where", "group", "having", "order", "limit")
+# Statements with these at the top level are not a single GROUP BY
+_UNSUPPORTED = {"with", "union", "except", "intersect", "join", "window", "values", "natural", "cross", "indexed"}
+# Identifiers that end an expression but are not an alias
+_NOT_ALIAS = {"null", "true", "false", "end", "asc", "desc", "current_date", "current_time", "current_timestamp"}
+_ROWID = {"rowid", "oid", "_rowid_"}
+# Scalar functions that give the same value over a summary's keys as over
+# the base rows. Any other call (group_concat, json_group_array, FILTER,
+# random(), ...) keeps the query on its base table.
+_SCALAR_FUNCTIONS = {
+    "abs", "cast", "char", "coalesce", "concat", "concat_ws", "date", "datetime", "format", "hex", "ifnull", "iif",
+    "instr", "julianday", "length", "lower", "ltrim", "nullif", "printf", "quote", "replace", "round", "rtrim",
+    "sign", "strftime", "substr", "substring", "time", "trim", "typeof", "unicode", "unixepoch", "upper",
+    "ceil", "ceiling", "floor", "trunc", "ln", "log", "log10", "log2", "exp", "pow", "power", "sqrt", "mod",
+}
+# Keywords that can stand right before a parenthesis without being a call
+_PAREN_KEYWORDS = {
+    "in", "and", "or", "not", "is", "when", "then", "else", "case", "between", "like", "glob", "by", "as",
+}
+_NAME = re.compile(r"^\w+$")
+
+
+class _Token:
+    __slots__ = ("kind", "key", "start", "end")
+
+    def __init__(self, kind: str, key: str, start: int, end: int):
+        self.kind, self.key, self.start, self.end = kind, key, start, end
+
+
+def _tokenize(sql: str) -> List[_Token]:
+    """
+    Tokens with their place in the SQL text. The key of an identifier is
+    its unquoted, lower-cased name; string literals keep their case.
+    """
+    tokens = []
+    for m in _TOKEN.finditer(sql):
+        kind = m.lastgroup
+        if kind is None:
+            continue
+        value = m.group()
+        if kind == "ident":
+            if value[0] in "\"`[":
+                value = value[1:-1].replace('""', '"') if value[0] == '"' else value[1:-1]
+                kind = "qident"
+            value = value.lower()
+        elif kind != "string":
+            value = value.lower()
+        tokens.append(_Token(kind, value, m.start(), m.end()))
+    return tokens
+
+
+def _is_name(token: _Token) -> bool:
+    return token.kind in ("ident", "qident")
+
+
+def _norm(tokens: Sequence[_Token]) -> str:
+    """
+    Expression text compared between queries and summaries: case, quoting
+    and spacing do not matter
+    """
+    return " ".join(t.key for t in tokens)
+
+
+def _close(tokens: Sequence[_Token], i: int) -> Optional[int]:
+    """
+    Index of the parenthesis closing the one at i
+    """
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j].key == "(" and tokens[j].kind == "op":
+            depth += 1
+        elif tokens[j].key == ")" and tokens[j].kind == "op":
+            depth -= 1
+            if depth == 0:
+                return j
+    return None
+
+
+def _split_commas(tokens: Sequence[_Token]) -> List[List[_Token]]:
+    parts: List[List[_Token]] = [[]]
+    depth = 0
+    for token in tokens:
+        if token.kind == "op" and token.key == "(":
+            depth += 1
+        elif token.kind == "op" and token.key == ")":
+            depth -= 1
+        if depth == 0 and token.kind == "op" and token.key == ",":
+            parts.append([])
+        else:
+            parts[-1].append(token)
+    return [p for p in parts if p]
+
+
+def _parse(sql: str) -> Optional[Dict[str, Any]]:
+    """
+    Clauses of a single-table SELECT with a GROUP BY, or None for anything
+    else (joins, subqueries, compound or window queries, ...)
+
+    Returns:
+        Dictionary with sql (without a trailing ";"), tokens, table, alias,
+        the token range of the FROM
+        clause, the tokens of every clause, and the select items as
+        (expression tokens, alias)
+    """
+    sql = sql.strip().rstrip(";")
+    tokens = _tokenize(sql)
+    if not tokens or tokens[0].key != "select" or tokens[0].kind != "ident":
+        return None
+    clauses: Dict[str, Tuple[int, int]] = {}
+    depth = 0
+    current, begin = None, 0
+    for i, token in enumerate(tokens):
+        if token.kind == "op" and token.key == "(":
+            depth += 1
+        elif token.kind == "op" and token.key == ")":
+            depth -= 1
+        elif token.kind == "ident" and token.key in ("select", "over"):
+            if i > 0:
+                return None  # subquery or window function
+        elif token.kind == "op" and token.key == ";":
+            return None
+        if depth == 0 and token.kind == "ident":
+            if token.key in _UNSUPPORTED:
+                return None
+            if token.key in _CLAUSES and token.key not in clauses and (token.key != "select" or i == 0):
+                if current is not None:
+                    clauses[current] = (begin, i)
+                current, begin = token.key, i + 1
+                if token.key in ("group", "order"):
+                    if i + 1 >= len(tokens) or tokens[i + 1].key != "by":
+                        return None
+                    begin = i + 2
+    if current is not None:
+        clauses[current] = (begin, len(tokens))
+    if "from" not in clauses or "group" not in clauses:
+        return None
+
+    # FROM <table> [[AS] alias]
+    source = tokens[clauses["from"][0]:clauses["from"][1]]
+    if not source or not _is_name(source[0]):
+        return None
+    table, rest = source[0].key, source[1:]
+    if len(rest) >= 2 and rest[0].key == "." and _is_name(rest[1]):
+        if source[0].key not in ("main", "temp"):
+            return None
+        table, rest = rest[1].key, rest[2:]
+    alias = table
+    if rest and rest[0].kind == "ident" and rest[0].key == "as":
+        rest = rest[1:]
+    if len(rest) == 1 and _is_name(rest[0]):
+        alias = rest[0].key
+    elif rest:
+        return None
+
+    items = []
+    select = tokens[clauses["select"][0]:clauses["select"][1]]
+    if select and select[0].key in ("distinct", "all") and select[0].kind == "ident":
+        select = select[1:]
+    for item in _split_commas(select):
+        name = None
+        if len(item) >= 3 and item[-2].kind == "ident" and item[-2].key == "as" and _is_name(item[-1]):
+            item, name = item[:-2], item[-1].key
+        elif (
+            len(item) >= 2 and _is_name(item[-1]) and item[-1].key not in _NOT_ALIAS
+            and (item[-2].key == ")" or item[-2].kind in ("ident", "qident", "string", "number"))
+            and item[-2].key not in ("is", "not", "and", "or", "like", "glob", "in", "between", "case", "when",
+                                     "then", "else", "collate", "escape", "distinct")
+            and item[-2].key != "."
+        ):
+            item, name = item[:-1], item[-1].key
+        items.append((item, name))
+    return {
+        "sql": sql, "tokens": tokens, "table": table, "alias": alias, "from": clauses["from"],
+        "clauses": {k: tokens[a:b] for k, (a, b) in clauses.items()}, "items": items,
+    }
+
+
+def _unqualify(tokens: Sequence[_Token], table: str, alias: str) -> List[Tuple[_Token, int]]:
+    """
+    Tokens without "alias." qualifiers, each with the start of its text
+    including the qualifier
+    """
+    out = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if (
+            _is_name(token) and token.key in (table, alias) and i + 2 < len(tokens)
+            and tokens[i + 1].key == "." and _is_name(tokens[i + 2])
+        ):
+            out.append((tokens[i + 2], token.start))
+            i += 3
+            continue
+        out.append((token, token.start))
+        i += 1
+    return out
+
+
+def _aggregate_call(tokens: Sequence[Tuple[_Token, int]], i: int) -> Optional[Tuple[str, List[_Token], int]]:
+    """
+    (function, argument tokens, index of the closing parenthesis) of an
+    aggregate call starting at i
+    """
+    token = tokens[i][0]
+    if token.kind != "ident" or token.key not in _PARTS or i + 1 >= len(tokens) or tokens[i + 1][0].key != "(":
+        return None
+    close = _close([t for t, _ in tokens], i + 1)
+    if close is None:
+        return None
+    return token.key, [t for t, _ in tokens[i + 2:close]], close
+
+
+class _NoMatch(Exception):
+    pass
+
+
+def _substitute(query: Dict[str, Any], definition: Dict[str, Any], columns: Sequence[str], summary_table: str) -> str:
+    """
+    The query reading the summary instead of its base table
+
+    Raises:
+        _NoMatch: the query reads a column or aggregate the summary lacks
+    """
+    sql = query["sql"]
+    declared = {c.lower(): c for c in columns}
+    columns = set(declared)
+    keys = sorted(
+        ((key["norm"].split(" "), key["name"]) for key in definition["keys"]), key=lambda k: len(k[0]), reverse=True
+    )
+    stored = {part["norm"]: part["name"] for part in definition["parts"]}
+    for expr, name in query["items"]:
+        # An alias that hides a base column changes what GROUP BY/ORDER BY mean
+        if name in columns and _norm(expr) != name:
+            raise _NoMatch()
+
+    def rewrite(tokens: List[Tuple[_Token, int]], keys_only: bool = False) -> List[Tuple[int, int, str]]:
+        edits = []
+        i = 0
+        while i < len(tokens):
+            token, start = tokens[i]
+            call = None if keys_only else _aggregate_call(tokens, i)
+            if call is not None:
+                func, arg, close = call
+                if arg and arg[0].key in ("distinct", "all") and arg[0].kind == "ident":
+                    raise _NoMatch()
+                argument = "*" if func == "count" and _norm(arg) == "*" else _norm(arg)
+                names = {p: stored.get(f"{p}({argument})") for p in _PARTS[func]}
+                if all(names.values()):
+                    text = _READ[func].format(**{p: quote_ident(n) for p, n in names.items()})
+                elif func in ("min", "max"):
+                    # min/max of key expressions are the same over groups
+                    inner = tokens[i + 2:close]
+                    inner_edits = rewrite(inner, keys_only=True)
+                    text = _splice(sql, inner[0][1], inner[-1][0].end, inner_edits) if inner else ""
+                    text = f"{func}({text})"
+                else:
+                    raise _NoMatch()
+                edits.append((start, tokens[close][0].end, text))
+                i = close + 1
+                continue
+            for norm, name in keys:
+                window = [t.key for t, _ in tokens[i:i + len(norm)]]
+                if window == norm and not (len(norm) == 1 and i + 1 < len(tokens) and tokens[i + 1][0].key == "("):
+                    edits.append((start, tokens[i + len(norm) - 1][0].end, quote_ident(name)))
+                    i += len(norm)
+                    break
+            else:
+                if _is_name(token):
+                    previous = tokens[i - 1][0].key if i else ""
+                    calls = i + 1 < len(tokens) and tokens[i + 1][0].key == "("
+                    if previous != "as" and not calls and (token.key in columns or token.key in _ROWID):
+                        raise _NoMatch()
+                    if calls and token.kind == "ident" and token.key not in _SCALAR_FUNCTIONS | _PAREN_KEYWORDS:
+                        # An aggregate the summary does not store, or a
+                        # function that may differ between groups and rows
+                        raise _NoMatch()
+                elif token.key == "*" and (i == 0 or tokens[i - 1][0].key in (",", "select", "distinct", "all", ".")):
+                    raise _NoMatch()
+                i += 1
+        return edits
+
+    tokens = query["tokens"]
+    start, end = query["from"]
+    table_start = tokens[start].start
+    table_end = tokens[end - 1].end
+    edits = [(table_start, table_end, quote_ident(summary_table))]
+    select = rewrite(_unqualify(tokens[:start - 1], query["table"], query["alias"]))
+    # Result columns keep the names SQLite gave them: the column name of a
+    # column reference, else the expression as written
+    for expr, name in query["items"]:
+        first, last = expr[0].start, expr[-1].end
+        if name is None and any(first <= a < last for a, _, _ in select):
+            column = expr[-1].key if _is_name(expr[-1]) and (len(expr) == 1 or expr[-2].key == ".") else None
+            label = declared.get(column) or sql[first:last]
+            select.append((last, last, f" AS {quote_ident(label)}"))
+    edits += select
+    edits += rewrite(_unqualify(tokens[end:], query["table"], query["alias"]))
+    return _splice(sql, 0, len(sql), edits)
+
+
+def _splice(sql: str, begin: int, end: int, edits: List[Tuple[int, int, str]]) -> str:
+    out = []
+    position = begin
+    for start, stop, text in sorted(edits):
+        out.append(sql[position:start])
+        out.append(text)
+        position = stop
+    out.append(sql[position:end])
+    return "".join(out)
+
+
+def _ensure_catalog(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {SUMMARIES_TABLE} ("
+        "name TEXT PRIMARY KEY, table_name TEXT NOT NULL, definition TEXT NOT NULL, watermark INTEGER, "
+        "base_rows INTEGER, groups INTEGER, refreshed_at REAL, refresh_seconds REAL, refresh_kind TEXT, "
+        "stale INTEGER NOT NULL DEFAULT 0, error TEXT)"
+    )
+
+
+def _catalog(conn: sqlite3.Connection, table: Optional[str] = None) -> List[Dict[str, Any]]:
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (SUMMARIES_TABLE,)).fetchone() is None:
+        return []
+    query = f"SELECT * FROM {SUMMARIES_TABLE}"
+    params: Tuple = ()
+    if table is not None:
+        query += " WHERE lower(table_name) = lower(?)"
+        params = (table,)
+    cursor = conn.execute(query + " ORDER BY name", params)
+    names = [d[0] for d in cursor.description]
+    entries = []
+    for row in cursor:
+        entry = dict(zip(names, row))
+        entry["definition"] = json.loads(entry["definition"])
+        entries.append(entry)
+    return entries
+
+
+def summary_table_name(name: str) -> str:
+    return SUMMARY_TABLE_PREFIX + name
+
+
+def _parse_aggregate(text: str) -> Tuple[str, str]:
+    """
+    (function, normalized argument) of an aggregate such as "sum(price)"
+    """
+    tokens = [(t, t.start) for t in _tokenize(text)]
+    call = _aggregate_call(tokens, 0) if tokens else None
+    if call is None or call[2] != len(tokens) - 1:
+        raise ValueError(f"Not an aggregate: {text!r}; expected one of {', '.join(_PARTS)} applied to an expression")
+    func, arg, _ = call
+    if not arg or (arg[0].key in ("distinct", "all") and arg[0].kind == "ident"):
+        raise ValueError(f"{text!r} cannot be summarized; DISTINCT aggregates do not combine")
+    return func, "*" if func == "count" and _norm(arg) == "*" else _norm(arg)
+
+
+def make_definition(
+    keys: Union[Dict[str, str], Sequence[str]], aggregates: Sequence[str]
+) -> Dict[str, Any]:
+    """
+    Summary definition from its key expressions and aggregates
+
+    Args:
+        keys: Group key name -> SQL expression over the table's columns, or
+            a list of column names
+        aggregates: Aggregates to keep, e.g. ["sum(quantity * price)",
+            "avg(price)"]; count(*) is always kept
+
+    Raises:
+        ValueError: an aggregate that cannot be combined across groups
+    """
+    if not isinstance(keys, dict):
+        keys = {k: k for k in keys}
+    if not keys:
+        raise ValueError("A summary needs at least one key")
+    definition: Dict[str, Any] = {"keys": [], "aggregates": [], "parts": []}
+    for name, expr in keys.items():
+        norm = _norm(_tokenize(expr))
+        if not norm:
+            raise ValueError(f"Empty expression for key {name!r}")
+        definition["keys"].append({"name": name, "expr": expr, "norm": norm})
+
+    def add_part(part: str, expr: str, norm: str) -> None:
+        name = f"{part}({norm})"
+        if all(p["name"] != name for p in definition["parts"]):
+            definition["parts"].append({"name": name, "norm": name, "func": part, "expr": expr})
+
+    add_part("count", "*", "*")
+    for text in aggregates:
+        func, norm = _parse_aggregate(text)
+        arg = text[text.index("(") + 1:text.rindex(")")]
+        definition["aggregates"].append({"func": func, "expr": arg, "norm": norm})
+        for part in _PARTS[func]:
+            add_part(part, arg, norm)
+    if {k["name"] for k in definition["keys"]} & {p["name"] for p in definition["parts"]}:
+        raise ValueError("Key names must differ from the stored aggregates")
+    return definition
+
+
+def _source(conn: sqlite3.Connection, table: str) -> Dict[str, Any]:
+    """
+    SELECT exposing the columns of a table (dictionary-encoded ones
+    decoded), and the rowid the summary can be refreshed from, if any
+    """
+    source = browse_source(conn, table)
+    select = ", ".join(f"{expr} AS {quote_ident(name)}" for name, expr in source["columns"].items())
+    rowid = source["rowid"]
+    return {
+        "select": f"SELECT {select} FROM {source['from']}",
+        "columns": list(source["columns"]),
+        "rowid": rowid,
+        "max_rowid": f"SELECT max(d.rowid) FROM {source['from']}" if rowid else None,
+    }
+
+
+def _aggregate_sql(definition: Dict[str, Any], base: str) -> str:
+    keys = [f"{k['expr']} AS {quote_ident(k['name'])}" for k in definition["keys"]]
+    parts = [f"{p['func']}({p['expr']}) AS {quote_ident(p['name'])}" for p in definition["parts"]]
+    positions = ", ".join(str(i + 1) for i in range(len(keys)))
+    return f"SELECT {', '.join(keys + parts)} FROM ({base}) GROUP BY {positions}"
+
+
+def _merge_sql(definition: Dict[str, Any], summary: str, delta: str) -> str:
+    keys = [quote_ident(k["name"]) for k in definition["keys"]]
+    parts = [f"{_MERGE[p['func']]}({quote_ident(p['name'])}) AS {quote_ident(p['name'])}" for p in definition["parts"]]
+    positions = ", ".join(str(i + 1) for i in range(len(keys)))
+    return (
+        f"SELECT {', '.join(keys + parts)} FROM (SELECT * FROM {quote_ident(summary)} UNION ALL {delta}) "
+        f"GROUP BY {positions}"
+    )
+
+
+def _refresh(conn: sqlite3.Connection, entry: Dict[str, Any], incremental: bool) -> Dict[str, Any]:
+    """
+    Rebuild or incrementally refresh one summary inside the caller's
+    transaction, and record it in the catalog
+    """
+    start = time.perf_counter()
+    definition = entry["definition"]
+    table = summary_table_name(entry["name"])
+    source = _source(conn, entry["table_name"])
+    high = conn.execute(source["max_rowid"]).fetchone()[0] if source["rowid"] else None
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone() is not None
+    low = entry.get("watermark")
+    incremental = (
+        incremental and exists and not entry.get("stale") and not entry.get("error")
+        and high is not None and low is not None and high >= low
+    )
+    if incremental:
+        delta = _aggregate_sql(definition, f"{source['select']} WHERE d.rowid > {int(low)} AND d.rowid <= {int(high)}")
+        conn.execute(f"DROP TABLE IF EXISTS {quote_ident(table + '__new')}")
+        conn.execute(f"CREATE TABLE {quote_ident(table + '__new')} AS {_merge_sql(definition, table, delta)}")
+    else:
+        base = source["select"] + (f" WHERE d.rowid <= {int(high)}" if high is not None else "")
+        conn.execute(f"DROP TABLE IF EXISTS {quote_ident(table + '__new')}")
+        conn.execute(f"CREATE TABLE {quote_ident(table + '__new')} AS {_aggregate_sql(definition, base)}")
+    conn.execute(f"DROP TABLE IF EXISTS {quote_ident(table)}")
+    conn.execute(f"ALTER TABLE {quote_ident(table + '__new')} RENAME TO {quote_ident(table)}")
+    groups, rows = conn.execute(f"SELECT count(*), total(\"count(*)\") FROM {quote_ident(table)}").fetchone()
+    seconds = time.perf_counter() - start
+    conn.execute(
+        f"UPDATE {SUMMARIES_TABLE} SET watermark = ?, base_rows = ?, groups = ?, refreshed_at = ?, "
+        "refresh_seconds = ?, refresh_kind = ?, stale = 0, error = NULL WHERE name = ?",
+        (high, int(rows), groups, time.time(), seconds, "incremental" if incremental else "full", entry["name"]),
+    )
+    return {
+        "name": entry["name"], "kind": "incremental" if incremental else "full", "groups": groups,
+        "rows": int(rows), "seconds": round(seconds, 3),
+    }
+
+
+def refresh_summaries(
+    conn: sqlite3.Connection, table: Optional[str] = None, incremental: bool = True, name: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Refresh the summaries of a table (or one summary by name), each in its
+    own transaction. A summary that cannot be refreshed incrementally (never
+    built, stale, or rows of the table deleted) is rebuilt.
+
+    Args:
+        conn: Writable connection
+        table: Base table whose summaries are refreshed; all when None
+        incremental: Only aggregate the rows added since the last refresh;
+            False after rows were replaced or updated
+        name: Only refresh this summary
+
+    Returns:
+        Per summary: name, kind ("full" or "incremental"), groups, rows and
+        seconds, or name and error
+    """
+    results = []
+    for entry in _catalog(conn, table):
+        if name is not None and entry["name"] != name:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            results.append(_refresh(conn, entry, incremental))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            # e.g. the table was replaced without a column the summary uses
+            conn.execute(f"UPDATE {SUMMARIES_TABLE} SET stale = 1, error = ? WHERE name = ?", (str(e), entry["name"]))
+            conn.commit()
+            results.append({"name": entry["name"], "error": str(e)})
+    return results
+
+
+def mark_stale(conn: sqlite3.Connection, sql: str) -> None:
+    """
+    Mark the summaries of every table a write statement names as stale.
+    Runs in the caller's transaction.
+    """
+    entries = _catalog(conn)
+    if not entries:
+        return
+    names = {t.key for t in _tokenize(sql) if _is_name(t)}
+    for entry in entries:
+        table = entry["table_name"].lower()
+        if any(n == table or n.startswith(table + "__") for n in names):
+            conn.execute(
+                f"UPDATE {SUMMARIES_TABLE} SET stale = 1, error = ? WHERE name = ?",
+                ("The table was changed by a write query", entry["name"]),
+            )
+
+
+def summary_status(conn: sqlite3.Connection, entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Staleness of a summary: fresh, reason, rows_behind (rows appended
+    since its refresh, when known) and age_seconds
+    """
+    status = {
+        "fresh": False, "reason": entry.get("error"), "rows_behind": None,
+        "age_seconds": time.time() - entry["refreshed_at"] if entry.get("refreshed_at") else None,
+    }
+    if entry.get("refreshed_at") is None:
+        status["reason"] = status["reason"] or "Never built"
+        return status
+    if entry.get("stale"):
+        status["reason"] = status["reason"] or "Stale"
+        return status
+    try:
+        source = _source(conn, entry["table_name"])
+        high = conn.execute(source["max_rowid"]).fetchone()[0] if source["rowid"] else None
+    except (ValueError, sqlite3.Error) as e:
+        status["reason"] = str(e)
+        return status
+    if high is not None and entry["watermark"] is not None and high != entry["watermark"]:
+        status["rows_behind"] = max(high - entry["watermark"], 0)
+        status["reason"] = "Rows were added or deleted since the last refresh"
+        return status
+    status["fresh"] = True
+    return status
+
+
+def format_age(seconds: Optional[float]) -> str:
+    """
+    How long ago a summary was refreshed, e.g. "5 min ago"
+    """
+    if seconds is None:
+        return "never"
+    if seconds < 90:
+        return f"{seconds:.0f}s ago"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.0f} min ago"
+    if seconds < 36 * 3600:
+        return f"{seconds / 3600:.0f} h ago"
+    return f"{seconds / 86400:.0f} days ago"
+
+
+def rewrite_query(conn: sqlite3.Connection, sql: str) -> Optional[Dict[str, Any]]:
+    """
+    The query answered from a fresh summary of its table, if one covers it
+
+    Returns:
+        Dictionary with sql (the rewritten query) and summary (name, table,
+        groups, base_rows, refreshed_at), or None
+    """
+    query = _parse(sql)
+    if query is None:
+        return None
+    entries = [e for e in _catalog(conn, query["table"]) if not e["stale"] and e["refreshed_at"] is not None]
+    if not entries:
+        return None
+    try:
+        columns = _source(conn, entries[0]["table_name"])["columns"]
+    except (ValueError, sqlite3.Error):
+        return None
+    # The smallest summary that matches
+    for entry in sorted(entries, key=lambda e: e["groups"] or 0):
+        try:
+            rewritten = _substitute(query, entry["definition"], columns, summary_table_name(entry["name"]))
+        except _NoMatch:
+            continue
+        if not summary_status(conn, entry)["fresh"]:
+            continue
+        try:
+            conn.execute("EXPLAIN QUERY PLAN " + rewritten).fetchall()
+        except sqlite3.Error:
+            continue
+        return {
+            "sql": rewritten,
+            "summary": {k: entry[k] for k in ("name", "table_name", "groups", "base_rows", "refreshed_at")},
+        }
+    return None
+
+
+def create_summary(
+    db_name: str,
+    table: str,
+    keys: Union[Dict[str, str], Sequence[str]],
+    aggregates: Sequence[str],
+    name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Define and build a summary of a table
+
+    Args:
+        db_name: Database file name inside db/
+        table: Table (or dictionary-encoded view) to summarize
+        keys: Group key name -> expression, or a list of columns
+        aggregates: Aggregates to keep, e.g. ["sum(price)", "avg(quantity)"]
+        name: Summary name (letters, digits, underscores); by default
+            "<table>_by_<keys>"
+
+    Returns:
+        The refresh result (name, kind, groups, rows, seconds), or a
+        dictionary with an "error" key
+    """
+    try:
+        definition = make_definition(keys, aggregates)
+        name = name or f"{table}_by_{'_'.join(k['name'] for k in definition['keys'])}"
+        name = re.sub(r"\W+", "_", name).strip("_").lower()
+        if not _NAME.match(name):
+            raise ValueError(f"Invalid summary name {name!r}")
+
+        def build():
+            with write_connection("db/" + db_name) as conn:
+                _source(conn, table)  # the table exists
+                _ensure_catalog(conn)
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {SUMMARIES_TABLE} (name, table_name, definition, stale) VALUES (?, ?, ?, 0)",
+                    (name, table, json.dumps(definition)),
+                )
+                conn.commit()
+                results = refresh_summaries(conn, incremental=False, name=name)
+                if "error" in results[0]:
+                    # A definition that does not build is not kept
+                    conn.execute(f"DELETE FROM {SUMMARIES_TABLE} WHERE name = ?", (name,))
+                    conn.commit()
+                return results[0]
+
+        result = retry_on_busy(build)
+    except (ValueError, sqlite3.Error) as e:
+        return {"error": str(e)}
+    return result
+
+
+def drop_summary(db_name: str, name: str) -> Dict[str, Any]:
+    """
+    Drop a summary and its table
+    """
+    try:
+        with write_connection("db/" + db_name) as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {quote_ident(summary_table_name(name))}")
+            if _catalog(conn):
+                conn.execute(f"DELETE FROM {SUMMARIES_TABLE} WHERE name = ?", (name,))
+            conn.commit()
+    except sqlite3.Error as e:
+        return {"error": str(e)}
+    return {"ok": True}
+
+
+def refresh_summary(db_name: str, name: str) -> Dict[str, Any]:
+    """
+    Rebuild one summary from its whole table
+    """
+    try:
+        with write_connection("db/" + db_name) as conn:
+            results = refresh_summaries(conn, incremental=False, name=name)
+    except sqlite3.Error as e:
+        return {"error": str(e)}
+    return results[0] if results else {"error": f"No summary named {name!r}"}
+
+
+def list_summaries(db_name: str) -> List[Dict[str, Any]]:
+    """
+    Summaries of a database with their definition and staleness (see
+    summary_status)
+    """
+    if not os.path.exists("db/" + db_name):
+        return []
+    with read_connection("db/" + db_name) as conn:
+        return [dict(entry, status=summary_status(conn, entry)) for entry in _catalog(conn)]
+
+
+def _table_rows(conn: sqlite3.Connection, table: str) -> int:
+    source = _source(conn, table)
+    if source["rowid"]:
+        return conn.execute(source["max_rowid"]).fetchone()[0] or 0
+    return conn.execute(f"SELECT count(*) FROM {quote_ident(table)}").fetchone()[0]
+
+
+def _proposal(query: Dict[str, Any], columns: Sequence[str]) -> Optional[Dict[str, Any]]:
+    """
+    Keys and aggregates of a summary that would answer a parsed query:
+    its GROUP BY terms, the columns its WHERE filters on, and every
+    aggregate it computes
+    """
+    sql = query["sql"]
+    declared = {c.lower(): c for c in columns}
+    keys: Dict[str, str] = {}
+
+    def unqualify(tokens: Sequence[_Token]) -> List[Tuple[_Token, int]]:
+        return _unqualify(tokens, query["table"], query["alias"])
+
+    def text(pairs: Sequence[Tuple[_Token, int]]) -> str:
+        # The query's own text, without "alias." qualifiers
+        out = sql[pairs[0][0].start:pairs[0][0].end]
+        for (previous, _), (token, start) in zip(pairs, pairs[1:]):
+            out += sql[previous.end:start] + sql[token.start:token.end]
+        return out
+
+    def add_key(pairs: Sequence[Tuple[_Token, int]], name: Optional[str]) -> None:
+        tokens = [t for t, _ in pairs]
+        if len(tokens) == 1 and _is_name(tokens[0]) and tokens[0].key in declared:
+            name = declared[tokens[0].key]
+        if any(_norm(_tokenize(e)) == _norm(tokens) for e in keys.values()):
+            return
+        name = name or f"key{len(keys) + 1}"
+        while name in keys:
+            name += "_"
+        keys[name] = text(pairs)
+
+    items = {name: expr for expr, name in query["items"] if name}
+    for term in _split_commas(query["clauses"]["group"]):
+        if len(term) == 1 and term[0].kind == "number":
+            index = int(term[0].key) - 1
+            if not 0 <= index < len(query["items"]):
+                return None
+            expr, name = query["items"][index]
+            add_key(unqualify(expr), name)
+        elif len(term) == 1 and term[0].key in items and term[0].key not in declared:
+            add_key(unqualify(items[term[0].key]), term[0].key)
+        else:
+            add_key(unqualify(term), None)
+    for token, start in unqualify(query["clauses"].get("where", [])):
+        if _is_name(token) and token.key in declared:
+            add_key([(token, start)], None)
+
+    aggregates = []
+    everything = unqualify(query["tokens"])
+    for i in range(len(everything)):
+        call = _aggregate_call(everything, i)
+        if call is None:
+            continue
+        func, arg, close = call
+        if not arg or arg[0].key in ("distinct", "all"):
+            return None
+        if func == "count" and _norm(arg) == "*":
+            continue
+        aggregate = f"{func}({text(everything[i + 2:close])})"
+        if aggregate not in aggregates:
+            aggregates.append(aggregate)
+    return {"keys": keys, "aggregates": aggregates}
+
+
+def suggest_summaries(db_name: str, since: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Propose summaries for a database from its logged GROUP BY queries.
+
+    Queries an existing summary already answers drop out, and so do
+    groupings with more than SUMMARY_MAX_GROUP_RATIO groups per row. Groups
+    are estimated from the rows the logged runs returned and, for keys
+    that are columns, the product of their distinct counts in the stored
+    column profiles.
+
+    Args:
+        db_name: Database file name inside db/
+        since: Only consider queries logged after this timestamp
+
+    Returns:
+        Proposals sorted by benefit, each with table, keys, aggregates,
+        name, queries (fingerprints served), runs, benefit_ms (wall time
+        spent in those queries), rows (of the table) and est_groups
+    """
+    if not os.path.exists("db/" + db_name):
+        return []
+    groups: Dict[str, Dict[str, Any]] = {}
+    for entry in get_query_log().entries(since=since, db_name=db_name):
+        if entry["error"] or SUMMARY_TABLE_PREFIX in entry["sql"]:
+            continue
+        group = groups.setdefault(entry["fingerprint"], {"sql": entry["sql"], "runs": 0, "total_ms": 0.0, "rows": 0})
+        group["sql"] = entry["sql"]
+        group["runs"] += 1
+        group["total_ms"] += entry["wall_ms"]
+        group["rows"] = max(group["rows"], entry["rows"] or 0)
+    ranked = sorted(groups.items(), key=lambda kv: kv[1]["total_ms"], reverse=True)[:SUMMARY_MAX_FINGERPRINTS]
+
+    proposals: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+    with read_connection("db/" + db_name) as conn:
+        profiles = load_profiles(conn)
+        row_counts: Dict[str, int] = {}
+        for fingerprint, group in ranked:
+            query = _parse(group["sql"])
+            if query is None or rewrite_query(conn, group["sql"]) is not None:
+                continue
+            found = conn.execute(
+                "SELECT name FROM sqlite_master WHERE lower(name) = ? AND type IN ('table', 'view')", (query["table"],)
+            ).fetchone()
+            if found is None:
+                continue
+            table = found[0]
+            try:
+                if table not in row_counts:
+                    row_counts[table] = _table_rows(conn, table)
+                columns = _source(conn, table)["columns"]
+            except (ValueError, sqlite3.Error):
+                continue
+            rows = row_counts[table]
+            wanted = _proposal(query, columns)
+            if rows < SUMMARY_MIN_ROWS or wanted is None or not wanted["keys"]:
+                continue
+            distinct = 1
+            for name, expr in wanted["keys"].items():
+                tokens = _tokenize(expr)
+                if len(tokens) == 1 and _is_name(tokens[0]):
+                    # Column keys are named after the column
+                    distinct *= (profiles.get(table, {}).get(name) or {}).get("distinct") or 1
+            est_groups = min(max(group["rows"], distinct), rows)
+            if est_groups > rows * SUMMARY_MAX_GROUP_RATIO:
+                continue
+            try:
+                definition = make_definition(wanted["keys"], wanted["aggregates"])
+                _substitute(query, definition, columns, "_check")
+            except (ValueError, _NoMatch):
+                continue
+            key = (table, tuple(sorted(_norm(_tokenize(e)) for e in wanted["keys"].values())))
+            proposal = proposals.setdefault(key, {
+                "table": table, "keys": wanted["keys"], "aggregates": [], "queries": [], "runs": 0,
+                "benefit_ms": 0.0, "rows": rows, "est_groups": 0,
+            })
+            for aggregate in wanted["aggregates"]:
+                if aggregate not in proposal["aggregates"]:
+                    proposal["aggregates"].append(aggregate)
+            proposal["queries"].append(fingerprint)
+            proposal["runs"] += group["runs"]
+            proposal["benefit_ms"] += group["total_ms"]
+            proposal["est_groups"] = max(proposal["est_groups"], est_groups)
+
+    result = sorted(proposals.values(), key=lambda p: p["benefit_ms"], reverse=True)
+    for proposal in result:
+        proposal["name"] = re.sub(r"\W+", "_", f"{proposal['table']}_by_{'_'.join(proposal['keys'])}").strip("_").lower()
+    return result
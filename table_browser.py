@@ -0,0 +1,312 @@
+"""
+Server-side paging for the Browse page.
+
+Pages are read with keyset pagination: the page token holds the sort value
+and key (rowid, or the primary key of WITHOUT ROWID tables) of the last row
+shown, and the next page starts with a WHERE on them instead of an OFFSET,
+so page 50,000 costs the same as page 1. Sorting on an indexed column keeps
+that property; sorting on other columns makes SQLite sort the filtered rows
+again for every page. Dictionary-encoded tables are paged on the rowid of
+their data table. Other views have no key and fall back to OFFSET.
+
+Column filters are pushed into SQL with bound parameters, and only the
+operators in FILTER_OPERATORS are accepted.
+"""
+import base64
+import hashlib
+import json
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from columnar import table_kinds
+from importer import data_table_name, load_plan, lookup_table_name, quote_ident
+
+BROWSE_PAGE_ROWS = 50
+# Tables whose rowid span is below this are counted exactly
+EXACT_COUNT_ROWS = 200_000
+# Rowid windows read to estimate the row count of larger tables
+COUNT_SAMPLE_WINDOWS = 16
+COUNT_SAMPLE_SPAN = 2_048
+
+# Operator -> SQL template for the column expression "{c}"
+FILTER_OPERATORS = {
+    "=": "{c} = ?",
+    "!=": "{c} != ?",
+    "<": "{c} < ?",
+    "<=": "{c} <= ?",
+    ">": "{c} > ?",
+    ">=": "{c} >= ?",
+    "contains": "{c} LIKE ? ESCAPE '\\'",
+    "starts with": "{c} LIKE ? ESCAPE '\\'",
+    "is null": "{c} IS NULL",
+    "is not null": "{c} IS NOT NULL",
+}
+_NO_VALUE = {"is null", "is not null"}
+
+
+def _has_rowid(conn: sqlite3.Connection, table: str) -> bool:
+    try:
+        conn.execute(f"SELECT rowid FROM {quote_ident(table)} LIMIT 0")
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def browse_source(conn: sqlite3.Connection, table: str) -> Dict[str, Any]:
+    """
+    How to read a table page by page.
+
+    Returns:
+        Dictionary with "from" (FROM clause), "columns" (name -> SQL
+        expression), "key" (key expressions, empty for OFFSET paging),
+        "rowid" (the key is a rowid) and "count_table" (table whose
+        statistics describe the row count, or None)
+    """
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+    if kind is None:
+        raise ValueError(f"No such table: {table}")
+
+    plan = load_plan(conn, table)
+    if kind[0] == "view" and plan and data_table_name(plan) != table:
+        # Dictionary-encoded table: page on its data table, as the view does
+        columns, joins = {}, []
+        for i, column in enumerate(plan["columns"]):
+            name = quote_ident(column["name"])
+            if column["encoding"] == "dict":
+                joins.append(
+                    f"LEFT JOIN {quote_ident(lookup_table_name(table, column['name']))} AS l{i} ON l{i}.id = d.{name}"
+                )
+                columns[column["name"]] = f"l{i}.value"
+            else:
+                columns[column["name"]] = f"d.{name}"
+        data = data_table_name(plan)
+        return {
+            "from": f"{quote_ident(data)} AS d " + " ".join(joins),
+            "columns": columns, "key": ["d.rowid"], "rowid": True, "count_table": data, "plan": plan,
+        }
+
+    info = conn.execute(f"PRAGMA table_info({quote_ident(table)})").fetchall()
+    names = [r[1] for r in info]
+    columns = {name: f"d.{quote_ident(name)}" for name in names}
+    source = {"from": f"{quote_ident(table)} AS d", "columns": columns, "plan": plan}
+    if kind[0] == "view":
+        return dict(source, key=[], rowid=False, count_table=None)
+    if _has_rowid(conn, table):
+        return dict(source, key=["d.rowid"], rowid=True, count_table=table)
+    # WITHOUT ROWID tables always have a primary key
+    primary = [r[1] for r in sorted(info, key=lambda r: r[5]) if r[5]]
+    return dict(source, key=[f"d.{quote_ident(c)}" for c in primary], rowid=False, count_table=table)
+
+
+def _filter_value(source: Dict[str, Any], column: str, op: str, value: Any) -> Any:
+    if op == "contains":
+        return "%" + str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    if op == "starts with":
+        return str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    plan = source.get("plan")
+    if plan and isinstance(value, str):
+        spec = next((c for c in plan["columns"] if c["name"] == column), None)
+        # Dates stored as epoch seconds can be filtered with ISO text
+        if spec and spec["encoding"] == "epoch":
+            try:
+                return int(pd.Timestamp(value).timestamp())
+            except ValueError:
+                pass
+    return value
+
+
+def filter_clause(source: Dict[str, Any], filters: Optional[List[Dict[str, Any]]]) -> Tuple[str, List[Any]]:
+    """
+    WHERE condition (without the keyword) and parameters for column filters
+    given as {"column", "op", "value"} dictionaries
+    """
+    conditions, params = [], []
+    for f in filters or []:
+        column, op = f.get("column"), f.get("op")
+        if column not in source["columns"]:
+            raise ValueError(f"Unknown column: {column}")
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        conditions.append(FILTER_OPERATORS[op].format(c=source["columns"][column]))
+        if op not in _NO_VALUE:
+            params.append(_filter_value(source, column, op, f.get("value")))
+    return " AND ".join(conditions) or "1", params
+
+
+def _spec_hash(table: str, sort: Optional[str], descending: bool, filters: Optional[List[Dict[str, Any]]]) -> str:
+    spec = json.dumps([table, sort, descending, filters or []], sort_keys=True, default=str)
+    return hashlib.sha1(spec.encode("utf-8")).hexdigest()[:12]
+
+
+def _encode_token(spec: str, **state: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(dict(state, s=spec)).encode("utf-8")).decode("ascii")
+
+
+def _decode_token(spec: str, token: str) -> Dict[str, Any]:
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid page token")
+    if not isinstance(state, dict) or state.get("s") != spec:
+        raise ValueError("Page token belongs to a different table, sort or filter")
+    return state
+
+
+def _tuple(exprs: List[str]) -> str:
+    return exprs[0] if len(exprs) == 1 else "(" + ", ".join(exprs) + ")"
+
+
+def _segments(
+    sort_expr: Optional[str], descending: bool, key: List[str], cursor: Optional[List[Any]]
+) -> List[Tuple[str, List[Any], str]]:
+    """
+    (condition, parameters, ORDER BY) of the ranges left to read after the
+    cursor, in page order.
+
+    Row values cannot compare NULLs, so a sorted table is read as two
+    ranges: the rows whose sort value is NULL (first when ascending, as
+    SQLite orders them) and the others.
+    """
+    after = "<" if descending else ">"
+    direction = " DESC" if descending else ""
+    key_order = ", ".join(k + direction for k in key)
+    if sort_expr is None:
+        if cursor is None:
+            return [("1", [], key_order)]
+        return [(f"{_tuple(key)} {after} {_tuple(['?'] * len(key))}", list(cursor), key_order)]
+
+    nulls = (f"{sort_expr} IS NULL", [], key_order)
+    values = (f"{sort_expr} IS NOT NULL", [], f"{sort_expr}{direction}, {key_order}")
+    ordered = [values, nulls] if descending else [nulls, values]
+    if cursor is None:
+        return ordered
+    value, keys = cursor[0], cursor[1:]
+    if value is None:
+        bounded = (f"{sort_expr} IS NULL AND {_tuple(key)} {after} {_tuple(['?'] * len(key))}", keys, key_order)
+        return [bounded] + ([] if descending else [values])
+    row = [sort_expr] + key
+    bounded = (f"{_tuple(row)} {after} {_tuple(['?'] * len(row))}", [value] + keys, values[2])
+    return [bounded] + ([nulls] if descending else [])
+
+
+def read_page(
+    conn: sqlite3.Connection,
+    table: str,
+    page_size: int = BROWSE_PAGE_ROWS,
+    sort: Optional[str] = None,
+    descending: bool = False,
+    filters: Optional[List[Dict[str, Any]]] = None,
+    page_token: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    One page of a table, see get_table_page in db_tools.py
+
+    Raises:
+        ValueError: unknown table, column or operator, or a bad page token
+    """
+    source = browse_source(conn, table)
+    if sort is not None and sort not in source["columns"]:
+        raise ValueError(f"Unknown column: {sort}")
+    spec = _spec_hash(table, sort, descending, filters)
+    state = _decode_token(spec, page_token) if page_token else {}
+    where, params = filter_clause(source, filters)
+    names = list(source["columns"])
+    kinds = table_kinds(conn, table)
+    kinds = [kinds.get(name, "") for name in names]
+    select = ", ".join(f"{expr} AS {quote_ident(name)}" for name, expr in source["columns"].items())
+    sort_expr = source["columns"][sort] if sort is not None else None
+
+    if not source["key"]:
+        # No key to seek on: plain OFFSET paging
+        offset = int(state.get("o", 0))
+        order = f" ORDER BY {sort_expr}{' DESC' if descending else ''}" if sort_expr else ""
+        rows = conn.execute(
+            f"SELECT {select} FROM {source['from']} WHERE {where}{order} LIMIT ? OFFSET ?",
+            params + [page_size + 1, offset],
+        ).fetchall()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        return {
+            "columns": names, "kinds": kinds, "rows": rows, "has_more": has_more, "keyset": False,
+            "next_page_token": _encode_token(spec, o=offset + len(rows)) if has_more else None,
+        }
+
+    cursor_exprs = ([sort_expr] if sort_expr else []) + source["key"]
+    extra = ", ".join(f"{expr} AS _k{i}" for i, expr in enumerate(cursor_exprs))
+    rows: List[tuple] = []
+    for condition, bounds, order in _segments(sort_expr, descending, source["key"], state.get("k")):
+        rows += conn.execute(
+            f"SELECT {select}, {extra} FROM {source['from']} WHERE ({where}) AND {condition} "
+            f"ORDER BY {order} LIMIT ?",
+            params + bounds + [page_size + 1 - len(rows)],
+        ).fetchall()
+        if len(rows) > page_size:
+            break
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    width = len(names)
+    next_token = _encode_token(spec, k=list(rows[-1][width:])) if has_more else None
+    return {
+        "columns": names, "kinds": kinds, "rows": [row[:width] for row in rows], "has_more": has_more,
+        "keyset": True,
+        "next_page_token": next_token,
+    }
+
+
+def estimate_row_count(
+    conn: sqlite3.Connection, table: str, filters: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    Row count of a table (with filters), exact when cheap.
+
+    Large rowid tables are estimated from COUNT_SAMPLE_WINDOWS rowid
+    ranges, which follow appends. Unfiltered tables without a rowid use
+    sqlite_stat1 when ANALYZE has run; anything else is counted up to
+    EXACT_COUNT_ROWS.
+
+    Returns:
+        Dictionary with rows, exact (bool) and method ("count",
+        "sqlite_stat1", "sample" or "capped", where rows is a lower bound)
+    """
+    source = browse_source(conn, table)
+    where, params = filter_clause(source, filters)
+    # sqlite_stat1 is as old as the last ANALYZE (e.g. by create_index), so
+    # rowid tables are not taken from it
+    if not filters and source["count_table"] and not source["rowid"]:
+        try:
+            stat = conn.execute(
+                "SELECT stat FROM sqlite_stat1 WHERE tbl = ? AND stat IS NOT NULL LIMIT 1", (source["count_table"],)
+            ).fetchone()
+        except sqlite3.Error:
+            stat = None  # ANALYZE never ran
+        if stat:
+            return {"rows": int(stat[0].split()[0]), "exact": False, "method": "sqlite_stat1"}
+
+    if source["rowid"]:
+        # Separate subqueries, so each is answered from one end of the b-tree
+        low, high = conn.execute(
+            f"SELECT (SELECT min(d.rowid) FROM {source['from']}), (SELECT max(d.rowid) FROM {source['from']})"
+        ).fetchone()
+        if low is None:
+            return {"rows": 0, "exact": True, "method": "count"}
+        span = high - low + 1
+        if span > EXACT_COUNT_ROWS:
+            step = span // COUNT_SAMPLE_WINDOWS
+            read = matched = 0
+            for i in range(COUNT_SAMPLE_WINDOWS):
+                start = low + i * step
+                matched += conn.execute(
+                    f"SELECT count(*) FROM {source['from']} WHERE d.rowid BETWEEN ? AND ? AND ({where})",
+                    [start, start + COUNT_SAMPLE_SPAN - 1] + params,
+                ).fetchone()[0]
+                read += COUNT_SAMPLE_SPAN
+            return {"rows": round(span * matched / read), "exact": False, "method": "sample"}
+
+    rows = conn.execute(
+        f"SELECT count(*) FROM (SELECT 1 FROM {source['from']} WHERE {where} LIMIT ?)", params + [EXACT_COUNT_ROWS + 1]
+    ).fetchone()[0]
+    if rows > EXACT_COUNT_ROWS:
+        return {"rows": EXACT_COUNT_ROWS, "exact": False, "method": "capped"}
+    return {"rows": rows, "exact": True, "method": "count"}
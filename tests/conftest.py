@@ -0,0 +1,85 @@
+import os
+import sys
+import uuid
+from typing import Any
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def _restore_main_module():
+    # AppTest runs its script as __main__ and leaves it there; spawned
+    # worker processes (batch imports) would then re-run that script
+    main = sys.modules["__main__"]
+    yield
+    sys.modules["__main__"] = main
+
+
+@pytest.fixture
+def db_name(tmp_path, monkeypatch):
+    """
+    Name of a fresh database inside a temporary db/ folder, which is the
+    working directory's db/ during the test. Names are unique because
+    pooled connections are keyed by their relative path.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "db").mkdir()
+    return f"test_{uuid.uuid4().hex[:12]}.db"
+
+
+@pytest.fixture
+def fake_agent():
+    """
+    Factory of the assistant's agent around a scripted chat model:
+    make_agent(replies) returns (agent, model), and model.calls counts
+    the model turns. Replies are AIMessages, or a function of the messages
+    so far returning one; they are streamed word by word with their tool
+    calls in the last chunk.
+    """
+    import json
+
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    import chatbot
+
+    class FakeChatModel(GenericFakeChatModel):
+        calls: int = 0
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        respond: Any = None
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            self.calls += 1
+            if self.respond is not None:
+                return ChatResult(generations=[ChatGeneration(message=self.respond(messages))])
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            message = self._generate(messages, stop=stop, **kwargs).generations[0].message
+            words = message.content.split(" ") if message.content else []
+            for i, word in enumerate(words):
+                text = word if i == len(words) - 1 else word + " "
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=text, id=message.id))
+                if run_manager:
+                    run_manager.on_llm_new_token(text, chunk=chunk)
+                yield chunk
+            if message.tool_calls:
+                yield ChatGenerationChunk(message=AIMessageChunk(content="", id=message.id, tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                    for i, call in enumerate(message.tool_calls)
+                ]))
+
+    def make_agent(replies):
+        if callable(replies):
+            model = FakeChatModel(messages=iter(()), respond=replies)
+        else:
+            model = FakeChatModel(messages=iter(replies))
+        return chatbot.build_agent(model), model
+
+    return make_agent
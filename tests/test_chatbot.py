@@ -0,0 +1,235 @@
+import sqlite3
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import chatbot
+from question_cache import QuestionCache
+
+QUESTION = "How many orders are there?"
+SQL = "SELECT count(*) AS n FROM orders"
+
+
+@pytest.fixture
+def orders_db(db_name):
+    with sqlite3.connect("db/" + db_name) as conn:
+        conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, status TEXT)")
+        conn.executemany("INSERT INTO orders (status) VALUES (?)", [("paid",), ("paid",), ("open",)])
+    return db_name
+
+
+def _replies(sql=SQL):
+    return [
+        AIMessage(content="Let me count them.", tool_calls=[
+            {"name": "execute_sql", "args": {"sql_query": sql}, "id": "call_1"},
+        ]),
+        AIMessage(content="There are 3 orders."),
+    ]
+
+
+def _count_queries(monkeypatch):
+    calls = []
+    run = chatbot.text_to_sql
+
+    def counting(sql_query, db_path, **kwargs):
+        calls.append(sql_query)
+        return run(sql_query, db_path, **kwargs)
+
+    monkeypatch.setattr(chatbot, "text_to_sql", counting)
+    return calls
+
+
+def test_stream_events_come_in_order(orders_db, fake_agent):
+    agent, _ = fake_agent(_replies())
+    config = {"configurable": {"db_path": orders_db}}
+    events = list(chatbot.stream_agent_events(agent, [HumanMessage(content=QUESTION)], config))
+
+    kinds = [e["type"] for e in events]
+    collapsed = [k for i, k in enumerate(kinds) if i == 0 or k != kinds[i - 1]]
+    assert collapsed == ["token", "tool_call", "sql", "tool_result", "token", "final"]
+    assert "".join(e["text"] for e in events[:kinds.index("tool_call")]) == "Let me count them."
+    assert events[kinds.index("sql")]["sql"] == SQL
+    result = events[kinds.index("tool_result")]
+    assert result["name"] == "execute_sql" and result["artifact"]["results"] == [{"n": 3}]
+    assert events[-1]["text"] == "There are 3 orders."
+
+
+@pytest.mark.parametrize("streamed", [True, False], ids=["stream", "invoke"])
+def test_answer_is_cached_and_replayed(orders_db, fake_agent, tmp_path, monkeypatch, streamed):
+    cache = QuestionCache(str(tmp_path / "questions.sqlite"))
+    queries = _count_queries(monkeypatch)
+    events = []
+    agent, model = fake_agent(_replies())
+    first = chatbot.answer_question(
+        agent, [HumanMessage(content=QUESTION)], QUESTION, orders_db, cache=cache,
+        on_event=events.append if streamed else None,
+    )
+    assert first["answer"] == "There are 3 orders." and not first["cached"]
+    assert first["sql"] == SQL and first["result"]["results"] == [{"n": 3}]
+    assert model.calls == 2
+    # The agent's query ran once; caching it does not run it again
+    assert queries == [SQL]
+    assert bool(events) == streamed
+
+    # The same question is answered from the cache without the model
+    idle, idle_model = fake_agent([])
+    second = chatbot.answer_question(idle, [HumanMessage(content=QUESTION)], QUESTION, orders_db, cache=cache)
+    assert second["cached"] and second["sql"] == SQL
+    assert second["result"]["results"] == [{"n": 3}]
+    assert idle_model.calls == 0
+
+
+@pytest.mark.parametrize("streamed", [True, False], ids=["stream", "invoke"])
+def test_cancel_stops_the_agent_before_its_next_step(orders_db, fake_agent, monkeypatch, streamed):
+    cancel_event = threading.Event()
+    run = chatbot.text_to_sql
+
+    def clicked_cancel(sql_query, db_path, **kwargs):
+        # The user cancels while the query runs
+        cancel_event.set()
+        return run(sql_query, db_path, **kwargs)
+
+    monkeypatch.setattr(chatbot, "text_to_sql", clicked_cancel)
+    agent, model = fake_agent(_replies())
+    outcome = chatbot.answer_question(
+        agent, [HumanMessage(content=QUESTION)], QUESTION, orders_db, cancel_event=cancel_event,
+        on_event=(lambda event: None) if streamed else None,
+    )
+
+    assert outcome["cancelled"] and outcome["answer"] == "_Cancelled._"
+    assert outcome["sql"] == SQL
+    # The model is not asked again after the cancel
+    assert model.calls == 1
+
+
+def test_failed_query_is_not_cached(orders_db, fake_agent, tmp_path):
+    cache = QuestionCache(str(tmp_path / "questions.sqlite"))
+    agent, _ = fake_agent(_replies(sql="SELECT nope FROM orders"))
+    chatbot.answer_question(agent, [HumanMessage(content=QUESTION)], QUESTION, orders_db, cache=cache)
+    assert cache.stats()["entries"] == 0
+
+
+def test_follow_up_questions_skip_the_cache(orders_db, fake_agent, tmp_path):
+    cache = QuestionCache(str(tmp_path / "questions.sqlite"))
+    agent, _ = fake_agent(_replies())
+    history = [HumanMessage(content="hi"), AIMessage(content="Hello!"), HumanMessage(content=QUESTION)]
+    chatbot.answer_question(agent, history, QUESTION, orders_db, cache=cache)
+    assert cache.stats()["entries"] == 0
+
+
+def test_shared_agent_queries_each_sessions_database(db_name, fake_agent):
+    # One agent, as get_agent shares it, answering two sessions at once
+    names = {}
+    for count in (2, 5):
+        name = f"{count}_{db_name}"
+        with sqlite3.connect("db/" + name) as conn:
+            conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY)")
+            conn.executemany("INSERT INTO orders VALUES (?)", [(i,) for i in range(count)])
+        names[name] = count
+    both_running = threading.Barrier(2)
+
+    def respond(messages):
+        if isinstance(messages[-1], HumanMessage):
+            return _replies()[0]
+        # Both sessions have run their query before either one answers
+        both_running.wait(timeout=10)
+        return AIMessage(content="Done.")
+
+    agent, _ = fake_agent(respond)
+    results = {}
+
+    def session(name):
+        outcome = chatbot.answer_question(agent, [HumanMessage(content=QUESTION)], QUESTION, name)
+        results[name] = outcome["result"]["results"]
+
+    threads = [threading.Thread(target=session, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert results == {name: [{"n": count}] for name, count in names.items()}
+
+
+def _cancellable_script(fail_in):
+    import threading
+
+    import streamlit as st
+
+    import chatbot
+
+    st.session_state.setdefault("messages", [])
+    # What happened in each script run
+    runs = st.session_state.setdefault("runs", [])
+    run = {}
+    runs.append(run)
+    cancel_event = threading.Event()
+
+    def work(put_event):
+        put_event({"type": "token", "text": "..."})
+        if fail_in == "work":
+            raise ValueError("broken query")
+        return "answer"
+
+    def render(event):
+        if fail_in == "render":
+            raise ValueError("broken render")
+        if fail_in == "cancel" and len(runs) == 1:
+            st.rerun()  # what clicking Cancel makes Streamlit do in this thread
+
+    try:
+        run["outcome"] = chatbot._run_cancellable(work, render, cancel_event)
+    except ValueError as e:
+        run["outcome"] = f"error: {e}"
+    finally:
+        run["cancelled"] = cancel_event.is_set()
+
+
+@pytest.mark.parametrize("fail_in, outcome, cancelled, messages", [
+    (None, "answer", False, []),
+    ("work", "error: broken query", False, []),
+    ("render", "error: broken render", True, []),
+    ("cancel", None, True, [{"role": "assistant", "content": "_Cancelled._"}]),
+])
+def test_only_a_cancellation_is_reported_as_cancelled(fail_in, outcome, cancelled, messages):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_function(_cancellable_script, args=(fail_in,), default_timeout=30).run()
+    assert not app.exception
+    run = app.session_state["runs"][0]
+    assert run.get("outcome") == outcome
+    assert run["cancelled"] == cancelled
+    assert app.session_state["messages"] == messages
+
+
+def _chart_script(db_name, sql):
+    import streamlit as st
+
+    import chatbot
+
+    st.session_state.setdefault("last_query", {"db": db_name, "sql": sql})
+    chatbot.chart_last_result(db_name)
+
+
+def test_chart_query_runs_only_once_asked_for(orders_db, monkeypatch):
+    from streamlit.testing.v1 import AppTest
+
+    calls = []
+    fetch = chatbot.query_frame
+
+    def counting(query, db_path, **kwargs):
+        calls.append(query)
+        return fetch(query, db_path, **kwargs)
+
+    monkeypatch.setattr(chatbot, "query_frame", counting)
+    sql = "SELECT status, count(*) AS n FROM orders GROUP BY status"
+    app = AppTest.from_function(_chart_script, args=(orders_db, sql), default_timeout=30).run()
+    assert not app.exception
+    assert calls == []
+
+    app.button(key="load_chart").click().run()
+    assert not app.exception
+    assert calls == [sql]
+    # Later reruns chart the rows already read
+    app.run()
+    assert calls == [sql]
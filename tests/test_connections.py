@@ -0,0 +1,139 @@
+import io
+import random
+import sqlite3
+import threading
+import time
+
+from connections import (
+    BUSY_TIMEOUT, POOL_MAX_IDLE_PER_DB, is_busy_error, resolve_db_path, write_connection, write_queue_stats,
+)
+from db_tools import create_table, execute_sql_query_page, get_table_page, text_to_sql
+
+SESSIONS = 8
+OPERATIONS = 40
+ROWS = 500
+
+
+def _csv(rows, seed=0):
+    rnd = random.Random(seed)
+    lines = ["id,region,amount"]
+    for i in range(rows):
+        lines.append(f"{i},{rnd.choice(['North', 'South', 'East'])},{rnd.randrange(1000) / 4}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def test_concurrent_sessions_never_see_a_locked_database(db_name):
+    """
+    Sessions (threads, as Streamlit runs them) read, browse, write and
+    import against one database while another connection outside the write
+    queue, standing in for a second process, keeps taking the write lock.
+    No "database is locked" may reach a caller.
+    """
+    path = "db/" + db_name
+    create_table(db_name, io.BytesIO(_csv(ROWS)), "sales")
+    execute_sql_query_page("CREATE TABLE notes (session INTEGER, body TEXT)", db_name)
+
+    errors = []
+    counts = {"read": 0, "browse": 0, "write": 0, "import": 0}
+    lock = threading.Lock()
+    start = threading.Barrier(SESSIONS + 1)
+    stop = threading.Event()
+
+    def session(number):
+        rnd = random.Random(number)
+        start.wait()
+        for i in range(OPERATIONS):
+            pick = rnd.random()
+            try:
+                if pick < 0.05:
+                    kind = "import"
+                    create_table(db_name, io.BytesIO(_csv(ROWS, seed=number)), f"upload_{number}")
+                    error = None
+                elif pick < 0.35:
+                    kind = "write"
+                    error = execute_sql_query_page(
+                        f"INSERT INTO notes VALUES ({number}, 'note {i}')", db_name
+                    ).get("error")
+                elif pick < 0.55:
+                    kind = "browse"
+                    error = get_table_page(
+                        path, "sales", sort=rnd.choice([None, "amount"]),
+                        filters=[{"column": "region", "op": "=", "value": "North"}], prefetch=False,
+                    ).get("error")
+                else:
+                    kind = "read"
+                    error = execute_sql_query_page(
+                        "SELECT region, COUNT(*), SUM(amount) FROM sales GROUP BY region", db_name
+                    ).get("error")
+            except Exception as e:
+                kind, error = "raised", f"{type(e).__name__}: {e}"
+            with lock:
+                counts[kind] = counts.get(kind, 0) + 1
+                if error:
+                    errors.append(error)
+
+    def other_process():
+        # A writer that does not go through the write queue and holds the
+        # lock for a moment each time
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        start.wait()
+        try:
+            while not stop.is_set():
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("INSERT INTO notes VALUES (-1, 'outside')")
+                time.sleep(0.02)
+                conn.commit()
+                time.sleep(0.01)
+        finally:
+            conn.close()
+
+    outside = threading.Thread(target=other_process)
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(SESSIONS)]
+    outside.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    outside.join()
+
+    locked = [e for e in errors if is_busy_error(sqlite3.OperationalError(e))]
+    assert locked == []
+    assert errors == []
+    assert all(counts[kind] > 0 for kind in ("read", "browse", "write", "import"))
+    assert sum(counts.values()) == SESSIONS * OPERATIONS
+
+    with sqlite3.connect(path) as conn:
+        notes = conn.execute("SELECT count(*) FROM notes WHERE session >= 0").fetchone()[0]
+    assert notes == counts["write"]
+    queue = write_queue_stats()[resolve_db_path(path)]
+    assert queue["timeouts"] == 0
+    assert queue["queued"] == 0
+
+
+def test_statements_that_change_the_connection_are_refused(db_name, tmp_path):
+    path = "db/" + db_name
+    create_table(db_name, io.BytesIO(_csv(10)), "sales")
+    execute_sql_query_page("CREATE TABLE notes (session INTEGER, body TEXT)", db_name)
+
+    for statement in (
+        "PRAGMA query_only = 1",
+        f"ATTACH '{tmp_path / 'db' / 'other.db'}' AS other",
+        "CREATE TEMP TABLE scratch (x)",
+        "CREATE TEMP VIEW north AS SELECT * FROM sales",
+    ):
+        result = text_to_sql(statement, db_name)
+        assert "not allowed" in result["results"][0]["error"], statement
+    assert not (tmp_path / "db" / "other.db").exists()
+
+    # Every pooled writer still writes, and sees only the main database
+    for i in range(POOL_MAX_IDLE_PER_DB + 1):
+        assert "error" not in execute_sql_query_page(f"INSERT INTO notes VALUES ({i}, 'x')", db_name)
+    create_table(db_name, io.BytesIO(_csv(5)), "sales", mode="append")
+    with write_connection(path) as conn:
+        assert [r[1] for r in conn.execute("PRAGMA database_list")] == ["main"]
+        assert conn.execute("PRAGMA query_only").fetchone() == (0,)
+
+    # Reading pragmas still run
+    assert text_to_sql("PRAGMA table_info(sales)", db_name)["results"][0]["name"] == "id"
+    assert text_to_sql("PRAGMA user_version", db_name)["results"] == [{"user_version": 0}]
@@ -0,0 +1,55 @@
+import sqlite3
+
+import pytest
+
+import db_tools
+from db_tools import execute_sql_query, query_frame, text_to_sql
+
+
+@pytest.fixture
+def numbers_db(db_name):
+    with sqlite3.connect("db/" + db_name) as conn:
+        conn.execute("CREATE TABLE numbers (n INTEGER)")
+        conn.executemany("INSERT INTO numbers VALUES (?)", [(i,) for i in range(1000)])
+    return db_name
+
+
+def test_query_frame_runs_under_the_query_budget(numbers_db):
+    expensive = "SELECT count(*) AS n FROM numbers AS a, numbers AS b"
+
+    result = query_frame(expensive, numbers_db, max_steps=100_000)
+
+    assert result["budget_exceeded"]["budget"] == "steps"
+    assert query_frame("SELECT count(*) AS n FROM numbers", numbers_db)["frame"]["n"].tolist() == [1000]
+
+
+def _count(db_name):
+    return text_to_sql("SELECT count(*) AS n FROM numbers", db_name)["results"][0]["n"]
+
+
+def test_cached_results_follow_writes(numbers_db):
+    stats = db_tools.result_cache.stats
+
+    assert _count(numbers_db) == 1000
+    hits = stats()["hits"]
+    assert _count(numbers_db) == 1000
+    assert stats()["hits"] == hits + 1
+
+    # A write through the tools drops the database's entries
+    invalidations = stats()["invalidations"]
+    assert execute_sql_query("INSERT INTO numbers VALUES (-1)", numbers_db) == [{"affected_rows": 1}]
+    assert stats()["invalidations"] > invalidations
+    assert _count(numbers_db) == 1001
+
+    # A commit from outside the app changes the file's data stamp
+    outside = sqlite3.connect("db/" + numbers_db)
+    with outside:
+        outside.execute("DELETE FROM numbers WHERE n BETWEEN 0 AND 9")
+    assert _count(numbers_db) == 991
+    # An update in place leaves the row count as it was
+    biggest = "SELECT max(n) AS n FROM numbers"
+    assert text_to_sql(biggest, numbers_db)["results"] == [{"n": 999}]
+    with outside:
+        outside.execute("UPDATE numbers SET n = 5000 WHERE n = -1")
+    outside.close()
+    assert text_to_sql(biggest, numbers_db)["results"] == [{"n": 5000}]
@@ -0,0 +1,125 @@
+import csv
+import io
+import sqlite3
+
+import pytest
+
+from export import write_cursor
+
+ROWS = [
+    (1, 0.5, "North", b"\x00\x01"),
+    (2, None, 'say "hi", then\nleave', None),
+    (None, 3.0, None, b"\xff"),
+    (4, -1.25, "South", b""),
+    (5, 1e100, "", b"\x10"),
+]
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INTEGER, amount REAL, name TEXT, data BLOB)")
+    conn.executemany("INSERT INTO t VALUES (?, ?, ?, ?)", ROWS)
+    yield conn
+    conn.close()
+
+
+def _select(conn, query="SELECT * FROM t ORDER BY rowid"):
+    return conn.execute(query)
+
+
+def _read_arrow(data, fmt):
+    pa = pytest.importorskip("pyarrow")
+    if fmt == "parquet":
+        import pyarrow.parquet
+        return pa.parquet.read_table(io.BytesIO(data))
+    import pyarrow.ipc
+    return pa.ipc.open_file(pa.BufferReader(data)).read_all()
+
+
+def test_csv_round_trip(conn):
+    out = io.BytesIO()
+    progress = []
+
+    result = write_cursor(_select(conn), out, "csv", batch_rows=2, progress_callback=progress.append)
+
+    assert (result["rows"], result["bytes"]) == (5, len(out.getvalue()))
+    assert result["columns"] == ["id", "amount", "name", "data"]
+    assert progress == [2, 4, 5]
+    assert list(csv.reader(io.StringIO(out.getvalue().decode()))) == [
+        ["id", "amount", "name", "data"],
+        ["1", "0.5", "North", "0001"],
+        ["2", "", 'say "hi", then\nleave', ""],
+        ["", "3.0", "", "ff"],
+        ["4", "-1.25", "South", ""],
+        ["5", "1e+100", "", "10"],
+    ]
+    # The caller's file stays open
+    assert not out.closed
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_columnar_round_trip(conn, fmt, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    path = str(tmp_path / f"t.{fmt}")
+
+    result = write_cursor(_select(conn), path, fmt, batch_rows=2)
+
+    table = _read_arrow(open(path, "rb").read(), fmt)
+    assert result["rows"] == table.num_rows == len(ROWS)
+    assert table.schema.types == [pa.int64(), pa.float64(), pa.string(), pa.binary()]
+    assert [tuple(row.values()) for row in table.to_pylist()] == ROWS
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_columnar_types_come_from_the_first_batch(conn, fmt):
+    pa = pytest.importorskip("pyarrow")
+    conn.execute("CREATE TABLE loose (n, label)")
+    # Integers mixed with reals are float64; a column that is all NULL in
+    # the first batch is text, and later values are written as text
+    conn.executemany("INSERT INTO loose VALUES (?, ?)", [(1, None), (2.5, None), (3, 7), (4, "x")])
+    out = io.BytesIO()
+
+    write_cursor(_select(conn, "SELECT * FROM loose ORDER BY rowid"), out, fmt, batch_rows=2)
+
+    table = _read_arrow(out.getvalue(), fmt)
+    assert table.schema.types == [pa.float64(), pa.string()]
+    assert table.to_pydict() == {"n": [1.0, 2.5, 3.0, 4.0], "label": [None, None, "7", "x"]}
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_columnar_export_stops_at_a_column_that_changes_type(conn, fmt):
+    pytest.importorskip("pyarrow")
+    conn.execute("CREATE TABLE loose (n)")
+    conn.executemany("INSERT INTO loose VALUES (?)", [(1,), (2,), ("three",)])
+
+    with pytest.raises(ValueError, match="Column 'n' holds values of more than one type"):
+        write_cursor(_select(conn, "SELECT n FROM loose ORDER BY rowid"), io.BytesIO(), fmt, batch_rows=2)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "arrow"])
+def test_empty_result_keeps_its_columns(conn, fmt):
+    if fmt != "csv":
+        pytest.importorskip("pyarrow")
+    out = io.BytesIO()
+    progress = []
+
+    result = write_cursor(
+        _select(conn, "SELECT id, name FROM t WHERE id > 100"), out, fmt, progress_callback=progress.append
+    )
+
+    assert result["rows"] == 0
+    assert progress == []
+    if fmt == "csv":
+        assert out.getvalue() == b"id,name\r\n"
+    else:
+        table = _read_arrow(out.getvalue(), fmt)
+        assert table.num_rows == 0
+        assert table.column_names == ["id", "name"]
+
+
+def test_invalid_exports_are_refused(conn):
+    with pytest.raises(ValueError, match="Unknown export format"):
+        write_cursor(_select(conn), io.BytesIO(), "xlsx")
+    with pytest.raises(ValueError, match="no rows to export"):
+        write_cursor(conn.execute("UPDATE t SET id = id"), io.BytesIO())
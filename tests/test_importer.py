@@ -0,0 +1,264 @@
+import glob
+import io
+import os
+import sqlite3
+import tempfile
+
+import pandas as pd
+import pytest
+
+from importer import (
+    INFER_SAMPLE_ROWS, STRICT_TABLES, WidenColumn, _batch_source, import_csv, import_many, infer_column, infer_plan,
+    load_plan, read_dtypes, transform_chunk,
+)
+
+
+def _csv(rows, start=0, bad_row=None):
+    lines = ["id,region,amount"]
+    for i in range(start, start + rows):
+        lines.append(f"{i},{['North', 'South'][i % 2]},{i * 1.5}")
+        if bad_row is not None and i - start == bad_row:
+            lines.append(f"{i},North,1,extra")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _spooled_files():
+    return set(glob.glob(os.path.join(tempfile.gettempdir(), "dbassist_import_*")))
+
+
+@pytest.fixture
+def db_path(db_name):
+    return "db/" + db_name
+
+
+@pytest.mark.parametrize("dictionary", [False, True], ids=["plain", "dictionary"])
+def test_failed_batch_file_keeps_the_existing_table(db_path, dictionary):
+    import_csv(db_path, io.BytesIO(_csv(5)), "sales", dictionary=dictionary)
+    spooled = _spooled_files()
+
+    # The broken row comes after the rows read to infer the types, so the
+    # file fails while it is being written
+    broken = _csv(INFER_SAMPLE_ROWS + 500, start=100, bad_row=INFER_SAMPLE_ROWS + 100)
+    results = import_many(
+        db_path, [(io.BytesIO(broken), "sales"), (io.BytesIO(_csv(300)), "orders")],
+        workers=2, chunksize=1_000, dictionary=dictionary,
+    )
+
+    assert [r["status"] for r in results] == ["failed", "done"]
+    assert results[0]["rows"] > 0
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT count(*), min(id) FROM sales").fetchone() == (5, 0)
+        assert conn.execute("SELECT count(*) FROM orders").fetchone() == (300,)
+        assert load_plan(conn, "orders") is not None
+        assert conn.execute("SELECT count(*) FROM sqlite_master WHERE name LIKE '%staging%'").fetchone() == (0,)
+    # The uploads' temporary files are gone
+    assert _spooled_files() == spooled
+
+
+@pytest.mark.parametrize("dictionary", [False, True], ids=["plain", "dictionary"])
+def test_batch_replaces_an_existing_table_once_complete(db_path, dictionary):
+    import_csv(db_path, io.BytesIO(_csv(5)), "sales")
+
+    results = import_many(db_path, [(io.BytesIO(_csv(250, start=10)), "sales")], chunksize=100, dictionary=dictionary)
+
+    assert results[0]["status"] == "done"
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT count(*), min(id) FROM sales").fetchone() == (250, 10)
+        assert conn.execute("SELECT region FROM sales WHERE id = 11").fetchone() == ("South",)
+        plan = load_plan(conn, "sales")
+        assert [c["encoding"] == "dict" for c in plan["columns"]] == [False, dictionary, False]
+        assert conn.execute("SELECT count(*) FROM sqlite_master WHERE name LIKE '%staging%'").fetchone() == (0,)
+
+
+def test_uploads_are_spooled_to_files():
+    upload = io.BytesIO(_csv(10))
+    upload.read(5)  # a buffer that was read before
+    path, temp = _batch_source(upload)
+    try:
+        assert isinstance(path, str) and path == temp
+        with open(path, "rb") as f:
+            assert f.read() == _csv(10)
+    finally:
+        os.unlink(temp)
+    assert _batch_source("data.csv") == ("data.csv", None)
+
+
+def _rows(*rows, header="id,name,amt"):
+    return io.BytesIO(("\n".join([header] + [",".join(map(str, r)) for r in rows]) + "\n").encode())
+
+
+@pytest.mark.parametrize("dictionary", [False, True], ids=["plain", "dictionary"])
+def test_append_adds_rows_with_the_table_types(db_path, dictionary):
+    import_csv(db_path, _rows((1, "a", 1.5), (2, "b", 2.5)), "items", dictionary=dictionary)
+
+    stats = import_csv(db_path, _rows((3, "a", 4)), "items", mode="append")
+
+    assert stats["rows"] == stats["written"] == 1
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT * FROM items ORDER BY id").fetchall() == [
+            (1, "a", 1.5), (2, "b", 2.5), (3, "a", 4.0),
+        ]
+
+
+def test_append_rejects_a_value_that_does_not_fit(db_path):
+    import_csv(db_path, _rows((1, "a", 1.5)), "items")
+
+    with pytest.raises(ValueError, match="does not fit column 'id'"):
+        import_csv(db_path, _rows(("x", "b", 2)), "items", mode="append")
+    with pytest.raises(ValueError, match="do not match table"):
+        import_csv(db_path, _rows((2, "b"), header="id,name"), "items", mode="append")
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT count(*) FROM items").fetchone() == (1,)
+
+
+@pytest.mark.parametrize("dictionary", [False, True], ids=["plain", "dictionary"])
+def test_upsert_updates_rows_by_key(db_path, dictionary):
+    import_csv(db_path, _rows((1, "a", 1.5), (2, "b", 2.5)), "items", dictionary=dictionary)
+
+    stats = import_csv(db_path, _rows((2, "c", 9), (3, "a", 1)), "items", mode="upsert", key_columns=["id"])
+
+    assert stats["written"] == 2
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT * FROM items ORDER BY id").fetchall() == [
+            (1, "a", 1.5), (2, "c", 9.0), (3, "a", 1.0),
+        ]
+
+
+@pytest.mark.parametrize("dictionary", [False, True], ids=["plain", "dictionary"])
+def test_upsert_skips_unchanged_rows_without_a_hash_column(db_name, db_path, dictionary):
+    from db_tools import execute_sql_query, export_query_result
+
+    import_csv(db_path, _rows((1, "a", 1.5), (2, "b", 2.5)), "items", dictionary=dictionary)
+    upsert = dict(mode="upsert", key_columns=["id"], skip_unchanged=True)
+
+    first = import_csv(db_path, _rows((1, "a", 1.5), (2, "b", 2.5)), "items", **upsert)
+    again = import_csv(db_path, _rows((1, "a", 1.5), (2, "x", 2.5), (3, "c", 3)), "items", **upsert)
+    # Plain upserts of a hashed table keep the hashes current
+    import_csv(db_path, _rows((1, "z", 1.5)), "items", mode="upsert", key_columns=["id"])
+    back = import_csv(db_path, _rows((1, "a", 1.5)), "items", **upsert)
+
+    assert first["written"] == 2
+    assert again["written"] == 2
+    assert back["written"] == 1
+    # The hashes are not part of the table the user and the agent see
+    assert execute_sql_query("SELECT * FROM items ORDER BY id", db_name) == [
+        {"id": 1, "name": "a", "amt": 1.5}, {"id": 2, "name": "x", "amt": 2.5}, {"id": 3, "name": "c", "amt": 3.0},
+    ]
+    out = io.BytesIO()
+    export_query_result("SELECT * FROM items", db_name, out)
+    assert out.getvalue().decode().splitlines()[0] == "id,name,amt"
+
+    # Replacing the table drops its hashes
+    import_csv(db_path, _rows((1, "a", 1.5)), "items", dictionary=dictionary)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT count(*) FROM _dbassist_row_hashes").fetchone() == (0,)
+
+
+@pytest.mark.parametrize("values, kind, date_format", [
+    (["1", "-2", None, ""], "int", None),
+    (["1", "2.5", "1e3"], "float", None),
+    (["1.0", "2"], "float", None),
+    (["007", "12"], "text", None),
+    (["+6281", "6282"], "text", None),
+    (["true", "False", "YES", "no"], "bool", None),
+    (["t", "f", "Y", "n"], "bool", None),
+    (["2024-01-31", "2024-02-01"], "date", "%Y-%m-%d"),
+    (["2024-01-31 08:30:00", "2024-02-01 23:59:59"], "datetime", "%Y-%m-%d %H:%M:%S"),
+    (["31/01/2024", "01/02/2024"], "date", "%d/%m/%Y"),
+    (["01/31/2024", "02/01/2024"], "date", "%m/%d/%Y"),
+    (["2024-01-31", "soon"], "text", None),
+    ([None, ""], "text", None),
+])
+def test_infer_column_picks_the_narrowest_kind(values, kind, date_format):
+    info = infer_column(pd.Series(values, dtype=object))
+
+    assert (info["kind"], info["date_format"]) == (kind, date_format)
+
+
+def test_infer_column_dictionary_encodes_repeated_text():
+    repeated = pd.Series(["North", "South"] * 50)
+    distinct = pd.Series([f"name {i}" for i in range(100)])
+
+    assert infer_column(repeated, dictionary=True)["dictionary"]
+    assert not infer_column(repeated)["dictionary"]
+    assert not infer_column(distinct, dictionary=True)["dictionary"]
+
+
+def test_transform_chunk_converts_to_the_storage_types():
+    chunk = pd.DataFrame({
+        "id": pd.Series([1, None, 3], dtype="float64"),
+        "ok": ["t", None, "No"],
+        "day": ["2024-01-02", "2024-01-03", None],
+    })
+    plan = infer_plan(pd.DataFrame({"id": ["1", "3"], "ok": ["t", "No"], "day": ["2024-01-02", "2024-01-03"]}), "items")
+    assert [c["kind"] for c in plan["columns"]] == ["int", "bool", "date"]
+
+    columns, sizes = transform_chunk(chunk, plan)
+
+    assert columns == [[1, None, 3], [1, None, 0], ["2024-01-02", "2024-01-03", None]]
+    # Booleans live in the record header; dates keep their text
+    assert sizes[1] == (len("t") + len("No"), 0)
+    assert sizes[2] == (20, 20)
+
+    epoch_plan = infer_plan(chunk[["day"]], "items", epoch_dates=True)
+    columns, sizes = transform_chunk(chunk[["day"]], epoch_plan)
+    assert columns == [[1704153600, 1704240000, None]]
+    assert sizes[0][1] < sizes[0][0]
+
+
+@pytest.mark.parametrize("value, kind", [("2.5", "float"), ("abc", "text")])
+def test_transform_chunk_asks_for_a_wider_kind(value, kind):
+    plan = infer_plan(pd.DataFrame({"amt": ["1", "2"]}), "items")
+    chunk = pd.read_csv(io.BytesIO(f"amt\n1\n{value}\n".encode()), dtype=read_dtypes(plan))
+
+    with pytest.raises(WidenColumn) as raised:
+        transform_chunk(chunk, plan)
+
+    assert (raised.value.position, raised.value.kind, str(raised.value.value)) == (0, kind, value)
+
+
+def test_import_restarts_with_a_wider_type(db_path):
+    # The values that do not fit come after the rows read to infer the types
+    lines = ["id,amt,day"] + [f"{i},{i},2024-01-01" for i in range(INFER_SAMPLE_ROWS)]
+    lines += [f"{INFER_SAMPLE_ROWS},2.5,2024-01-02", f"{INFER_SAMPLE_ROWS + 1},3,someday"]
+
+    stats = import_csv(db_path, io.BytesIO(("\n".join(lines) + "\n").encode()), "items", chunksize=4_000)
+
+    assert stats["restarts"] == 2
+    assert [c["kind"] for c in stats["plan"]["columns"]] == ["int", "float", "text"]
+    assert stats["rows"] == INFER_SAMPLE_ROWS + 2
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT count(*) FROM items").fetchone() == (INFER_SAMPLE_ROWS + 2,)
+        tail = conn.execute("SELECT amt, day FROM items WHERE id >= ? ORDER BY id", (INFER_SAMPLE_ROWS,)).fetchall()
+        assert tail == [(2.5, "2024-01-02"), (3.0, "someday")]
+        assert load_plan(conn, "items")["columns"][1]["sqlite_type"] == "REAL"
+
+
+def test_typed_table_round_trips_through_its_view(db_path):
+    rows = [
+        f"{i},{['North', 'South'][i % 2]},{['y', 'n'][i % 3 == 0]},2024-01-{i % 28 + 1:02d},{i / 4}"
+        for i in range(200)
+    ]
+    source = io.BytesIO(("id,region,active,day,amt\n" + "\n".join(rows) + "\n").encode())
+
+    stats = import_csv(db_path, source, "items", epoch_dates=True, dictionary=True)
+
+    assert [(c["name"], c["sqlite_type"], c["encoding"]) for c in stats["plan"]["columns"]] == [
+        ("id", "INTEGER", None), ("region", "INTEGER", "dict"), ("active", "INTEGER", None),
+        ("day", "INTEGER", "epoch"), ("amt", "REAL", None),
+    ]
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute(
+            "SELECT id, region, active, date(day, 'unixepoch'), amt FROM items WHERE id IN (0, 1, 31) ORDER BY id"
+        ).fetchall() == [
+            (0, "North", 0, "2024-01-01", 0.0),
+            (1, "South", 1, "2024-01-02", 0.25),
+            (31, "South", 1, "2024-01-04", 7.75),
+        ]
+        assert conn.execute("SELECT DISTINCT typeof(region) FROM items__data").fetchall() == [("integer",)]
+        assert conn.execute("SELECT value FROM items__lookup_region ORDER BY value").fetchall() == [("North",), ("South",)]
+        if STRICT_TABLES:
+            sql, = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'items__data'").fetchone()
+            assert sql.endswith("STRICT")
+            with pytest.raises(sqlite3.IntegrityError):
+                conn.execute("INSERT INTO items__data (id, region, active, day, amt) VALUES ('x', 1, 1, 0, 0)")
@@ -0,0 +1,73 @@
+import io
+
+import pytest
+
+from db_tools import create_table, execute_sql_query_page
+from index_advisor import INDEX_MIN_ROWS, analyze_query, create_index, suggest_indexes
+
+ROWS = INDEX_MIN_ROWS * 3
+
+
+def _csv(rows):
+    lines = ["id,region,amount,day"]
+    for i in range(rows):
+        lines.append(f"{i},{['North', 'South', 'East'][i % 3]},{i * 1.5},{i % 30}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+@pytest.fixture(params=[False, True], ids=["plain", "dictionary"])
+def sales_db(request, db_name):
+    create_table(db_name, io.BytesIO(_csv(ROWS)), "sales", dictionary=request.param)
+    return db_name, "sales__data" if request.param else "sales"
+
+
+def _run(db_name, query):
+    assert "error" not in execute_sql_query_page(query, db_name)
+
+
+def _keys(proposals):
+    return {(p["table"], tuple(p["key_columns"])) for p in proposals}
+
+
+def test_view_usage_is_reported_against_its_data_table():
+    schema = {"sales__data": ["id", "region", "amount", "day"]}
+    views = {
+        "sales": {
+            "table": "sales__data", "alias": "d",
+            "columns": ["id", "region", "amount", "day"], "encoded": {"region"},
+        }
+    }
+
+    usage = analyze_query(
+        "SELECT s.amount FROM sales AS s WHERE s.region = 'North' AND s.day > 3 ORDER BY s.region", schema, views
+    )
+
+    assert usage["s"]["table"] == "sales__data"
+    assert usage["s"]["view"] == "sales"
+    assert usage["s"]["eq"] == ["region"]
+    assert usage["s"]["range"] == ["day"]
+    # Lookup ids do not sort like the values they stand for
+    assert usage["s"]["order"] == []
+
+
+def test_indexes_are_proposed_for_queries_on_the_table(sales_db):
+    db_name, data_table = sales_db
+    _run(db_name, "SELECT * FROM sales WHERE day = 3")
+    _run(db_name, "SELECT amount FROM sales AS s WHERE s.region = 'North'")
+
+    proposals = suggest_indexes(db_name)
+
+    assert _keys(proposals) == {(data_table, ("day",)), (data_table, ("region",))}
+
+
+def test_proposed_index_serves_the_query(sales_db):
+    db_name, data_table = sales_db
+    query = "SELECT amount FROM sales WHERE region = 'North' AND day = 3"
+    _run(db_name, query)
+    proposal, = suggest_indexes(db_name)
+    assert proposal["table"] == data_table
+
+    assert "error" not in create_index(db_name, proposal["table"], proposal["columns"], proposal["name"])
+    _run(db_name, query)
+
+    assert suggest_indexes(db_name) == []
@@ -0,0 +1,66 @@
+import io
+import sqlite3
+
+import pytest
+
+from importer import import_csv
+from profiles import TableProfile, load_profiles
+from schema_context import _format_stats
+
+
+def _rows(*rows):
+    return io.BytesIO(("\n".join(["id,name,amt"] + [",".join(map(str, r)) for r in rows]) + "\n").encode())
+
+
+@pytest.fixture
+def db_path(db_name):
+    return "db/" + db_name
+
+
+def _profile(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return load_profiles(conn)["items"]
+
+
+def test_append_merges_into_the_stored_profile(db_path):
+    import_csv(db_path, _rows((1, "a", 1.5), (2, "a", ""), (3, "b", 4)), "items")
+    import_csv(db_path, _rows((4, "a", 10), (5, "c", "")), "items", mode="append")
+
+    profile = _profile(db_path)
+    assert profile["id"]["rows"] == 5 and profile["id"]["distinct"] == 5
+    assert (profile["id"]["min"], profile["id"]["max"]) == (1, 5)
+    assert profile["name"]["distinct"] == 3
+    assert profile["name"]["top_values"] == [["a", 3]]
+    assert profile["amt"]["null_fraction"] == 0.4
+    assert (profile["amt"]["min"], profile["amt"]["max"]) == (1.5, 10.0)
+    assert not any(stats.get("approximate") for stats in profile.values())
+
+
+@pytest.mark.parametrize("dictionary", [False, True], ids=["plain", "dictionary"])
+def test_upsert_rebuilds_the_profile(db_path, dictionary):
+    import_csv(db_path, _rows((1, "a", 1), (2, "b", 2), (3, "c", 3), (4, "d", 4)), "items", dictionary=dictionary)
+    for _ in range(2):
+        import_csv(db_path, _rows((1, "e", 5), (2, "e", 6)), "items", mode="upsert", key_columns=["id"])
+
+    profile = _profile(db_path)
+    # The replaced rows are not counted twice
+    assert profile["id"]["rows"] == 4 and profile["id"]["distinct"] == 4
+    assert "top_values" not in profile["id"]
+    assert profile["name"]["distinct"] == 3
+    assert profile["name"]["top_values"] == [["e", 2]]
+    assert (profile["amt"]["min"], profile["amt"]["max"]) == (3.0, 6.0)
+    assert not any(stats.get("approximate") for stats in profile.values())
+    assert _format_stats("name", profile["name"]) == "name: 3 distinct, c..e, top e (50%)"
+
+
+def test_approximate_stats_show_no_shares():
+    stats = {"rows": 6, "distinct": 5, "min": "a", "max": "e", "top_values": [["e", 3]], "approximate": True}
+    assert _format_stats("name", stats) == "name: ~5 distinct, a..e, top e (approximate)"
+
+
+def test_profile_survives_a_round_trip(db_path):
+    import_csv(db_path, _rows((1, "a", 1.5), (2, "a", 2.5)), "items")
+    with sqlite3.connect(db_path) as conn:
+        loaded = TableProfile.load(conn, "items")
+    assert [c.name for c in loaded.columns] == ["id", "name", "amt"]
+    assert loaded.summary() == _profile(db_path)
@@ -0,0 +1,44 @@
+import pytest
+
+from question_cache import QuestionCache, normalize_question, question_terms
+
+FINGERPRINT = "schema-1"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return QuestionCache(str(tmp_path / "questions.sqlite"))
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("How many paid orders are there?", "How many not paid orders are there?"),
+    ("List customers by revenue ascending", "List customers by revenue descending"),
+    ("Total sales in the north region", "Total sales in the south region"),
+    ("Orders shipped to Jakarta", "Orders shipped to Bandung"),
+    ("Top 5 products by revenue", "Top 10 products by revenue"),
+    ("Orders paid by card or cash", "Orders paid by card and cash"),
+])
+def test_different_questions_do_not_match(cache, stored, asked):
+    cache.store(FINGERPRINT, stored, "SELECT 1", 3.0)
+    assert cache.lookup(FINGERPRINT, asked, fuzzy=True) is None
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("What is the total revenue by region?", "Show me total revenue per region"),
+    ("Top 5 products by revenue", "Show the top 5 products by revenue"),
+])
+def test_rewordings_match(cache, stored, asked):
+    cache.store(FINGERPRINT, stored, "SELECT 1", 3.0)
+    hit = cache.lookup(FINGERPRINT, asked, fuzzy=True)
+    assert hit is not None and hit["sql"] == "SELECT 1" and hit["match"] == "fuzzy"
+    assert cache.lookup(FINGERPRINT, asked) is None
+
+
+def test_exact_match_ignores_case_and_punctuation(cache):
+    cache.store(FINGERPRINT, "Top 5 products?", "SELECT 5", 3.0)
+    assert cache.lookup(FINGERPRINT, "top 5 PRODUCTS")["match"] == "exact"
+    assert cache.lookup("schema-2", "top 5 products") is None
+
+
+def test_filler_only_question_has_no_terms():
+    assert question_terms(normalize_question("What is the?")) == ()
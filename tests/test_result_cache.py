@@ -0,0 +1,42 @@
+from result_cache import ResultCache, estimate_size, normalize_sql
+
+
+def test_lru_evicts_the_least_recently_used_within_the_byte_budget():
+    value = "x" * 100
+    cache = ResultCache(max_bytes=estimate_size(value) * 3)
+    for name in ("a", "b", "c"):
+        cache.put(("db", name), value)
+    assert cache.get(("db", "a")) == value  # a is now the most recent
+
+    cache.put(("db", "d"), value)
+
+    assert cache.get(("db", "b")) is None
+    assert [cache.get(("db", k)) is not None for k in ("a", "c", "d")] == [True, True, True]
+    stats = cache.stats()
+    assert stats["entries"] == 3 and stats["bytes"] == estimate_size(value) * 3
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (4, 1, 1)
+
+
+def test_oversized_results_are_not_cached():
+    cache = ResultCache(max_bytes=100)
+    cache.put(("db", "big"), "x" * 200)
+    assert cache.get(("db", "big")) is None
+    assert cache.stats()["entries"] == 0 and cache.stats()["evictions"] == 0
+
+
+def test_invalidate_drops_only_one_database():
+    cache = ResultCache()
+    cache.put(("one", "q1"), [1])
+    cache.put(("one", "q2"), [2])
+    cache.put(("two", "q1"), [3])
+
+    cache.invalidate("one")
+
+    assert cache.get(("one", "q1")) is None and cache.get(("two", "q1")) == [3]
+    stats = cache.stats()
+    assert stats["invalidations"] == 2 and stats["bytes"] == estimate_size([3])
+
+
+def test_equivalent_queries_share_a_key():
+    assert normalize_sql("SELECT  *\nFROM t -- all\nWHERE name = 'A  b';") == "select * from t where name = 'A  b'"
+    assert normalize_sql('select "Col" from T') != normalize_sql('select "col" from T')
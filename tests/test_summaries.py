@@ -0,0 +1,91 @@
+import random
+
+import pandas as pd
+import pytest
+
+from connections import read_connection
+from db_tools import create_table
+from summaries import create_summary, rewrite_query
+
+REGIONS = ["North", "South", "East", "West"]
+PRODUCTS = ["pen", "ink", "pad", "clip", "tape"]
+
+
+@pytest.fixture(params=[False, True], ids=["plain", "dictionary"])
+def sales_db(request, db_name, tmp_path):
+    rnd = random.Random(0)
+    rows = 2_000
+    pd.DataFrame({
+        "id": range(rows),
+        "region": [rnd.choice(REGIONS) for _ in range(rows)],
+        "product": [rnd.choice(PRODUCTS) for _ in range(rows)],
+        "quantity": [rnd.randint(1, 20) for _ in range(rows)],
+        "price": [round(rnd.uniform(1, 100), 2) for _ in range(rows)],
+        "order_date": [f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}" for _ in range(rows)],
+    }).to_csv(tmp_path / "sales.csv", index=False)
+    stats = create_table(db_name, str(tmp_path / "sales.csv"), "sales", dictionary=request.param)
+    assert "error" not in stats, stats
+    built = create_summary(
+        db_name, "sales", {"region": "region", "month": "strftime('%Y-%m', order_date)"},
+        ["sum(quantity * price)", "avg(price)", "min(price)", "max(price)", "count(quantity)"],
+    )
+    assert "error" not in built, built
+    return db_name
+
+
+def _run(db_name, sql):
+    with read_connection("db/" + db_name) as conn:
+        return conn.execute(sql).fetchall()
+
+
+def _rewrite(db_name, sql):
+    with read_connection("db/" + db_name) as conn:
+        return rewrite_query(conn, sql)
+
+
+def _same(base, rewritten):
+    assert len(base) == len(rewritten)
+    for a, b in zip(base, rewritten):
+        # Sums over groups add in another order: equal up to rounding
+        assert [pytest.approx(v) if isinstance(v, float) else v for v in a] == list(b)
+
+
+REWRITTEN = [
+    "SELECT region, count(*) FROM sales GROUP BY region ORDER BY region",
+    "SELECT region, sum(quantity * price) AS revenue FROM sales GROUP BY region ORDER BY region",
+    "SELECT region, avg(price), min(price), max(price) FROM sales GROUP BY region ORDER BY region",
+    "SELECT region, count(quantity) FROM sales GROUP BY 1 ORDER BY 1",
+    "SELECT strftime('%Y-%m', order_date) AS month, count(*) FROM sales WHERE region = 'East' "
+    "GROUP BY month ORDER BY month",
+    "SELECT upper(region) AS r, max(region) FROM sales GROUP BY r HAVING count(*) > 10 ORDER BY r",
+]
+
+NOT_REWRITTEN = [
+    # aggregates the summary does not store
+    "SELECT region, group_concat(product) FROM sales GROUP BY region",
+    "SELECT region, group_concat(region) FROM sales GROUP BY region",
+    "SELECT region, json_group_array(region) FROM sales GROUP BY region",
+    "SELECT region, json_group_object(region, region) FROM sales GROUP BY region",
+    "SELECT region, total(price) FROM sales GROUP BY region",
+    "SELECT region, sum(quantity) FROM sales GROUP BY region",
+    "SELECT region, count(DISTINCT product) FROM sales GROUP BY region",
+    "SELECT region, count(*) FILTER (WHERE price > 50) FROM sales GROUP BY region",
+    # window functions and functions that differ between rows and groups
+    "SELECT region, count(*) OVER () FROM sales GROUP BY region",
+    "SELECT region, abs(random()) % 2 FROM sales GROUP BY region",
+    # filters and keys on columns the summary does not have
+    "SELECT region, count(*) FROM sales WHERE price > 50 GROUP BY region",
+    "SELECT product, count(*) FROM sales GROUP BY product",
+]
+
+
+@pytest.mark.parametrize("sql", REWRITTEN)
+def test_rewritten_query_returns_the_base_result(sales_db, sql):
+    rewritten = _rewrite(sales_db, sql)
+    assert rewritten is not None
+    _same(_run(sales_db, sql), _run(sales_db, rewritten["sql"]))
+
+
+@pytest.mark.parametrize("sql", NOT_REWRITTEN)
+def test_uncovered_query_is_not_rewritten(sales_db, sql):
+    assert _rewrite(sales_db, sql) is None
@@ -0,0 +1,88 @@
+import io
+import sqlite3
+
+import pytest
+
+import table_browser
+from importer import import_csv
+from table_browser import estimate_row_count, read_page
+
+ROWS = 40
+
+
+def _csv(rows, start=0):
+    lines = ["id,region,amount"]
+    for i in range(start, start + rows):
+        region = "" if i % 7 == 0 else ["North", "South", "East"][i % 3]
+        amount = "" if i % 5 == 0 else str(i % 4 * 2.5)
+        lines.append(f"{i},{region},{amount}")
+    return io.BytesIO(("\n".join(lines) + "\n").encode())
+
+
+@pytest.fixture(params=[False, True], ids=["plain", "dictionary"])
+def conn(request, db_name):
+    path = "db/" + db_name
+    import_csv(path, _csv(ROWS), "sales", dictionary=request.param)
+    with sqlite3.connect(path) as conn:
+        yield conn
+
+
+def _all_pages(conn, **kwargs):
+    rows, token, pages = [], None, 0
+    while True:
+        page = read_page(conn, "sales", page_size=3, page_token=token, **kwargs)
+        rows += page["rows"]
+        pages += 1
+        token = page["next_page_token"]
+        if token is None:
+            assert page["keyset"]
+            return rows, pages
+
+
+def _expected(rows, column, descending):
+    # SQLite puts NULLs first when ascending; ties are in rowid (= id) order
+    nulls = sorted((r for r in rows if r[column] is None), key=lambda r: r[0], reverse=descending)
+    values = sorted((r for r in rows if r[column] is not None), key=lambda r: (r[column], r[0]), reverse=descending)
+    return values + nulls if descending else nulls + values
+
+
+@pytest.mark.parametrize("sort", [None, "region", "amount"])
+@pytest.mark.parametrize("descending", [False, True], ids=["asc", "desc"])
+def test_pages_cover_every_row_in_order(conn, sort, descending):
+    everything = conn.execute("SELECT id, region, amount FROM sales").fetchall()
+
+    rows, pages = _all_pages(conn, sort=sort, descending=descending)
+
+    column = {None: 0, "region": 1, "amount": 2}[sort]
+    assert rows == _expected(everything, column, descending)
+    assert pages == -(-ROWS // 3)
+
+
+@pytest.mark.parametrize("descending", [False, True], ids=["asc", "desc"])
+def test_pages_of_a_filtered_table(conn, descending):
+    filters = [{"column": "region", "op": "=", "value": "North"}, {"column": "amount", "op": "is not null"}]
+    north = conn.execute("SELECT id, region, amount FROM sales WHERE region = 'North' AND amount IS NOT NULL").fetchall()
+
+    rows, _ = _all_pages(conn, sort="amount", descending=descending, filters=filters)
+
+    assert rows == _expected(north, 2, descending)
+
+
+def test_a_token_only_fits_its_own_sort(conn):
+    token = read_page(conn, "sales", page_size=3, sort="amount")["next_page_token"]
+    with pytest.raises(ValueError, match="different table, sort or filter"):
+        read_page(conn, "sales", page_size=3, sort="region", page_token=token)
+
+
+def test_row_count_follows_appends_after_analyze(conn, db_name, monkeypatch):
+    conn.execute("ANALYZE")
+    conn.commit()
+    import_csv("db/" + db_name, _csv(25, start=ROWS), "sales", mode="append")
+
+    assert estimate_row_count(conn, "sales") == {"rows": ROWS + 25, "exact": True, "method": "count"}
+    # Large tables are sampled by rowid, which also sees the new rows
+    monkeypatch.setattr(table_browser, "EXACT_COUNT_ROWS", 10)
+    monkeypatch.setattr(table_browser, "COUNT_SAMPLE_WINDOWS", 4)
+    monkeypatch.setattr(table_browser, "COUNT_SAMPLE_SPAN", 20)
+    estimate = estimate_row_count(conn, "sales")
+    assert estimate["method"] == "sample" and estimate["rows"] == pytest.approx(ROWS + 25, abs=5)